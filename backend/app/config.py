@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
 from functools import lru_cache
+from typing import Optional
 
 
 class Settings(BaseSettings):
@@ -12,8 +13,128 @@ class Settings(BaseSettings):
     supabase_service_role_key: str
     supabase_jwt_secret: str
     
+    # データベース（PostgREST）への非同期接続（接続プール・クエリごとのタイムアウト）
+    db_max_connections: int = 50
+    db_max_keepalive_connections: int = 20
+    db_keepalive_expiry_seconds: float = 30.0
+    db_connect_timeout_seconds: float = 5.0
+    db_query_timeout_seconds: float = 10.0
+    
+    # 日別集計テーブル（daily_totals）。migrations/001_daily_totals.sql を適用してから有効化
+    # （無効の間は統計を毎回元の記録から集計）
+    daily_totals_enabled: bool = False
+    daily_totals_backfill_days: int = 365
+    
+    # 日別サマリーのキャッシュ（今日の進捗・日別の食事/運動。書き込みで無効化）
+    day_cache_max_entries: int = 10000
+    day_cache_ttl_seconds: int = 300
+    
+    # 集計エンドポイントの締め切り（並行クエリ全体、秒）
+    summary_deadline_seconds: float = 5.0
+    
     # Gemini AI
     gemini_api_key: str
+    # モデル別の同時実行上限（Pro の画像分析が Flash Lite のアドバイスを圧迫しないように分離）
+    gemini_pro_max_concurrency: int = 4
+    gemini_flash_lite_max_concurrency: int = 16
+    
+    # 画像分析キャッシュ（image_cache_dir を設定するとディスクにも保存し再起動後も有効）
+    image_cache_max_entries: int = 512
+    image_cache_ttl_seconds: int = 7 * 24 * 3600
+    image_cache_dir: Optional[str] = None
+    
+    # テキスト分析のメモ化（正規化した食事テキストがキー）
+    text_cache_max_entries: int = 2048
+    text_cache_ttl_seconds: int = 24 * 3600
+    
+    # 画像前処理（長辺の最大ピクセル数・JPEG品質・ワーカースレッド数）
+    image_max_edge: int = 1024
+    image_jpeg_quality: int = 85
+    image_preprocess_workers: int = 2
+    
+    # 画像アップロードの上限サイズ（バイト）
+    max_upload_bytes: int = 10 * 1024 * 1024
+    
+    # まとめて食事分析（1リクエストの最大件数・同時実行数）
+    batch_analysis_max_items: int = 10
+    batch_analysis_concurrency: int = 3
+    
+    # ローカル食品成分DB（あいまい一致の採用しきい値: Dice係数、1品目の量の上限: 1人前の何倍まで）
+    food_db_enabled: bool = True
+    food_db_fuzzy_threshold: float = 0.8
+    food_db_max_portions: float = 5.0
+    
+    # ホームアドバイスのキャッシュ（latency_first: 未キャッシュ時はフォールバックで即答）
+    advice_cache_enabled: bool = True
+    advice_cache_max_entries: int = 1024
+    advice_cache_ttl_seconds: int = 1800
+    advice_latency_first: bool = False
+    
+    # ヘッジリクエスト（Proの応答が予算秒数を超えたら2本目を並走、model: "pro" or "flash_lite"）
+    hedge_enabled: bool = True
+    hedge_analyze_image_budget_seconds: float = 15.0
+    hedge_analyze_image_model: str = "pro"
+    hedge_chat_budget_seconds: float = 10.0
+    hedge_chat_model: str = "flash_lite"
+    
+    # サーキットブレーカー・リトライ（モデル別ブレーカー、全体のリトライ予算）
+    circuit_failure_threshold: int = 5
+    circuit_recovery_seconds: float = 30.0
+    circuit_half_open_max_calls: int = 1
+    gemini_max_retries: int = 2
+    retry_backoff_base_seconds: float = 0.5
+    retry_backoff_max_seconds: float = 8.0
+    retry_budget_ratio: float = 0.1
+    retry_budget_min_tokens: float = 10.0
+    
+    # チャット文脈（直近ターンのトークン予算と、会話ごとの要約キャッシュ）
+    chat_context_token_budget: int = 1200
+    chat_recent_turns_max: int = 6
+    chat_message_max_chars: int = 500
+    chat_history_max_items: int = 40
+    chat_summary_max_chars: int = 300
+    conversation_cache_max_entries: int = 1000
+    conversation_cache_ttl_seconds: int = 24 * 3600
+    
+    # LLMプロバイダー（gemini / fake）。fakeはネットワークを使わない負荷試験用
+    llm_provider: str = "gemini"
+    llm_pro_model: str = "gemini-2.5-pro"
+    llm_flash_lite_model: str = "gemini-flash-lite-latest"
+    fake_llm_pro_latency_ms: float = 2500.0
+    fake_llm_flash_lite_latency_ms: float = 600.0
+    fake_llm_latency_distribution: str = "lognormal"  # fixed / uniform / lognormal
+    fake_llm_latency_sigma: float = 0.5
+    fake_llm_error_rate: float = 0.0
+    fake_llm_seed: int = 0
+    fake_llm_responses_path: Optional[str] = None
+    
+    # 食事分析ジョブ（非同期実行、ストアは memory / sqlite）
+    meal_job_store: str = "memory"
+    meal_job_sqlite_path: str = "meal_jobs.sqlite3"
+    meal_job_workers: int = 4
+    meal_job_max_queue: int = 200
+    meal_job_max_attempts: int = 3
+    meal_job_result_ttl_seconds: int = 3600
+    meal_job_wait_max_seconds: float = 60.0
+    
+    # 食事コメントキャッシュ（料理名×カロリー帯ごとに複数のコメントを順番に返す）
+    meal_comment_cache_enabled: bool = True
+    meal_comment_cache_max_entries: int = 4096
+    meal_comment_cache_ttl_seconds: int = 7 * 24 * 3600
+    meal_comment_variants: int = 3
+    meal_comment_calorie_band_kcal: int = 200
+    meal_comment_max_band: int = 6
+    meal_comment_prewarm_on_startup: bool = False
+    meal_comment_prewarm_top_n: int = 100
+    meal_comment_prewarm_max_top_n: int = 500  # 事前生成APIで指定できる上限
+    meal_comment_prewarm_sample_size: int = 5000
+    meal_comment_prewarm_concurrency: int = 4
+    
+    # 似た食事写真の検索（ユーザーごとのdHash索引、距離はハミング距離。/analyze-meal/similar の提案のみ）
+    near_duplicate_enabled: bool = True
+    near_duplicate_max_distance: int = 6
+    near_duplicate_max_per_user: int = 200
+    near_duplicate_max_users: int = 5000
     
     # App - 環境変数 ENVIRONMENT から取得
     app_env: str = Field(default="development", validation_alias="ENVIRONMENT")
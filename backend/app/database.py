@@ -1,5 +1,10 @@
 from supabase import create_client, Client
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
 from app.config import get_settings
+from typing import Optional
+import asyncio
+import httpx
 
 settings = get_settings()
 
@@ -24,3 +29,86 @@ def get_supabase() -> Client:
 def get_supabase_admin() -> Client:
     """管理者用Supabaseクライアントを取得"""
     return supabase_admin
+
+
+# MARK: - 非同期データアクセス（PostgREST）
+
+class DatabaseTimeoutError(Exception):
+    """クエリがタイムアウトした"""
+    pass
+
+
+class AsyncDatabase:
+    """
+    PostgRESTの非同期クライアント（管理者キー、RLSバイパス）
+    keep-aliveの接続プールを持つHTTPクライアントを共有し、イベントループを止めずにクエリを実行する
+    （HTTPクライアントはイベントループに紐づくので、ループごとに作り直す）
+    
+    使い方:
+        db = get_db()
+        response = await db.execute(db.table("meal_logs").select("*").eq("user_id", user_id))
+    """
+
+    def __init__(self, url: str, key: str):
+        self.rest_url = f"{url.rstrip('/')}/rest/v1"
+        self.key = key
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[AsyncPostgrestClient] = None
+
+    def client(self) -> AsyncPostgrestClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    settings.db_query_timeout_seconds,
+                    connect=settings.db_connect_timeout_seconds
+                ),
+                limits=httpx.Limits(
+                    max_connections=settings.db_max_connections,
+                    max_keepalive_connections=settings.db_max_keepalive_connections,
+                    keepalive_expiry=settings.db_keepalive_expiry_seconds
+                ),
+                follow_redirects=True
+            )
+            self._client = AsyncPostgrestClient(
+                self.rest_url,
+                headers={
+                    **DEFAULT_POSTGREST_CLIENT_HEADERS,
+                    "apikey": self.key,
+                    "Authorization": f"Bearer {self.key}"
+                },
+                http_client=http_client
+            )
+            self._loop = loop
+        return self._client
+
+    def table(self, name: str):
+        """クエリビルダー（実行は execute で）"""
+        return self.client().table(name)
+
+    def rpc(self, name: str, params: dict):
+        """ストアドファンクションの呼び出し（実行は execute で）"""
+        return self.client().rpc(name, params)
+
+    async def execute(self, query, timeout: Optional[float] = None):
+        """クエリを実行（timeout 秒で打ち切り、既定は db_query_timeout_seconds）"""
+        timeout = timeout or settings.db_query_timeout_seconds
+        try:
+            return await asyncio.wait_for(query.execute(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise DatabaseTimeoutError(f"Database query timed out after {timeout}s")
+
+    async def aclose(self):
+        """接続プールを閉じる（シャットダウン時）"""
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+
+db = AsyncDatabase(settings.supabase_url, settings.supabase_service_role_key)
+
+
+def get_db() -> AsyncDatabase:
+    """非同期データアクセス（管理者キー）を取得"""
+    return db
@@ -1,10 +1,14 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.routers import auth, users, meals, exercises, weights, ai, stats, meal_analysis, chat_router
 from app.routers.feature_requests_router import router as feature_requests_router
 from app.config import get_settings
 from app.middleware.rate_limit import RateLimitMiddleware
+from app.services.llm_metrics import llm_metrics
+from app.services.gemini_service import _spawn, gemini_service
+from app.services.meal_jobs import meal_job_queue
+from app.database import get_db
 import logging
 
 settings = get_settings()
@@ -69,6 +73,25 @@ app.include_router(feature_requests_router, prefix="/api")
 app.include_router(chat_router.router)
 
 
+@app.on_event("startup")
+async def prewarm_caches():
+    """起動時のキャッシュ事前生成（設定で有効な場合のみ、起動は待たせない）"""
+    if settings.meal_comment_prewarm_on_startup:
+        _spawn(gemini_service.prewarm_meal_comments())
+
+
+@app.on_event("startup")
+async def start_meal_jobs():
+    """食事分析ジョブのワーカーを起動し、再起動前に終わらなかったジョブを引き継ぐ"""
+    await meal_job_queue.start()
+
+
+@app.on_event("shutdown")
+async def close_database():
+    """データベースの接続プールを閉じる"""
+    await get_db().aclose()
+
+
 @app.get("/")
 async def root():
     """ヘルスチェック"""
@@ -86,6 +109,12 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """LLM呼び出しのメトリクス（Prometheusテキスト形式）"""
+    return PlainTextResponse(llm_metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # グローバル例外ハンドラー（本番では詳細エラーを隠す）
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -70,3 +70,31 @@ def require_auth(user: dict = Depends(get_current_user)) -> dict:
     認証必須のエンドポイント用依存関係
     """
     return user
+
+
+async def require_service_role(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> dict:
+    """
+    内部用エンドポイントの依存関係（service_role のトークンのみ許可）
+    ユーザーのトークンでは呼べない（cronや管理スクリプトからサービスロールキーで呼ぶ）
+    """
+    try:
+        payload = jwt.decode(
+            credentials.credentials,
+            settings.supabase_jwt_secret,
+            algorithms=["HS256"],
+            options={"verify_aud": False}
+        )
+    except JWTError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Invalid token: {str(e)}"
+        )
+    
+    if payload.get("role") != "service_role":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Service role required"
+        )
+    return {"role": "service_role"}
@@ -17,6 +17,7 @@ class ChatRequest(BaseModel):
     chat_history: Optional[List[dict]] = None
     user_context: Optional[dict] = None
     mode: ChatMode = "fast"
+    conversation_id: Optional[str] = None  # 指定時は履歴をサーバー側で保持（chat_historyは初回のみ）
     chat_date: Optional[date] = None  # ai.py用に追加
 
 
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel
 from typing import Optional
-from app.services.gemini_service import gemini_service
+from app.services.gemini_service import gemini_service, CHAT_ERROR_MESSAGE
+from app.services.sse import chat_sse_events, sse_response
+from app.middleware.auth import get_current_user_optional
 
 router = APIRouter(tags=["AI"])
 
@@ -46,6 +48,7 @@ class ChatRequest(BaseModel):
     chat_history: Optional[list] = None
     user_context: Optional[dict] = None
     mode: str = "fast"  # "fast" or "thinking"
+    conversation_id: Optional[str] = None  # 指定時は履歴をサーバー側で保持（ログイン必須、chat_historyは初回のみ）
 
 
 class MealAnalysisRequest(BaseModel):
@@ -124,13 +127,28 @@ async def get_meal_comment(request: MealCommentRequest):
         )
 
 
+def _conversation_user_id(request: ChatRequest, current_user: Optional[dict]) -> Optional[str]:
+    """会話はユーザーごとに保持するので、conversation_idを使うにはログインが必要"""
+    if request.conversation_id and current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="conversation_id を使うにはログインが必要です"
+        )
+    return current_user["id"] if current_user else None
+
+
 @router.post("/v1/chat")
-async def chat_with_calo(request: ChatRequest):
+async def chat_with_calo(
+    request: ChatRequest,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
     """
     カロちゃんとチャット
     - mode="fast": Flash Liteモデル（高速）
     - mode="thinking": Proモデル（高品質）
+    - conversation_id: 指定時はログインが必要（会話はユーザーごとに保持）
     """
+    user_id = _conversation_user_id(request, current_user)
     try:
         print(f"💬 Chat Request:")
         print(f"  - Mode: {request.mode}")
@@ -143,7 +161,9 @@ async def chat_with_calo(request: ChatRequest):
             user_context=request.user_context,
             image_base64=request.image_base64,
             chat_history=request.chat_history,
-            mode=request.mode
+            mode=request.mode,
+            conversation_id=request.conversation_id,
+            user_id=user_id
         )
         
         print(f"  ✅ Response: {response[:100]}...")
@@ -157,16 +177,52 @@ async def chat_with_calo(request: ChatRequest):
         )
 
 
+@router.post("/v1/chat/stream")
+async def chat_with_calo_stream(
+    request: ChatRequest,
+    http_request: Request,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
+    """
+    カロちゃんとチャット（SSEストリーミング版）
+    - event: token（テキスト片）→ event: done（全文）
+    - 失敗時は event: error
+    - conversation_id: 指定時はログインが必要（会話はユーザーごとに保持）
+    """
+    user_id = _conversation_user_id(request, current_user)
+    print(f"💬 Chat Stream Request:")
+    print(f"  - Mode: {request.mode}")
+    print(f"  - Has Image: {request.image_base64 is not None}")
+    
+    chunks = gemini_service.chat_stream(
+        message=request.message,
+        user_context=request.user_context,
+        image_base64=request.image_base64,
+        chat_history=request.chat_history,
+        mode=request.mode,
+        conversation_id=request.conversation_id,
+        user_id=user_id
+    )
+    return sse_response(chat_sse_events(http_request, chunks, request.mode, CHAT_ERROR_MESSAGE))
+
+
 @router.post("/v1/analyze-meal")
-async def analyze_meal(request: MealAnalysisRequest):
+async def analyze_meal(
+    request: MealAnalysisRequest,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
     """
     食事画像またはテキストからカロリー・栄養素を分析
     Proモデルを使用（高品質）
+    ログイン中なら、結果を似た写真の検索（/analyze-meal/similar）用に登録する
     """
     try:
         if request.image_base64:
             print("🍽️ Analyzing meal image...")
-            result = await gemini_service.analyze_meal_image(request.image_base64)
+            result = await gemini_service.analyze_meal_image(
+                request.image_base64,
+                user_id=current_user["id"] if current_user else None
+            )
         elif request.description:
             print(f"🍽️ Analyzing meal text: {request.description}")
             result = await gemini_service.analyze_meal_text(request.description)
@@ -1,9 +1,26 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
-from typing import Optional, List, Literal
-from app.services.gemini_service import gemini_service
+from typing import AsyncIterator, Optional, List, Literal
+from app.config import get_settings
+from app.services.gemini_service import gemini_service, advice_cache, circuit_stats
+from app.services.sse import meal_analysis_sse_events, sse_event, sse_response
+from app.services.upload import read_image_upload
+from app.services.image_cache import image_analysis_cache
+from app.services.text_cache import meal_text_cache
+from app.services.single_flight import ai_single_flight
+from app.services.image_preprocess import preprocess_stats
+from app.services.food_db import food_db
+from app.services.hedging import hedge_stats
+from app.services.chat_context import conversation_store
+from app.services.meal_jobs import MealJob, QueueFullError, meal_job_queue
+from app.services.meal_comment_cache import meal_comment_cache
+from app.services.image_similarity import meal_image_index
+from app.middleware.auth import get_current_user, get_current_user_optional, require_service_role
+import asyncio
+import base64
 
 router = APIRouter(prefix="/api/v1", tags=["chat"])
+settings = get_settings()
 
 
 # ============================================================
@@ -20,6 +37,7 @@ class ChatRequest(BaseModel):
     chat_history: Optional[List[dict]] = None
     user_context: Optional[dict] = None
     mode: ChatMode = "fast"
+    conversation_id: Optional[str] = None  # 指定時は履歴をサーバー側で保持（ログイン必須、chat_historyは初回のみ）
 
 
 class ChatResponse(BaseModel):
@@ -76,6 +94,45 @@ class MealAnalysisRequest(BaseModel):
     description: Optional[str] = None
 
 
+class MealAnalysisBatchRequest(BaseModel):
+    """まとめて食事分析リクエスト"""
+    items: List[MealAnalysisRequest]
+
+
+class MealAnalysisBatchItemResult(BaseModel):
+    """まとめて食事分析の1件分の結果"""
+    index: int
+    analysis: Optional[DetailedMealAnalysis] = None
+    error: Optional[str] = None
+
+
+class MealAnalysisBatchResponse(BaseModel):
+    """まとめて食事分析レスポンス（入力順）"""
+    results: List[MealAnalysisBatchItemResult]
+
+
+class MealAnalysisJobResponse(BaseModel):
+    """食事分析ジョブの状態"""
+    job_id: str
+    status: str  # queued / running / succeeded / failed
+    attempts: int = 0
+    analysis: Optional[DetailedMealAnalysis] = None  # failed の場合はフォールバック結果
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+class SimilarMeal(BaseModel):
+    """過去の似た写真の分析結果"""
+    distance: int  # 知覚ハッシュのハミング距離（0〜64、小さいほど似ている）
+    analyzed_at: float
+    analysis: DetailedMealAnalysis
+
+
+class SimilarMealsResponse(BaseModel):
+    matches: List[SimilarMeal]
+
+
 # ✅ 食事コメント生成用リクエスト
 class MealCommentRequest(BaseModel):
     """食事コメントリクエスト"""
@@ -124,20 +181,34 @@ class ChatResponseWithMessages(BaseModel):
 # チャットエンドポイント
 # ============================================================
 
+def _conversation_user_id(request: ChatRequest, current_user: Optional[dict]) -> Optional[str]:
+    """会話はユーザーごとに保持するので、conversation_idを使うにはログインが必要"""
+    if request.conversation_id and current_user is None:
+        raise HTTPException(status_code=401, detail="conversation_id を使うにはログインが必要です")
+    return current_user["id"] if current_user else None
+
+
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
     """
     カロちゃんとチャット
     
     - mode: "fast"（高速モード - Flash Lite）or "thinking"（思考モード - Pro）
+    - conversation_id: 指定時はログインが必要（会話はユーザーごとに保持）
     """
+    user_id = _conversation_user_id(request, current_user)
     try:
         response = await gemini_service.chat(
             message=request.message,
             user_context=request.user_context,
             image_base64=request.image_base64,
             chat_history=request.chat_history,
-            mode=request.mode
+            mode=request.mode,
+            conversation_id=request.conversation_id,
+            user_id=user_id
         )
         
         return ChatResponse(
@@ -184,42 +255,26 @@ async def generate_advice(request: AdviceRequest):
 # ============================================================
 
 @router.post("/analyze-meal", response_model=DetailedMealAnalysis)
-async def analyze_meal(request: MealAnalysisRequest):
+async def analyze_meal(
+    request: MealAnalysisRequest,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
     """
     食事を分析してカロリー・栄養素を推定（Proモデル使用）
+    ログイン中なら、結果を似た写真の検索（/analyze-meal/similar）用に登録する
     """
     try:
         if request.image_base64:
-            analysis = await gemini_service.analyze_meal_image(request.image_base64)
+            analysis = await gemini_service.analyze_meal_image(
+                request.image_base64,
+                user_id=current_user["id"] if current_user else None
+            )
         elif request.description:
             analysis = await gemini_service.analyze_meal_text(request.description)
         else:
             raise HTTPException(status_code=400, detail="画像またはテキストが必要です")
         
-        # ✅ gemini_serviceの結果を直接DetailedMealAnalysisに変換
-        return DetailedMealAnalysis(
-            food_items=[
-                FoodItem(
-                    name=item.name,
-                    amount=item.amount,
-                    calories=item.calories,
-                    protein=item.protein,
-                    fat=item.fat,
-                    carbs=item.carbs,
-                    sugar=getattr(item, 'sugar', 0),
-                    fiber=getattr(item, 'fiber', 0),
-                    sodium=getattr(item, 'sodium', 0)
-                ) for item in analysis.food_items
-            ],
-            total_calories=analysis.total_calories,
-            total_protein=analysis.total_protein,
-            total_fat=analysis.total_fat,
-            total_carbs=analysis.total_carbs,
-            total_sugar=analysis.total_sugar,
-            total_fiber=analysis.total_fiber,
-            total_sodium=analysis.total_sodium,
-            character_comment=analysis.character_comment
-        )
+        return _to_detailed_analysis(analysis)
     except HTTPException:
         raise
     except Exception as e:
@@ -229,6 +284,285 @@ async def analyze_meal(request: MealAnalysisRequest):
         raise HTTPException(status_code=500, detail=f"食事分析エラー: {str(e)}")
 
 
+@router.post("/analyze-meal/upload", response_model=DetailedMealAnalysis)
+async def analyze_meal_upload(
+    image_data: bytes = Depends(read_image_upload),
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
+    """
+    食事画像をバイナリで受け取って分析（Proモデル使用）
+    
+    - multipart/form-data（file フィールド）または Content-Type: image/jpeg の生データ
+    - Base64入りJSONより転送量・メモリ使用量が少ない
+    - ログイン中なら、結果を似た写真の検索（/analyze-meal/similar）用に登録する
+    """
+    try:
+        analysis = await gemini_service.analyze_meal_image_bytes(
+            image_data,
+            user_id=current_user["id"] if current_user else None
+        )
+        return _to_detailed_analysis(analysis)
+    except Exception as e:
+        import traceback
+        print(f"Meal analysis error: {e}")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"食事分析エラー: {str(e)}")
+
+
+@router.post("/analyze-meal/similar", response_model=SimilarMealsResponse)
+async def find_similar_meals(
+    image_data: bytes = Depends(read_image_upload),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    過去に分析した似た写真の結果を返す（AIは呼ばないので即答）
+    「前回と同じ食事ですか？」の提案用
+    """
+    matches = await gemini_service.find_similar_meals(image_data, current_user["id"])
+    return SimilarMealsResponse(matches=[SimilarMeal(**match) for match in matches])
+
+
+@router.post("/analyze-meal/stream")
+async def analyze_meal_stream(request: MealAnalysisRequest, http_request: Request):
+    """
+    食事を分析（SSEストリーミング版）
+    
+    - event: food_item（食品が1つ完成するごと）→ totals → character_comment → done
+    - 失敗時は event: error（フォールバック結果）
+    """
+    if request.image_base64:
+        try:
+            image_data = base64.b64decode(request.image_base64)
+        except Exception:
+            raise HTTPException(status_code=400, detail="画像のデコードに失敗しました")
+        events = gemini_service.analyze_meal_stream(image_data=image_data)
+    elif request.description:
+        events = gemini_service.analyze_meal_stream(description=request.description)
+    else:
+        raise HTTPException(status_code=400, detail="画像またはテキストが必要です")
+    
+    return sse_response(meal_analysis_sse_events(http_request, events))
+
+
+@router.post("/analyze-meal/upload/stream")
+async def analyze_meal_upload_stream(http_request: Request, image_data: bytes = Depends(read_image_upload)):
+    """
+    食事画像をバイナリで受け取って分析（SSEストリーミング版）
+    """
+    events = gemini_service.analyze_meal_stream(image_data=image_data)
+    return sse_response(meal_analysis_sse_events(http_request, events))
+
+
+# ============================================================
+# まとめて食事分析エンドポイント
+# ============================================================
+
+def _validate_batch(request: MealAnalysisBatchRequest):
+    if not request.items:
+        raise HTTPException(status_code=400, detail="items が空です")
+    if len(request.items) > settings.batch_analysis_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"一度に分析できるのは{settings.batch_analysis_max_items}件までです"
+        )
+
+
+async def _analyze_batch_item(
+    index: int,
+    item: MealAnalysisRequest,
+    semaphore: asyncio.Semaphore
+) -> MealAnalysisBatchItemResult:
+    """
+    1件分を分析（失敗してもバッチ全体は止めない）
+    フォールバック結果で成功扱いにしないよう strict 版を使い、失敗は error に入れる
+    """
+    async with semaphore:
+        try:
+            if item.image_base64:
+                try:
+                    image_data = base64.b64decode(item.image_base64, validate=True)
+                except Exception:
+                    return MealAnalysisBatchItemResult(index=index, error="画像のデコードに失敗しました")
+                analysis = await gemini_service.analyze_meal_image_bytes_strict(image_data)
+            elif item.description:
+                analysis = await gemini_service.analyze_meal_text_strict(item.description)
+            else:
+                return MealAnalysisBatchItemResult(index=index, error="画像またはテキストが必要です")
+            
+            return MealAnalysisBatchItemResult(index=index, analysis=_to_detailed_analysis(analysis))
+        except Exception as e:
+            print(f"Batch meal analysis error (item {index}): {e}")
+            return MealAnalysisBatchItemResult(index=index, error=f"食事分析エラー: {str(e)}")
+
+
+def _start_batch(request: MealAnalysisBatchRequest) -> List[asyncio.Task]:
+    semaphore = asyncio.Semaphore(settings.batch_analysis_concurrency)
+    return [
+        asyncio.create_task(_analyze_batch_item(i, item, semaphore))
+        for i, item in enumerate(request.items)
+    ]
+
+
+@router.post("/analyze-meal/batch", response_model=MealAnalysisBatchResponse)
+async def analyze_meal_batch(request: MealAnalysisBatchRequest):
+    """
+    複数の食事（画像/テキスト）をまとめて分析
+    
+    - 同時実行数を制限して並列に分析し、入力順で返す
+    - 失敗した項目は error に理由が入る（他の項目は影響を受けない）
+    """
+    _validate_batch(request)
+    results = await asyncio.gather(*_start_batch(request))
+    return MealAnalysisBatchResponse(results=list(results))
+
+
+@router.post("/analyze-meal/batch/stream")
+async def analyze_meal_batch_stream(request: MealAnalysisBatchRequest, http_request: Request):
+    """
+    複数の食事をまとめて分析（SSEストリーミング版）
+    
+    - event: result（完了した順、index で入力位置を示す）→ event: done
+    """
+    _validate_batch(request)
+    
+    async def events() -> AsyncIterator[str]:
+        tasks = _start_batch(request)
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                if await http_request.is_disconnected():
+                    return
+                yield sse_event("result", result.model_dump())
+            yield sse_event("done", {"count": len(tasks)})
+        finally:
+            # 切断時は残りの分析をキャンセル
+            for task in tasks:
+                task.cancel()
+    
+    return sse_response(events())
+
+
+def _to_detailed_analysis(analysis) -> DetailedMealAnalysis:
+    """gemini_serviceの結果をDetailedMealAnalysisに変換"""
+    return DetailedMealAnalysis(
+        food_items=[
+            FoodItem(
+                name=item.name,
+                amount=item.amount,
+                calories=item.calories,
+                protein=item.protein,
+                fat=item.fat,
+                carbs=item.carbs,
+                sugar=getattr(item, 'sugar', 0),
+                fiber=getattr(item, 'fiber', 0),
+                sodium=getattr(item, 'sodium', 0)
+            ) for item in analysis.food_items
+        ],
+        total_calories=analysis.total_calories,
+        total_protein=analysis.total_protein,
+        total_fat=analysis.total_fat,
+        total_carbs=analysis.total_carbs,
+        total_sugar=analysis.total_sugar,
+        total_fiber=analysis.total_fiber,
+        total_sodium=analysis.total_sodium,
+        character_comment=analysis.character_comment
+    )
+
+
+# ============================================================
+# 食事分析ジョブエンドポイント（非同期実行）
+# ============================================================
+
+def _to_job_response(job: MealJob) -> MealAnalysisJobResponse:
+    return MealAnalysisJobResponse(
+        job_id=job.id,
+        status=job.status,
+        attempts=job.attempts,
+        analysis=DetailedMealAnalysis(**job.result) if job.result else None,
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
+
+
+async def _submit_job(description: Optional[str] = None, image_data: Optional[bytes] = None) -> MealAnalysisJobResponse:
+    try:
+        job = await meal_job_queue.submit(description=description, image_data=image_data)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="分析が混み合っています。しばらくしてからお試しください")
+    return _to_job_response(job)
+
+
+@router.post("/analyze-meal/jobs", response_model=MealAnalysisJobResponse, status_code=202)
+async def create_meal_analysis_job(request: MealAnalysisRequest):
+    """
+    食事分析ジョブを登録（すぐにジョブIDを返す）
+    
+    - 結果は GET /analyze-meal/jobs/{job_id}（?wait= でロングポーリング）
+      または GET /analyze-meal/jobs/{job_id}/events（SSE）で受け取る
+    """
+    if request.image_base64:
+        try:
+            image_data = base64.b64decode(request.image_base64)
+        except Exception:
+            raise HTTPException(status_code=400, detail="画像のデコードに失敗しました")
+        return await _submit_job(image_data=image_data)
+    if request.description:
+        return await _submit_job(description=request.description)
+    raise HTTPException(status_code=400, detail="画像またはテキストが必要です")
+
+
+@router.post("/analyze-meal/jobs/upload", response_model=MealAnalysisJobResponse, status_code=202)
+async def create_meal_analysis_job_upload(image_data: bytes = Depends(read_image_upload)):
+    """
+    食事画像をバイナリで受け取って分析ジョブを登録
+    """
+    return await _submit_job(image_data=image_data)
+
+
+@router.get("/analyze-meal/jobs/{job_id}", response_model=MealAnalysisJobResponse)
+async def get_meal_analysis_job(job_id: str, wait: float = 0):
+    """
+    食事分析ジョブの状態を取得
+    
+    - wait: 完了まで最大何秒待つか（ロングポーリング、0なら即時）
+    """
+    wait = min(max(wait, 0), settings.meal_job_wait_max_seconds)
+    job = await meal_job_queue.wait(job_id, wait) if wait else await meal_job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません（期限切れの可能性があります）")
+    return _to_job_response(job)
+
+
+@router.get("/analyze-meal/jobs/{job_id}/events")
+async def stream_meal_analysis_job(job_id: str, http_request: Request):
+    """
+    食事分析ジョブの完了をSSEで待つ
+    
+    - event: status（現在の状態）→ event: done（完了時、結果を含む）
+    """
+    job = await meal_job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません（期限切れの可能性があります）")
+    
+    async def events() -> AsyncIterator[str]:
+        current = job
+        yield sse_event("status", {"job_id": current.id, "status": current.status})
+        # 接続を保つため一定間隔で状態を送り直す
+        while not current.finished:
+            if await http_request.is_disconnected():
+                return
+            current = await meal_job_queue.wait(job_id, 15)
+            if current is None:
+                yield sse_event("error", {"message": "ジョブが見つかりません"})
+                return
+            if not current.finished:
+                yield sse_event("status", {"job_id": current.id, "status": current.status})
+        yield sse_event("done", _to_job_response(current).model_dump())
+    
+    return sse_response(events())
+
+
 # ============================================================
 # 食事コメント生成エンドポイント（新規追加）
 # ============================================================
@@ -256,4 +590,46 @@ async def generate_meal_comment(request: MealCommentRequest):
         print(f"Meal comment error: {e}")
         print(traceback.format_exc())
         # エラー時はデフォルトコメントを返す
-        return MealCommentResponse(comment="美味しそうだにゃ！🐱")
\ No newline at end of file
+        return MealCommentResponse(comment="美味しそうだにゃ！🐱")
+
+
+@router.post("/ai/meal-comments/prewarm")
+async def prewarm_meal_comments(
+    top_n: int = Query(
+        settings.meal_comment_prewarm_top_n,
+        ge=1,
+        le=settings.meal_comment_prewarm_max_top_n,
+        description="事前生成する料理の数（よく記録される順）"
+    ),
+    service: dict = Depends(require_service_role)
+):
+    """
+    よく記録される料理の食事コメントを事前に生成してキャッシュする
+    AIを top_n 回程度呼ぶので内部用（サービスロールのトークンのみ）
+    """
+    return await gemini_service.prewarm_meal_comments(top_n=top_n)
+
+
+# ============================================================
+# AIキャッシュ統計エンドポイント
+# ============================================================
+
+@router.get("/ai/stats")
+async def get_ai_stats():
+    """
+    AI関連キャッシュのヒット/ミス数・まとめられた呼び出し数を取得
+    """
+    return {
+        "image_analysis_cache": image_analysis_cache.stats(),
+        "text_analysis_cache": meal_text_cache.stats(),
+        "single_flight": ai_single_flight.stats(),
+        "image_preprocess": preprocess_stats.stats(),
+        "food_db": food_db.stats(),
+        "advice_cache": advice_cache.stats(),
+        "hedging": hedge_stats.stats(),
+        "circuit": circuit_stats(),
+        "conversations": conversation_store.stats(),
+        "meal_jobs": meal_job_queue.stats(),
+        "meal_comment_cache": meal_comment_cache.stats(),
+        "near_duplicate_index": meal_image_index.stats()
+    }
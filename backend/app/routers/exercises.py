@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, status
-from app.database import get_supabase_admin
+from app.database import get_db
 from app.middleware.auth import get_current_user
+from app.services.daily_totals import previous_row_needed, record_exercise_change
+from app.services.day_cache import EXERCISES_DAILY, day_cache
 from app.models.exercise import (
     ExerciseLogCreate, ExerciseLogUpdate, ExerciseLogResponse,
     SavedExerciseCreate, SavedExerciseResponse, DailyExerciseSummary
@@ -20,7 +22,7 @@ async def create_exercise_log(
     運動を記録
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         data = exercise.model_dump()
         data["user_id"] = current_user["id"]
@@ -31,7 +33,9 @@ async def create_exercise_log(
         else:
             data["logged_at"] = datetime.now().isoformat()
         
-        response = supabase.table("exercise_logs").insert(data).execute()
+        response = await db.execute(db.table("exercise_logs").insert(data))
+        await record_exercise_change(current_user["id"], None, response.data[0])
+        day_cache.invalidate_logs(current_user["id"], response.data[0])
         
         return ExerciseLogResponse(**response.data[0])
         
@@ -54,9 +58,9 @@ async def get_exercise_logs(
     運動記録を取得
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        query = supabase.table("exercise_logs").select("*").eq("user_id", current_user["id"])
+        query = db.table("exercise_logs").select("*").eq("user_id", current_user["id"])
         
         if date:
             query = query.gte("logged_at", f"{date}T00:00:00").lt("logged_at", f"{date}T23:59:59")
@@ -64,7 +68,7 @@ async def get_exercise_logs(
             query = query.gte("logged_at", f"{start_date}T00:00:00").lte("logged_at", f"{end_date}T23:59:59")
         
         query = query.order("logged_at", desc=True).limit(limit)
-        response = query.execute()
+        response = await db.execute(query)
         
         return [ExerciseLogResponse(**item) for item in response.data]
         
@@ -81,30 +85,12 @@ async def get_daily_exercise_summary(
     current_user: dict = Depends(get_current_user)
 ):
     """
-    日別運動サマリーを取得
+    日別運動サマリーを取得（記録を書き込むまでキャッシュ）
     """
     try:
-        supabase = get_supabase_admin()
-        
-        response = supabase.table("exercise_logs").select("*").eq(
-            "user_id", current_user["id"]
-        ).gte(
-            "logged_at", f"{date}T00:00:00"
-        ).lt(
-            "logged_at", f"{date}T23:59:59"
-        ).order("logged_at").execute()
-        
-        exercises = [ExerciseLogResponse(**item) for item in response.data]
-        
-        total_calories = sum(e.calories_burned for e in exercises)
-        total_duration = sum(e.duration_minutes for e in exercises)
-        
-        return DailyExerciseSummary(
-            date=date,
-            total_calories_burned=total_calories,
-            total_duration_minutes=total_duration,
-            exercise_count=len(exercises),
-            exercises=exercises
+        return await day_cache.get_or_load(
+            current_user["id"], EXERCISES_DAILY, date,
+            lambda: load_daily_exercise_summary(current_user["id"], date)
         )
         
     except Exception as e:
@@ -114,6 +100,32 @@ async def get_daily_exercise_summary(
         )
 
 
+async def load_daily_exercise_summary(user_id: str, date: str) -> DailyExerciseSummary:
+    """日別運動サマリーを記録から作る"""
+    db = get_db()
+    
+    response = await db.execute(db.table("exercise_logs").select("*").eq(
+        "user_id", user_id
+    ).gte(
+        "logged_at", f"{date}T00:00:00"
+    ).lt(
+        "logged_at", f"{date}T23:59:59"
+    ).order("logged_at"))
+    
+    exercises = [ExerciseLogResponse(**item) for item in response.data]
+    
+    total_calories = sum(e.calories_burned for e in exercises)
+    total_duration = sum(e.duration_minutes for e in exercises)
+    
+    return DailyExerciseSummary(
+        date=date,
+        total_calories_burned=total_calories,
+        total_duration_minutes=total_duration,
+        exercise_count=len(exercises),
+        exercises=exercises
+    )
+
+
 @router.get("/{exercise_id}", response_model=ExerciseLogResponse)
 async def get_exercise_log(
     exercise_id: str,
@@ -123,13 +135,13 @@ async def get_exercise_log(
     特定の運動記録を取得
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        response = supabase.table("exercise_logs").select("*").eq(
+        response = await db.execute(db.table("exercise_logs").select("*").eq(
             "id", exercise_id
         ).eq(
             "user_id", current_user["id"]
-        ).single().execute()
+        ).single())
         
         if response.data is None:
             raise HTTPException(
@@ -158,7 +170,7 @@ async def update_exercise_log(
     運動記録を更新
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         update_data = {k: v for k, v in exercise.model_dump().items() if v is not None}
         
@@ -167,11 +179,21 @@ async def update_exercise_log(
         if "logged_at" in update_data:
             update_data["logged_at"] = update_data["logged_at"].isoformat()
         
-        response = supabase.table("exercise_logs").update(update_data).eq(
+        # 変更前の記録（日別集計の差分・日付が変わる場合のキャッシュ無効化用）
+        previous = None
+        if previous_row_needed(update_data):
+            before = await db.execute(db.table("exercise_logs").select("*").eq(
+                "id", exercise_id
+            ).eq(
+                "user_id", current_user["id"]
+            ))
+            previous = before.data[0] if before.data else None
+        
+        response = await db.execute(db.table("exercise_logs").update(update_data).eq(
             "id", exercise_id
         ).eq(
             "user_id", current_user["id"]
-        ).execute()
+        ))
         
         if not response.data:
             raise HTTPException(
@@ -179,6 +201,9 @@ async def update_exercise_log(
                 detail="Exercise log not found"
             )
         
+        await record_exercise_change(current_user["id"], previous, response.data[0])
+        day_cache.invalidate_logs(current_user["id"], previous, response.data[0])
+        
         return ExerciseLogResponse(**response.data[0])
         
     except HTTPException:
@@ -199,13 +224,16 @@ async def delete_exercise_log(
     運動記録を削除
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        supabase.table("exercise_logs").delete().eq(
+        response = await db.execute(db.table("exercise_logs").delete().eq(
             "id", exercise_id
         ).eq(
             "user_id", current_user["id"]
-        ).execute()
+        ))
+        if response.data:
+            await record_exercise_change(current_user["id"], response.data[0], None)
+            day_cache.invalidate_logs(current_user["id"], response.data[0])
         
         return {"message": "Exercise log deleted successfully"}
         
@@ -229,12 +257,12 @@ async def create_saved_exercise(
     運動を保存（お気に入り）
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         data = exercise.model_dump()
         data["user_id"] = current_user["id"]
         
-        response = supabase.table("saved_exercises").insert(data).execute()
+        response = await db.execute(db.table("saved_exercises").insert(data))
         
         return SavedExerciseResponse(**response.data[0])
         
@@ -253,11 +281,11 @@ async def get_saved_exercises(
     保存済み運動一覧を取得
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        response = supabase.table("saved_exercises").select("*").eq(
+        response = await db.execute(db.table("saved_exercises").select("*").eq(
             "user_id", current_user["id"]
-        ).order("created_at", desc=True).execute()
+        ).order("created_at", desc=True))
         
         return [SavedExerciseResponse(**item) for item in response.data]
         
@@ -277,13 +305,13 @@ async def delete_saved_exercise(
     保存済み運動を削除
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        supabase.table("saved_exercises").delete().eq(
+        await db.execute(db.table("saved_exercises").delete().eq(
             "id", exercise_id
         ).eq(
             "user_id", current_user["id"]
-        ).execute()
+        ))
         
         return {"message": "Saved exercise deleted successfully"}
         
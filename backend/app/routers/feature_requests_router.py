@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
-from app.database import get_supabase_admin
+from app.database import get_db
 from app.middleware.auth import get_current_user
 
 router = APIRouter(prefix="/feature-requests", tags=["機能リクエスト"])
@@ -58,16 +58,16 @@ async def get_feature_requests(
 ):
     """全ての機能リクエストを取得（投票数順）"""
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         user_id = current_user["id"]
         
         # リクエスト一覧を取得（JOINなし）
-        requests_response = supabase.table("feature_requests").select("*").order("votes", desc=True).execute()
+        requests_response = await db.execute(db.table("feature_requests").select("*").order("votes", desc=True))
         
         # 現在のユーザーの投票を取得
-        votes_response = supabase.table("feature_request_votes").select(
+        votes_response = await db.execute(db.table("feature_request_votes").select(
             "request_id"
-        ).eq("user_id", user_id).execute()
+        ).eq("user_id", user_id))
         
         voted_request_ids = {v["request_id"] for v in (votes_response.data or [])}
         
@@ -76,7 +76,7 @@ async def get_feature_requests(
             # 作者名を個別に取得
             author_name = "匿名"
             try:
-                profile_response = supabase.table("profiles").select("display_name").eq("id", req["author_id"]).execute()
+                profile_response = await db.execute(db.table("profiles").select("display_name").eq("id", req["author_id"]))
                 if profile_response.data and len(profile_response.data) > 0:
                     author_name = profile_response.data[0].get("display_name") or "匿名"
             except:
@@ -114,11 +114,11 @@ async def get_feature_request(
 ):
     """特定の機能リクエストを取得（コメント含む）"""
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         user_id = current_user["id"]
         
         # リクエストを取得（JOINなし）
-        req_response = supabase.table("feature_requests").select("*").eq("id", request_id).execute()
+        req_response = await db.execute(db.table("feature_requests").select("*").eq("id", request_id))
         
         if not req_response.data or len(req_response.data) == 0:
             raise HTTPException(status_code=404, detail="Request not found")
@@ -128,25 +128,25 @@ async def get_feature_request(
         # 作者名を取得
         author_name = "匿名"
         try:
-            profile_response = supabase.table("profiles").select("display_name").eq("id", req["author_id"]).execute()
+            profile_response = await db.execute(db.table("profiles").select("display_name").eq("id", req["author_id"]))
             if profile_response.data and len(profile_response.data) > 0:
                 author_name = profile_response.data[0].get("display_name") or "匿名"
         except:
             pass
         
         # 投票確認
-        vote_response = supabase.table("feature_request_votes").select("id").eq("request_id", request_id).eq("user_id", user_id).execute()
+        vote_response = await db.execute(db.table("feature_request_votes").select("id").eq("request_id", request_id).eq("user_id", user_id))
         has_voted = len(vote_response.data or []) > 0
         
         # コメントを取得（JOINなし）
-        comments_response = supabase.table("feature_request_comments").select("*").eq("request_id", request_id).order("created_at", desc=True).execute()
+        comments_response = await db.execute(db.table("feature_request_comments").select("*").eq("request_id", request_id).order("created_at", desc=True))
         
         comments = []
         for c in (comments_response.data or []):
             # コメント投稿者名を取得
             commenter_name = "匿名"
             try:
-                commenter_profile = supabase.table("profiles").select("display_name").eq("id", c["user_id"]).execute()
+                commenter_profile = await db.execute(db.table("profiles").select("display_name").eq("id", c["user_id"]))
                 if commenter_profile.data and len(commenter_profile.data) > 0:
                     commenter_name = commenter_profile.data[0].get("display_name") or "匿名"
             except:
@@ -193,7 +193,7 @@ async def create_feature_request(
 ):
     """新しい機能リクエストを作成"""
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         user_id = current_user["id"]
         
         # リクエストを作成
@@ -204,7 +204,7 @@ async def create_feature_request(
             "votes": 1  # 作成者は自動で1票
         }
         
-        req_response = supabase.table("feature_requests").insert(req_data).execute()
+        req_response = await db.execute(db.table("feature_requests").insert(req_data))
         
         if not req_response.data or len(req_response.data) == 0:
             raise HTTPException(status_code=500, detail="Failed to create request")
@@ -212,15 +212,15 @@ async def create_feature_request(
         req = req_response.data[0]
         
         # 作成者の投票を追加
-        supabase.table("feature_request_votes").insert({
+        await db.execute(db.table("feature_request_votes").insert({
             "request_id": req["id"],
             "user_id": user_id
-        }).execute()
+        }))
         
         # 作成者の名前を取得
         author_name = "あなた"
         try:
-            profile_response = supabase.table("profiles").select("display_name").eq("id", user_id).execute()
+            profile_response = await db.execute(db.table("profiles").select("display_name").eq("id", user_id))
             if profile_response.data and len(profile_response.data) > 0:
                 author_name = profile_response.data[0].get("display_name") or "あなた"
         except:
@@ -258,11 +258,11 @@ async def delete_feature_request(
 ):
     """機能リクエストを削除（作成者のみ）"""
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         user_id = current_user["id"]
         
         # 所有者確認
-        req_response = supabase.table("feature_requests").select("author_id").eq("id", request_id).execute()
+        req_response = await db.execute(db.table("feature_requests").select("author_id").eq("id", request_id))
         
         if not req_response.data or len(req_response.data) == 0:
             raise HTTPException(status_code=404, detail="Request not found")
@@ -271,7 +271,7 @@ async def delete_feature_request(
             raise HTTPException(status_code=403, detail="Not authorized")
         
         # 削除（CASCADE設定により投票・コメントも削除される）
-        supabase.table("feature_requests").delete().eq("id", request_id).execute()
+        await db.execute(db.table("feature_requests").delete().eq("id", request_id))
         
         return {"message": "Deleted successfully"}
         
@@ -292,27 +292,27 @@ async def toggle_vote(
 ):
     """投票のトグル（投票/取り消し）"""
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         user_id = current_user["id"]
         
         # 既存の投票を確認
-        existing_vote = supabase.table("feature_request_votes").select(
+        existing_vote = await db.execute(db.table("feature_request_votes").select(
             "id"
-        ).eq("request_id", request_id).eq("user_id", user_id).execute()
+        ).eq("request_id", request_id).eq("user_id", user_id))
         
         if existing_vote.data:
             # 投票を取り消し
-            supabase.table("feature_request_votes").delete().eq(
+            await db.execute(db.table("feature_request_votes").delete().eq(
                 "request_id", request_id
-            ).eq("user_id", user_id).execute()
+            ).eq("user_id", user_id))
             
             return {"voted": False, "message": "Vote removed"}
         else:
             # 投票を追加
-            supabase.table("feature_request_votes").insert({
+            await db.execute(db.table("feature_request_votes").insert({
                 "request_id": request_id,
                 "user_id": user_id
-            }).execute()
+            }))
             
             return {"voted": True, "message": "Vote added"}
         
@@ -332,7 +332,7 @@ async def add_comment(
 ):
     """コメントを追加"""
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         user_id = current_user["id"]
         
         # コメントを作成
@@ -342,7 +342,7 @@ async def add_comment(
             "content": comment.content
         }
         
-        response = supabase.table("feature_request_comments").insert(comment_data).execute()
+        response = await db.execute(db.table("feature_request_comments").insert(comment_data))
         
         if not response.data or len(response.data) == 0:
             raise HTTPException(status_code=500, detail="Failed to create comment")
@@ -352,7 +352,7 @@ async def add_comment(
         # 作成者の名前を取得
         display_name = "あなた"
         try:
-            profile_response = supabase.table("profiles").select("display_name").eq("id", user_id).execute()
+            profile_response = await db.execute(db.table("profiles").select("display_name").eq("id", user_id))
             if profile_response.data and len(profile_response.data) > 0:
                 display_name = profile_response.data[0].get("display_name") or "あなた"
         except:
@@ -385,11 +385,11 @@ async def delete_comment(
 ):
     """コメントを削除（作成者のみ）"""
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         user_id = current_user["id"]
         
         # 所有者確認
-        comment_response = supabase.table("feature_request_comments").select("user_id").eq("id", comment_id).execute()
+        comment_response = await db.execute(db.table("feature_request_comments").select("user_id").eq("id", comment_id))
         
         if not comment_response.data or len(comment_response.data) == 0:
             raise HTTPException(status_code=404, detail="Comment not found")
@@ -398,7 +398,7 @@ async def delete_comment(
             raise HTTPException(status_code=403, detail="Not authorized")
         
         # 削除
-        supabase.table("feature_request_comments").delete().eq("id", comment_id).execute()
+        await db.execute(db.table("feature_request_comments").delete().eq("id", comment_id))
         
         return {"message": "Comment deleted successfully"}
         
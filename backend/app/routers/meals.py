@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, status
-from app.database import get_supabase_admin
+from app.database import get_db
 from app.middleware.auth import get_current_user
+from app.services.daily_totals import previous_row_needed, record_meal_change
+from app.services.day_cache import MEALS_DAILY, day_cache
 from app.models.meal import (
     MealLogCreate, MealLogUpdate, MealLogResponse,
     SavedMealCreate, SavedMealResponse, DailyMealSummary
@@ -20,7 +22,7 @@ async def create_meal_log(
     食事を記録
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         data = meal.model_dump()
         data["user_id"] = current_user["id"]
@@ -30,7 +32,9 @@ async def create_meal_log(
         else:
             data["logged_at"] = datetime.now().isoformat()
         
-        response = supabase.table("meal_logs").insert(data).execute()
+        response = await db.execute(db.table("meal_logs").insert(data))
+        await record_meal_change(current_user["id"], None, response.data[0])
+        day_cache.invalidate_logs(current_user["id"], response.data[0])
         
         return MealLogResponse(**response.data[0])
         
@@ -53,9 +57,9 @@ async def get_meal_logs(
     食事記録を取得
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        query = supabase.table("meal_logs").select("*").eq("user_id", current_user["id"])
+        query = db.table("meal_logs").select("*").eq("user_id", current_user["id"])
         
         if date:
             # 特定の日付のみ
@@ -64,7 +68,7 @@ async def get_meal_logs(
             query = query.gte("logged_at", f"{start_date}T00:00:00").lte("logged_at", f"{end_date}T23:59:59")
         
         query = query.order("logged_at", desc=True).limit(limit)
-        response = query.execute()
+        response = await db.execute(query)
         
         return [MealLogResponse(**item) for item in response.data]
         
@@ -81,34 +85,12 @@ async def get_daily_meal_summary(
     current_user: dict = Depends(get_current_user)
 ):
     """
-    日別食事サマリーを取得
+    日別食事サマリーを取得（記録を書き込むまでキャッシュ）
     """
     try:
-        supabase = get_supabase_admin()
-        
-        response = supabase.table("meal_logs").select("*").eq(
-            "user_id", current_user["id"]
-        ).gte(
-            "logged_at", f"{date}T00:00:00"
-        ).lt(
-            "logged_at", f"{date}T23:59:59"
-        ).order("logged_at").execute()
-        
-        meals = [MealLogResponse(**item) for item in response.data]
-        
-        total_calories = sum(m.calories for m in meals)
-        total_protein = sum(m.protein for m in meals)
-        total_fat = sum(m.fat for m in meals)
-        total_carbs = sum(m.carbs for m in meals)
-        
-        return DailyMealSummary(
-            date=date,
-            total_calories=total_calories,
-            total_protein=total_protein,
-            total_fat=total_fat,
-            total_carbs=total_carbs,
-            meal_count=len(meals),
-            meals=meals
+        return await day_cache.get_or_load(
+            current_user["id"], MEALS_DAILY, date,
+            lambda: load_daily_meal_summary(current_user["id"], date)
         )
         
     except Exception as e:
@@ -118,6 +100,36 @@ async def get_daily_meal_summary(
         )
 
 
+async def load_daily_meal_summary(user_id: str, date: str) -> DailyMealSummary:
+    """日別食事サマリーを記録から作る"""
+    db = get_db()
+    
+    response = await db.execute(db.table("meal_logs").select("*").eq(
+        "user_id", user_id
+    ).gte(
+        "logged_at", f"{date}T00:00:00"
+    ).lt(
+        "logged_at", f"{date}T23:59:59"
+    ).order("logged_at"))
+    
+    meals = [MealLogResponse(**item) for item in response.data]
+    
+    total_calories = sum(m.calories for m in meals)
+    total_protein = sum(m.protein for m in meals)
+    total_fat = sum(m.fat for m in meals)
+    total_carbs = sum(m.carbs for m in meals)
+    
+    return DailyMealSummary(
+        date=date,
+        total_calories=total_calories,
+        total_protein=total_protein,
+        total_fat=total_fat,
+        total_carbs=total_carbs,
+        meal_count=len(meals),
+        meals=meals
+    )
+
+
 @router.get("/{meal_id}", response_model=MealLogResponse)
 async def get_meal_log(
     meal_id: str,
@@ -127,13 +139,13 @@ async def get_meal_log(
     特定の食事記録を取得
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        response = supabase.table("meal_logs").select("*").eq(
+        response = await db.execute(db.table("meal_logs").select("*").eq(
             "id", meal_id
         ).eq(
             "user_id", current_user["id"]
-        ).single().execute()
+        ).single())
         
         if response.data is None:
             raise HTTPException(
@@ -162,18 +174,28 @@ async def update_meal_log(
     食事記録を更新
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         update_data = {k: v for k, v in meal.model_dump().items() if v is not None}
         
         if "logged_at" in update_data and update_data["logged_at"]:
             update_data["logged_at"] = update_data["logged_at"].isoformat()
         
-        response = supabase.table("meal_logs").update(update_data).eq(
+        # 変更前の記録（日別集計の差分・日付が変わる場合のキャッシュ無効化用）
+        previous = None
+        if previous_row_needed(update_data):
+            before = await db.execute(db.table("meal_logs").select("*").eq(
+                "id", meal_id
+            ).eq(
+                "user_id", current_user["id"]
+            ))
+            previous = before.data[0] if before.data else None
+        
+        response = await db.execute(db.table("meal_logs").update(update_data).eq(
             "id", meal_id
         ).eq(
             "user_id", current_user["id"]
-        ).execute()
+        ))
         
         if not response.data:
             raise HTTPException(
@@ -181,6 +203,9 @@ async def update_meal_log(
                 detail="Meal log not found"
             )
         
+        await record_meal_change(current_user["id"], previous, response.data[0])
+        day_cache.invalidate_logs(current_user["id"], previous, response.data[0])
+        
         return MealLogResponse(**response.data[0])
         
     except HTTPException:
@@ -201,13 +226,16 @@ async def delete_meal_log(
     食事記録を削除
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        response = supabase.table("meal_logs").delete().eq(
+        response = await db.execute(db.table("meal_logs").delete().eq(
             "id", meal_id
         ).eq(
             "user_id", current_user["id"]
-        ).execute()
+        ))
+        if response.data:
+            await record_meal_change(current_user["id"], response.data[0], None)
+            day_cache.invalidate_logs(current_user["id"], response.data[0])
         
         return {"message": "Meal log deleted successfully"}
         
@@ -231,12 +259,12 @@ async def create_saved_meal(
     食事を保存（お気に入り）
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         data = meal.model_dump()
         data["user_id"] = current_user["id"]
         
-        response = supabase.table("saved_meals").insert(data).execute()
+        response = await db.execute(db.table("saved_meals").insert(data))
         
         return SavedMealResponse(**response.data[0])
         
@@ -255,11 +283,11 @@ async def get_saved_meals(
     保存済み食事一覧を取得
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        response = supabase.table("saved_meals").select("*").eq(
+        response = await db.execute(db.table("saved_meals").select("*").eq(
             "user_id", current_user["id"]
-        ).order("created_at", desc=True).execute()
+        ).order("created_at", desc=True))
         
         return [SavedMealResponse(**item) for item in response.data]
         
@@ -279,13 +307,13 @@ async def delete_saved_meal(
     保存済み食事を削除
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        supabase.table("saved_meals").delete().eq(
+        await db.execute(db.table("saved_meals").delete().eq(
             "id", meal_id
         ).eq(
             "user_id", current_user["id"]
-        ).execute()
+        ))
         
         return {"message": "Saved meal deleted successfully"}
         
@@ -1,11 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, status
-from app.database import get_supabase_admin
+from app.database import get_db
 from app.middleware.auth import get_current_user
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, date, timedelta
+from app.config import get_settings
+from app.services.daily_stats import DayTotals, aggregate_range
+from app.services import daily_totals
+from app.services.day_cache import TODAY_PROGRESS, day_cache
+from app.services.fan_out import DeadlineExceededError, gather_with_deadline
 
 router = APIRouter(prefix="/stats", tags=["統計"])
+settings = get_settings()
 
 
 class DailySummary(BaseModel):
@@ -20,6 +26,7 @@ class DailySummary(BaseModel):
     meal_count: int
     exercise_count: int
     weight: Optional[float] = None
+    unavailable: List[str] = []  # 取得できなかった項目（部分的な結果）
 
 
 class WeeklySummary(BaseModel):
@@ -37,6 +44,43 @@ class WeeklySummary(BaseModel):
     daily_data: List[DailySummary]
 
 
+def to_daily_summary(totals: DayTotals) -> DailySummary:
+    """日別集計をレスポンス形式に変換"""
+    return DailySummary(
+        date=totals.date,
+        calories_consumed=totals.calories_consumed,
+        calories_burned=totals.calories_burned,
+        net_calories=totals.net_calories,
+        protein=round(totals.protein, 1),
+        fat=round(totals.fat, 1),
+        carbs=round(totals.carbs, 1),
+        meal_count=totals.meal_count,
+        exercise_count=totals.exercise_count,
+        weight=totals.weight,
+        unavailable=totals.unavailable
+    )
+
+
+async def load_range(user_id: str, start: date, end: date, include_weight: bool = True) -> Dict[str, DayTotals]:
+    """
+    日別集計（集計テーブルが有効なら backfill 済みの日はそこから、それ以外は元の記録から）
+    元の記録からの場合は食事・運動・体重を並行取得し、体重が取れなくても残りで返す
+    """
+    if settings.daily_totals_enabled:
+        return await daily_totals.read_range(
+            user_id, start, end,
+            include_weight=include_weight,
+            deadline=settings.summary_deadline_seconds,
+            optional=("weight",)
+        )
+    return await aggregate_range(
+        user_id, start, end,
+        include_weight=include_weight,
+        deadline=settings.summary_deadline_seconds,
+        optional=("weight",)
+    )
+
+
 class GoalProgress(BaseModel):
     """目標達成度"""
     calorie_goal: int
@@ -54,6 +98,7 @@ class GoalProgress(BaseModel):
     protein_progress_percent: float
     fat_progress_percent: float
     carbs_progress_percent: float
+    unavailable: List[str] = []  # 取得できなかった項目（部分的な結果）
 
 
 @router.get("/daily/{date}", response_model=DailySummary)
@@ -65,61 +110,15 @@ async def get_daily_summary(
     日次サマリーを取得
     """
     try:
-        supabase = get_supabase_admin()
-        
-        # 食事データ
-        meals_response = supabase.table("meal_logs").select("*").eq(
-            "user_id", current_user["id"]
-        ).gte(
-            "logged_at", f"{date}T00:00:00"
-        ).lt(
-            "logged_at", f"{date}T23:59:59"
-        ).execute()
-        
-        meals = meals_response.data or []
-        calories_consumed = sum(m["calories"] for m in meals)
-        protein = sum(float(m["protein"]) for m in meals)
-        fat = sum(float(m["fat"]) for m in meals)
-        carbs = sum(float(m["carbs"]) for m in meals)
-        
-        # 運動データ
-        exercises_response = supabase.table("exercise_logs").select("*").eq(
-            "user_id", current_user["id"]
-        ).gte(
-            "logged_at", f"{date}T00:00:00"
-        ).lt(
-            "logged_at", f"{date}T23:59:59"
-        ).execute()
-        
-        exercises = exercises_response.data or []
-        calories_burned = sum(e["calories_burned"] for e in exercises)
-        
-        # 体重データ
-        weight_response = supabase.table("weight_logs").select("weight_kg").eq(
-            "user_id", current_user["id"]
-        ).gte(
-            "logged_at", f"{date}T00:00:00"
-        ).lt(
-            "logged_at", f"{date}T23:59:59"
-        ).order("logged_at", desc=True).limit(1).execute()
-        
-        weight = None
-        if weight_response.data:
-            weight = float(weight_response.data[0]["weight_kg"])
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+        days = await load_range(current_user["id"], day, day)
+        return to_daily_summary(days[day.isoformat()])
         
-        return DailySummary(
-            date=date,
-            calories_consumed=calories_consumed,
-            calories_burned=calories_burned,
-            net_calories=calories_consumed - calories_burned,
-            protein=round(protein, 1),
-            fat=round(fat, 1),
-            carbs=round(carbs, 1),
-            meal_count=len(meals),
-            exercise_count=len(exercises),
-            weight=weight
+    except DeadlineExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
         )
-        
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -134,6 +133,7 @@ async def get_weekly_summary(
 ):
     """
     週次サマリーを取得
+    （集計テーブルの7行、または食事・運動・体重をそれぞれ1回のクエリで取得して日別に集計）
     """
     try:
         if start_date:
@@ -145,78 +145,14 @@ async def get_weekly_summary(
         end = start + timedelta(days=6)
         
         # 日別データを取得
-        daily_data = []
-        total_calories_consumed = 0
-        total_calories_burned = 0
-        total_protein = 0
-        total_fat = 0
-        total_carbs = 0
+        days = await load_range(current_user["id"], start, end)
+        daily_data = [to_daily_summary(totals) for totals in days.values()]
         
-        for i in range(7):
-            current_date = start + timedelta(days=i)
-            date_str = current_date.isoformat()
-            
-            # 各日のサマリーを取得（内部呼び出し）
-            supabase = get_supabase_admin()
-            
-            # 食事
-            meals_response = supabase.table("meal_logs").select("*").eq(
-                "user_id", current_user["id"]
-            ).gte(
-                "logged_at", f"{date_str}T00:00:00"
-            ).lt(
-                "logged_at", f"{date_str}T23:59:59"
-            ).execute()
-            
-            meals = meals_response.data or []
-            day_calories = sum(m["calories"] for m in meals)
-            day_protein = sum(float(m["protein"]) for m in meals)
-            day_fat = sum(float(m["fat"]) for m in meals)
-            day_carbs = sum(float(m["carbs"]) for m in meals)
-            
-            # 運動
-            exercises_response = supabase.table("exercise_logs").select("*").eq(
-                "user_id", current_user["id"]
-            ).gte(
-                "logged_at", f"{date_str}T00:00:00"
-            ).lt(
-                "logged_at", f"{date_str}T23:59:59"
-            ).execute()
-            
-            exercises = exercises_response.data or []
-            day_burned = sum(e["calories_burned"] for e in exercises)
-            
-            # 体重
-            weight_response = supabase.table("weight_logs").select("weight_kg").eq(
-                "user_id", current_user["id"]
-            ).gte(
-                "logged_at", f"{date_str}T00:00:00"
-            ).lt(
-                "logged_at", f"{date_str}T23:59:59"
-            ).order("logged_at", desc=True).limit(1).execute()
-            
-            weight = None
-            if weight_response.data:
-                weight = float(weight_response.data[0]["weight_kg"])
-            
-            daily_data.append(DailySummary(
-                date=date_str,
-                calories_consumed=day_calories,
-                calories_burned=day_burned,
-                net_calories=day_calories - day_burned,
-                protein=round(day_protein, 1),
-                fat=round(day_fat, 1),
-                carbs=round(day_carbs, 1),
-                meal_count=len(meals),
-                exercise_count=len(exercises),
-                weight=weight
-            ))
-            
-            total_calories_consumed += day_calories
-            total_calories_burned += day_burned
-            total_protein += day_protein
-            total_fat += day_fat
-            total_carbs += day_carbs
+        total_calories_consumed = sum(totals.calories_consumed for totals in days.values())
+        total_calories_burned = sum(totals.calories_burned for totals in days.values())
+        total_protein = sum(totals.protein for totals in days.values())
+        total_fat = sum(totals.fat for totals in days.values())
+        total_carbs = sum(totals.carbs for totals in days.values())
         
         # 体重変化を計算
         weights_with_data = [d for d in daily_data if d.weight is not None]
@@ -238,6 +174,11 @@ async def get_weekly_summary(
             daily_data=daily_data
         )
         
+    except DeadlineExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -250,73 +191,108 @@ async def get_today_progress(
     current_user: dict = Depends(get_current_user)
 ):
     """
-    今日の目標達成度を取得
+    今日の目標達成度を取得（記録・プロフィールを書き込むまでキャッシュ）
     """
     try:
-        supabase = get_supabase_admin()
-        today_str = date.today().isoformat()
-        
-        # プロフィール（目標値）
-        profile_response = supabase.table("profiles").select(
-            "daily_calorie_goal, daily_protein_goal, daily_fat_goal, daily_carbs_goal"
-        ).eq("id", current_user["id"]).single().execute()
-        
-        goals = profile_response.data or {}
-        calorie_goal = goals.get("daily_calorie_goal", 2000)
-        protein_goal = goals.get("daily_protein_goal", 60)
-        fat_goal = goals.get("daily_fat_goal", 65)
-        carbs_goal = goals.get("daily_carbs_goal", 300)
-        
-        # 今日の食事
-        meals_response = supabase.table("meal_logs").select("*").eq(
-            "user_id", current_user["id"]
-        ).gte(
-            "logged_at", f"{today_str}T00:00:00"
-        ).lt(
-            "logged_at", f"{today_str}T23:59:59"
-        ).execute()
-        
-        meals = meals_response.data or []
-        calories_consumed = sum(m["calories"] for m in meals)
-        protein_consumed = sum(float(m["protein"]) for m in meals)
-        fat_consumed = sum(float(m["fat"]) for m in meals)
-        carbs_consumed = sum(float(m["carbs"]) for m in meals)
-        
-        # 今日の運動
-        exercises_response = supabase.table("exercise_logs").select("calories_burned").eq(
-            "user_id", current_user["id"]
-        ).gte(
-            "logged_at", f"{today_str}T00:00:00"
-        ).lt(
-            "logged_at", f"{today_str}T23:59:59"
-        ).execute()
-        
-        exercises = exercises_response.data or []
-        calories_burned = sum(e["calories_burned"] for e in exercises)
-        
-        # 進捗率を計算
-        def calc_progress(consumed, goal):
-            if goal == 0:
-                return 0
-            return min(round((consumed / goal) * 100, 1), 100)
+        today = date.today()
+        return await day_cache.get_or_load(
+            current_user["id"], TODAY_PROGRESS, today.isoformat(),
+            lambda: load_today_progress(current_user["id"], today),
+            cacheable=lambda progress: not progress.unavailable
+        )
         
-        return GoalProgress(
-            calorie_goal=calorie_goal,
-            calories_consumed=calories_consumed,
-            calories_remaining=max(0, calorie_goal - calories_consumed),
-            calories_burned=calories_burned,
-            net_calories=calories_consumed - calories_burned,
-            protein_goal=protein_goal,
-            protein_consumed=round(protein_consumed, 1),
-            fat_goal=fat_goal,
-            fat_consumed=round(fat_consumed, 1),
-            carbs_goal=carbs_goal,
-            carbs_consumed=round(carbs_consumed, 1),
-            calorie_progress_percent=calc_progress(calories_consumed, calorie_goal),
-            protein_progress_percent=calc_progress(protein_consumed, protein_goal),
-            fat_progress_percent=calc_progress(fat_consumed, fat_goal),
-            carbs_progress_percent=calc_progress(carbs_consumed, carbs_goal)
+    except DeadlineExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
         )
+
+
+async def load_today_progress(user_id: str, today: date) -> GoalProgress:
+    """
+    目標達成度をプロフィールと日別集計から作る
+    プロフィール（目標値）と今日の食事・運動は並行取得し、目標値が取れなければ既定値で返す
+    """
+    db = get_db()
+    
+    results, unavailable = await gather_with_deadline(
+        {
+            "profile": db.execute(db.table("profiles").select(
+                "daily_calorie_goal, daily_protein_goal, daily_fat_goal, daily_carbs_goal"
+            ).eq("id", user_id).single()),
+            "totals": load_range(user_id, today, today, include_weight=False)
+        },
+        deadline=settings.summary_deadline_seconds,
+        optional=("profile",)
+    )
+    
+    # プロフィール（目標値）
+    goals = (results["profile"].data or {}) if "profile" in results else {}
+    calorie_goal = goals.get("daily_calorie_goal", 2000)
+    protein_goal = goals.get("daily_protein_goal", 60)
+    fat_goal = goals.get("daily_fat_goal", 65)
+    carbs_goal = goals.get("daily_carbs_goal", 300)
+    
+    # 今日の食事・運動
+    totals = results["totals"][today.isoformat()]
+    unavailable = unavailable + totals.unavailable
+    calories_consumed = totals.calories_consumed
+    protein_consumed = totals.protein
+    fat_consumed = totals.fat
+    carbs_consumed = totals.carbs
+    calories_burned = totals.calories_burned
+    
+    # 進捗率を計算
+    def calc_progress(consumed, goal):
+        if goal == 0:
+            return 0
+        return min(round((consumed / goal) * 100, 1), 100)
+    
+    return GoalProgress(
+        calorie_goal=calorie_goal,
+        calories_consumed=calories_consumed,
+        calories_remaining=max(0, calorie_goal - calories_consumed),
+        calories_burned=calories_burned,
+        net_calories=calories_consumed - calories_burned,
+        protein_goal=protein_goal,
+        protein_consumed=round(protein_consumed, 1),
+        fat_goal=fat_goal,
+        fat_consumed=round(fat_consumed, 1),
+        carbs_goal=carbs_goal,
+        carbs_consumed=round(carbs_consumed, 1),
+        calorie_progress_percent=calc_progress(calories_consumed, calorie_goal),
+        protein_progress_percent=calc_progress(protein_consumed, protein_goal),
+        fat_progress_percent=calc_progress(fat_consumed, fat_goal),
+        carbs_progress_percent=calc_progress(carbs_consumed, carbs_goal),
+        unavailable=unavailable
+    )
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    """
+    日別サマリーのキャッシュのヒット率などを取得
+    """
+    return day_cache.stats()
+
+
+@router.post("/rollup/rebuild")
+async def rebuild_daily_totals(
+    days: int = Query(90, ge=1, le=3650, description="作り直す日数（今日から遡る）"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    自分の日別集計を元の記録から作り直す（集計がずれた場合の修復用）
+    """
+    try:
+        result = await daily_totals.backfill(days=days, user_id=current_user["id"])
+        day_cache.invalidate(current_user["id"], date.today().isoformat())
+        return result
         
     except Exception as e:
         raise HTTPException(
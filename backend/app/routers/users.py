@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends, status
-from app.database import get_supabase_admin
+from app.database import get_db, get_supabase_admin
 from app.middleware.auth import get_current_user
 from app.models.user import ProfileResponse, ProfileUpdate
+from app.services.day_cache import day_cache
+from datetime import date
+import asyncio
 
 router = APIRouter(prefix="/users", tags=["ユーザー"])
 
@@ -12,8 +15,8 @@ async def get_my_profile(current_user: dict = Depends(get_current_user)):
     自分のプロフィールを取得
     """
     try:
-        supabase = get_supabase_admin()
-        response = supabase.table("profiles").select("*").eq("id", current_user["id"]).single().execute()
+        db = get_db()
+        response = await db.execute(db.table("profiles").select("*").eq("id", current_user["id"]).single())
         
         if response.data is None:
             raise HTTPException(
@@ -41,7 +44,7 @@ async def update_my_profile(
     自分のプロフィールを更新
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         # None以外の値のみ更新
         update_data = {k: v for k, v in profile.model_dump().items() if v is not None}
@@ -52,7 +55,7 @@ async def update_my_profile(
                 detail="No data to update"
             )
         
-        response = supabase.table("profiles").update(update_data).eq("id", current_user["id"]).execute()
+        response = await db.execute(db.table("profiles").update(update_data).eq("id", current_user["id"]))
         
         if not response.data:
             raise HTTPException(
@@ -60,6 +63,9 @@ async def update_my_profile(
                 detail="Profile not found"
             )
         
+        # 目標値が変わると今日の進捗も変わる
+        day_cache.invalidate(current_user["id"], date.today().isoformat())
+        
         return ProfileResponse(**response.data[0])
         
     except HTTPException:
@@ -77,13 +83,13 @@ async def delete_my_account(current_user: dict = Depends(get_current_user)):
     自分のアカウントを削除
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         # プロフィールを削除（CASCADE設定により関連データも削除される）
-        supabase.table("profiles").delete().eq("id", current_user["id"]).execute()
+        await db.execute(db.table("profiles").delete().eq("id", current_user["id"]))
         
-        # 認証ユーザーを削除
-        supabase.auth.admin.delete_user(current_user["id"])
+        # 認証ユーザーを削除（Auth APIは同期クライアントなのでスレッドで実行）
+        await asyncio.to_thread(get_supabase_admin().auth.admin.delete_user, current_user["id"])
         
         return {"message": "Account deleted successfully"}
         
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, status
-from app.database import get_supabase_admin
+from app.database import get_db
 from app.middleware.auth import get_current_user
+from app.services.daily_totals import previous_row_needed, record_weight_change
+from app.services.day_cache import day_cache
 from app.models.weight import (
     WeightLogCreate, WeightLogUpdate, WeightLogResponse, WeightHistory
 )
@@ -19,7 +21,7 @@ async def create_weight_log(
     体重を記録
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         data = weight.model_dump()
         data["user_id"] = current_user["id"]
@@ -29,7 +31,9 @@ async def create_weight_log(
         else:
             data["logged_at"] = datetime.now().isoformat()
         
-        response = supabase.table("weight_logs").insert(data).execute()
+        response = await db.execute(db.table("weight_logs").insert(data))
+        await record_weight_change(current_user["id"], None, response.data[0])
+        day_cache.invalidate_logs(current_user["id"], response.data[0])
         
         return WeightLogResponse(**response.data[0])
         
@@ -51,15 +55,15 @@ async def get_weight_logs(
     体重記録を取得
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        query = supabase.table("weight_logs").select("*").eq("user_id", current_user["id"])
+        query = db.table("weight_logs").select("*").eq("user_id", current_user["id"])
         
         if start_date and end_date:
             query = query.gte("logged_at", f"{start_date}T00:00:00").lte("logged_at", f"{end_date}T23:59:59")
         
         query = query.order("logged_at", desc=True).limit(limit)
-        response = query.execute()
+        response = await db.execute(query)
         
         return [WeightLogResponse(**item) for item in response.data]
         
@@ -79,19 +83,19 @@ async def get_weight_history(
     体重履歴を取得（集計付き）
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         # 体重記録を取得
-        response = supabase.table("weight_logs").select("*").eq(
+        response = await db.execute(db.table("weight_logs").select("*").eq(
             "user_id", current_user["id"]
-        ).order("logged_at", desc=True).limit(days).execute()
+        ).order("logged_at", desc=True).limit(days))
         
         logs = [WeightLogResponse(**item) for item in response.data]
         
         # 目標体重を取得
-        profile_response = supabase.table("profiles").select("target_weight_kg").eq(
+        profile_response = await db.execute(db.table("profiles").select("target_weight_kg").eq(
             "id", current_user["id"]
-        ).single().execute()
+        ).single())
         
         target_weight = None
         if profile_response.data:
@@ -127,11 +131,11 @@ async def get_latest_weight(
     最新の体重記録を取得
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        response = supabase.table("weight_logs").select("*").eq(
+        response = await db.execute(db.table("weight_logs").select("*").eq(
             "user_id", current_user["id"]
-        ).order("logged_at", desc=True).limit(1).execute()
+        ).order("logged_at", desc=True).limit(1))
         
         if not response.data:
             return None
@@ -155,18 +159,28 @@ async def update_weight_log(
     体重記録を更新
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
         update_data = {k: v for k, v in weight.model_dump().items() if v is not None}
         
         if "logged_at" in update_data:
             update_data["logged_at"] = update_data["logged_at"].isoformat()
         
-        response = supabase.table("weight_logs").update(update_data).eq(
+        # 変更前の記録（日別集計の差分・日付が変わる場合のキャッシュ無効化用）
+        previous = None
+        if previous_row_needed(update_data):
+            before = await db.execute(db.table("weight_logs").select("*").eq(
+                "id", weight_id
+            ).eq(
+                "user_id", current_user["id"]
+            ))
+            previous = before.data[0] if before.data else None
+        
+        response = await db.execute(db.table("weight_logs").update(update_data).eq(
             "id", weight_id
         ).eq(
             "user_id", current_user["id"]
-        ).execute()
+        ))
         
         if not response.data:
             raise HTTPException(
@@ -174,6 +188,9 @@ async def update_weight_log(
                 detail="Weight log not found"
             )
         
+        await record_weight_change(current_user["id"], previous, response.data[0])
+        day_cache.invalidate_logs(current_user["id"], previous, response.data[0])
+        
         return WeightLogResponse(**response.data[0])
         
     except HTTPException:
@@ -194,13 +211,16 @@ async def delete_weight_log(
     体重記録を削除
     """
     try:
-        supabase = get_supabase_admin()
+        db = get_db()
         
-        supabase.table("weight_logs").delete().eq(
+        response = await db.execute(db.table("weight_logs").delete().eq(
             "id", weight_id
         ).eq(
             "user_id", current_user["id"]
-        ).execute()
+        ))
+        if response.data:
+            await record_weight_change(current_user["id"], response.data[0], None)
+            day_cache.invalidate_logs(current_user["id"], response.data[0])
         
         return {"message": "Weight log deleted successfully"}
         
@@ -0,0 +1,159 @@
+"""
+チャットの文脈管理
+会話をトークン予算内に収める:
+- 直近のターンは予算内でそのまま残す（1メッセージの長さも上限あり）
+- 予算から外れた古いターンは会話ごとの要約に畳み込む（(ユーザー, conversation_id) 単位でキャッシュ）
+- conversation_idがあればサーバー側で履歴を持つので、クライアントは毎回履歴を送らなくてよい
+  （他人の会話を読めないよう、ログインしたユーザーの会話だけを保持する）
+"""
+
+from app.config import get_settings
+from app.services.cache import TTLCache
+from pydantic import BaseModel
+from typing import List, Optional, Tuple
+import logging
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# 1ターンあたりの付随トークン（「ユーザー: 」などの見出し・改行）
+_TURN_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（日本語などは1文字≒1トークン、ASCIIは4文字≒1トークン）"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def clip_message(text: str, max_chars: int = settings.chat_message_max_chars) -> str:
+    """長すぎるメッセージは先頭だけ残す"""
+    return text if len(text) <= max_chars else text[:max_chars] + "…"
+
+
+class ChatContext(BaseModel):
+    """プロンプトに入れる文脈"""
+    summary: str = ""          # これまでの会話の要約
+    turns: List[dict] = []     # 直近のターン（そのまま入れる）
+    folded: List[dict] = []    # 予算から外れたターン（要約に畳み込む対象）
+
+
+class ConversationState(BaseModel):
+    """サーバー側で保持する会話（要約済みのターンは持たない）"""
+    summary: str = ""
+    turns: List[dict] = []
+    folding: bool = False
+
+
+def split_by_budget(
+    turns: List[dict],
+    token_budget: int = settings.chat_context_token_budget,
+    max_turns: int = settings.chat_recent_turns_max
+) -> Tuple[List[dict], List[dict]]:
+    """
+    新しい方から予算に収まるだけ残す → (古いターン, 直近のターン)
+    最新の1ターンは予算を超えても必ず残す
+    """
+    recent = []
+    used = 0
+    for turn in reversed(turns):
+        message = clip_message(turn.get("message", ""))
+        cost = estimate_tokens(message) + _TURN_OVERHEAD_TOKENS
+        if len(recent) >= max_turns or (recent and used + cost > token_budget):
+            break
+        recent.append({"is_user": bool(turn.get("is_user")), "message": message})
+        used += cost
+    recent.reverse()
+    return turns[:len(turns) - len(recent)], recent
+
+
+class ConversationStore:
+    """(ユーザー, conversation_id) → 会話（要約と未要約のターン）"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self._cache = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    @staticmethod
+    def _key(user_id: Optional[str], conversation_id: Optional[str]) -> Optional[Tuple[str, str]]:
+        """会話のキー（ユーザーが分からない会話は保持しない）"""
+        return (user_id, conversation_id) if user_id and conversation_id else None
+
+    def get(self, user_id: Optional[str], conversation_id: Optional[str]) -> Optional[ConversationState]:
+        key = self._key(user_id, conversation_id)
+        return self._cache.get(key) if key else None
+
+    def build_context(
+        self,
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+        chat_history: Optional[list]
+    ) -> ChatContext:
+        """
+        プロンプト用の文脈を組み立てる
+        - サーバー側にそのユーザーの会話があればそれを使う（クライアントの履歴は無視）
+        - なければクライアントの履歴を使い、ユーザーとconversation_idがあれば保存する
+        """
+        key = self._key(user_id, conversation_id)
+        state = self._cache.get(key) if key else None
+        if state is None:
+            history = list(chat_history or [])[-settings.chat_history_max_items:]
+            state = ConversationState(turns=[
+                {"is_user": bool(msg.get("is_user")), "message": msg.get("message", "")}
+                for msg in history
+            ])
+            if key:
+                self._cache.set(key, state)
+
+        folded, recent = split_by_budget(state.turns)
+        return ChatContext(summary=state.summary, turns=recent, folded=folded)
+
+    def append(self, user_id: Optional[str], conversation_id: Optional[str], message: str, reply: str):
+        """応答が返ったターンを会話に追加"""
+        key = self._key(user_id, conversation_id)
+        if not key:
+            return
+        state = self._cache.get(key) or ConversationState()
+        state.turns.append({"is_user": True, "message": message})
+        state.turns.append({"is_user": False, "message": reply})
+        # 要約に失敗し続けても際限なく伸びないようにする
+        state.turns = state.turns[-settings.chat_history_max_items:]
+        self._cache.set(key, state)
+
+    def start_folding(self, user_id: str, conversation_id: str) -> Optional[Tuple[str, List[dict]]]:
+        """
+        要約に畳み込むターンがあれば (今の要約, 畳み込むターン) を返す
+        同じ会話の畳み込みは同時に1つだけ
+        """
+        state = self.get(user_id, conversation_id)
+        if state is None or state.folding:
+            return None
+        folded, _ = split_by_budget(state.turns)
+        if not folded:
+            return None
+        state.folding = True
+        return state.summary, folded
+
+    def finish_folding(self, user_id: str, conversation_id: str, summary: Optional[str], folded: List[dict]):
+        """
+        要約を差し替えて畳み込んだターンを捨てる（summaryがNoneなら失敗として何もしない）
+        要約中にも append でターンが増えたり先頭が切り詰められたりするので、位置ではなく
+        start_folding が返したターンそのもの（同一オブジェクト）を取り除く
+        """
+        state = self.get(user_id, conversation_id)
+        if state is None:
+            return
+        state.folding = False
+        if summary is None:
+            return
+        state.summary = summary[:settings.chat_summary_max_chars]
+        folded_ids = {id(turn) for turn in folded}
+        state.turns = [turn for turn in state.turns if id(turn) not in folded_ids]
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+conversation_store = ConversationStore(
+    max_entries=settings.conversation_cache_max_entries,
+    ttl_seconds=settings.conversation_cache_ttl_seconds
+)
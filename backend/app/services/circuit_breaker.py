@@ -0,0 +1,139 @@
+"""
+サーキットブレーカーとリトライ予算
+Geminiが不調な間は呼び出しを即失敗させて既存のフォールバックに回し、
+リトライは全体の予算内に抑えて障害を増幅させない
+"""
+
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """ブレーカーが開いているため呼び出さなかった"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed → open → half_open の3状態ブレーカー
+
+    - closed: 連続失敗が failure_threshold に達したら open
+    - open: recovery_seconds の間は全て即失敗、経過後 half_open
+    - half_open: half_open_max_calls 件だけ試行を通し、成功で closed・失敗で open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_seconds: float = 30,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self.short_circuited = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_seconds:
+            self._state = self.HALF_OPEN
+            self._half_open_in_flight = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """呼び出してよいか（half_openでは試行枠を1つ使う）"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+            self._half_open_in_flight += 1
+            return True
+        self.short_circuited += 1
+        return False
+
+    def record_success(self):
+        if self._state == self.HALF_OPEN:
+            logger.info(f"Circuit closed: {self.name}")
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._half_open_in_flight = 0
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+        if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def record_cancel(self):
+        """結果が出ないまま終わった呼び出し（ヘッジで負けた等）"""
+        if self._state == self.HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def _open(self):
+        if self._state != self.OPEN:
+            logger.warning(f"Circuit opened: {self.name}")
+            self.times_opened += 1
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_in_flight = 0
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited
+        }
+
+
+class RetryBudget:
+    """
+    全体のリトライ予算（トークンバケット）
+
+    - 通常の呼び出し1回ごとに ratio トークンを積み、リトライ1回で1トークン使う
+    - 障害時もリトライは呼び出し数の ratio 倍程度に収まる
+    """
+
+    def __init__(self, ratio: float = 0.1, min_tokens: float = 10, max_tokens: float = 100):
+        self.ratio = ratio
+        self.max_tokens = max(max_tokens, min_tokens)
+        self._tokens = min_tokens
+        self.retries = 0
+        self.denied = 0
+
+    def deposit(self):
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self._tokens >= 1:
+            self._tokens -= 1
+            self.retries += 1
+            return True
+        self.denied += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "tokens": round(self._tokens, 2),
+            "retries": self.retries,
+            "denied": self.denied
+        }
+
+
+def backoff_delay(attempt: int, base_seconds: float = 0.5, max_seconds: float = 8.0) -> float:
+    """指数バックオフ（フルジッター）: 0〜min(max, base * 2^attempt) 秒"""
+    return random.uniform(0, min(max_seconds, base_seconds * (2 ** attempt)))
@@ -0,0 +1,136 @@
+"""
+日別集計（期間まとめて取得）
+食事・運動・体重を期間全体でテーブルごとに1回だけ取得し、メモリ上で日ごとに振り分ける
+（週次サマリーで「7日 × 3テーブル」の直列クエリにならないように）
+"""
+
+from app.database import get_db
+from app.services.fan_out import gather_with_deadline
+from datetime import date, timedelta
+from pydantic import BaseModel
+from typing import Dict, Iterable, List, Optional
+
+# 集計に必要な列だけ取得
+MEAL_COLUMNS = "calories, protein, fat, carbs, sugar, fiber, sodium, logged_at"
+EXERCISE_COLUMNS = "calories_burned, logged_at"
+WEIGHT_COLUMNS = "weight_kg, logged_at"
+
+# 1回に取得する行数（PostgRESTの最大行数以下）
+PAGE_SIZE = 1000
+
+
+class DayTotals(BaseModel):
+    """1日分の集計"""
+    date: str
+    calories_consumed: int = 0
+    calories_burned: int = 0
+    protein: float = 0
+    fat: float = 0
+    carbs: float = 0
+    sugar: float = 0
+    fiber: float = 0
+    sodium: float = 0
+    meal_count: int = 0
+    exercise_count: int = 0
+    weight: Optional[float] = None  # その日の最後の記録
+    unavailable: List[str] = []  # 取得できなかった任意の項目（部分的な結果）
+
+    @property
+    def net_calories(self) -> int:
+        return self.calories_consumed - self.calories_burned
+
+
+def log_date(logged_at: str) -> str:
+    """記録の日付（アプリが記録した logged_at の日付部分）"""
+    return logged_at[:10]
+
+
+async def fetch_all(query) -> List[dict]:
+    """PAGE_SIZE ずつ取得して全行を返す（期間が長くても最大行数で切れないように）"""
+    db = get_db()
+    rows: List[dict] = []
+    while True:
+        response = await db.execute(query.range(len(rows), len(rows) + PAGE_SIZE - 1))
+        page = response.data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+
+
+async def aggregate_range(
+    user_id: str,
+    start: date,
+    end: date,
+    include_exercises: bool = True,
+    include_weight: bool = True,
+    deadline: Optional[float] = None,
+    optional: Iterable[str] = ()
+) -> Dict[str, DayTotals]:
+    """
+    start〜end（両端を含む）の日別集計
+    戻り値は日付（YYYY-MM-DD）→ DayTotals（記録がない日も含む、日付順）
+    
+    テーブルごとのクエリ（"meals" / "exercises" / "weight"）は並行実行し、deadline 秒で打ち切る
+    optional に入れたクエリが失敗した場合は、その分を除いて各日の unavailable に記録する
+    """
+    db = get_db()
+    since = f"{start.isoformat()}T00:00:00"
+    until = f"{(end + timedelta(days=1)).isoformat()}T00:00:00"
+    days = {
+        (start + timedelta(days=i)).isoformat(): DayTotals(date=(start + timedelta(days=i)).isoformat())
+        for i in range((end - start).days + 1)
+    }
+
+    queries = {
+        "meals": fetch_all(db.table("meal_logs").select(MEAL_COLUMNS).eq(
+            "user_id", user_id
+        ).gte("logged_at", since).lt("logged_at", until).order("logged_at"))
+    }
+    if include_exercises:
+        queries["exercises"] = fetch_all(db.table("exercise_logs").select(EXERCISE_COLUMNS).eq(
+            "user_id", user_id
+        ).gte("logged_at", since).lt("logged_at", until).order("logged_at"))
+    if include_weight:
+        # 古い順に並べて、日ごとに最後の記録で上書き
+        queries["weight"] = fetch_all(db.table("weight_logs").select(WEIGHT_COLUMNS).eq(
+            "user_id", user_id
+        ).gte("logged_at", since).lt("logged_at", until).order("logged_at"))
+
+    results, unavailable = await gather_with_deadline(queries, deadline, optional)
+
+    for meal in results.get("meals", []):
+        day = days.get(log_date(meal["logged_at"]))
+        if day is None:
+            continue
+        day.calories_consumed += meal["calories"]
+        day.protein += float(meal["protein"])
+        day.fat += float(meal["fat"])
+        day.carbs += float(meal["carbs"])
+        day.sugar += float(meal.get("sugar") or 0)
+        day.fiber += float(meal.get("fiber") or 0)
+        day.sodium += float(meal.get("sodium") or 0)
+        day.meal_count += 1
+
+    for exercise in results.get("exercises", []):
+        day = days.get(log_date(exercise["logged_at"]))
+        if day is None:
+            continue
+        day.calories_burned += exercise["calories_burned"]
+        day.exercise_count += 1
+
+    for weight in results.get("weight", []):
+        day = days.get(log_date(weight["logged_at"]))
+        if day is not None:
+            day.weight = float(weight["weight_kg"])
+
+    if unavailable:
+        for day in days.values():
+            day.unavailable = list(unavailable)
+
+    return days
+
+
+async def aggregate_day(user_id: str, day: date, include_weight: bool = True) -> DayTotals:
+    """1日分の集計"""
+    days = await aggregate_range(user_id, day, day, include_weight=include_weight)
+    return days[day.isoformat()]
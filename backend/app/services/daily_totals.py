@@ -0,0 +1,272 @@
+"""
+日別集計テーブル（daily_totals）
+食事・運動・体重の記録を書き込むたびに、その日の合計を差分で更新する
+（統計は記録の件数によらず、期間の日数分の行を読むだけで済む）
+
+- 食事・運動: 増減分を足し込む（Postgres の daily_totals_add で1文で足すので、複数プロセスでも増分を失わない）
+- 体重: その日の最後の記録を取り直す（daily_totals_refresh_weight）
+- 更新の失敗でずれた場合は rebuild / backfill で元の記録から作り直す
+
+    python -m app.services.daily_totals [日数]   # 全ユーザーを作り直す
+
+テーブル定義と有効化の手順は migrations/001_daily_totals.sql、更新用ファンクションは 002_daily_totals_functions.sql
+（既定では無効。backfill した範囲は daily_totals_coverage に記録し、範囲外の日は元の記録から集計する）
+"""
+
+from app.config import get_settings
+from app.database import get_db
+from app.services.daily_stats import DayTotals, aggregate_range, fetch_all, log_date
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+import asyncio
+import logging
+import sys
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+TABLE = "daily_totals"
+COVERAGE_TABLE = "daily_totals_coverage"
+
+# 記録の列 → daily_totals の列
+MEAL_FIELDS = {
+    "calories": "calories_consumed",
+    "protein": "protein",
+    "fat": "fat",
+    "carbs": "carbs",
+    "sugar": "sugar",
+    "fiber": "fiber",
+    "sodium": "sodium",
+}
+EXERCISE_FIELDS = {
+    "calories_burned": "calories_burned",
+}
+INT_FIELDS = ("calories_consumed", "calories_burned", "meal_count", "exercise_count")
+
+
+def _row_to_totals(row: dict) -> DayTotals:
+    return DayTotals(
+        date=row["date"],
+        calories_consumed=row["calories_consumed"],
+        calories_burned=row["calories_burned"],
+        protein=float(row["protein"]),
+        fat=float(row["fat"]),
+        carbs=float(row["carbs"]),
+        sugar=float(row["sugar"]),
+        fiber=float(row["fiber"]),
+        sodium=float(row["sodium"]),
+        meal_count=row["meal_count"],
+        exercise_count=row["exercise_count"],
+        weight=float(row["last_weight"]) if row.get("last_weight") is not None else None
+    )
+
+
+def _totals_to_row(user_id: str, totals: DayTotals) -> dict:
+    return {
+        "user_id": user_id,
+        "date": totals.date,
+        "calories_consumed": totals.calories_consumed,
+        "calories_burned": totals.calories_burned,
+        "protein": round(totals.protein, 2),
+        "fat": round(totals.fat, 2),
+        "carbs": round(totals.carbs, 2),
+        "sugar": round(totals.sugar, 2),
+        "fiber": round(totals.fiber, 2),
+        "sodium": round(totals.sodium, 2),
+        "meal_count": totals.meal_count,
+        "exercise_count": totals.exercise_count,
+        "last_weight": totals.weight,
+        "updated_at": datetime.now().isoformat()
+    }
+
+
+# MARK: - 読み取り
+
+async def covered_from(user_id: str) -> Optional[date]:
+    """backfill 済みの範囲の始まり（未実施なら None）"""
+    db = get_db()
+    response = await db.execute(db.table(COVERAGE_TABLE).select("covered_from").eq("user_id", user_id))
+    return date.fromisoformat(response.data[0]["covered_from"]) if response.data else None
+
+
+async def read_range(
+    user_id: str,
+    start: date,
+    end: date,
+    include_weight: bool = True,
+    deadline: Optional[float] = None,
+    optional: Iterable[str] = ()
+) -> Dict[str, DayTotals]:
+    """
+    start〜end（両端を含む）の日別集計（日付順）
+    - backfill 済みの日（covered_from 以降）: 集計テーブルから（行がない日は記録なしで0）
+    - それより前の日: 元の記録から集計（include_weight / deadline / optional は aggregate_range に渡す）
+    """
+    covered = await covered_from(user_id)
+    days: Dict[str, DayTotals] = {}
+
+    if covered is None or covered > start:
+        raw_end = end if covered is None else min(end, covered - timedelta(days=1))
+        days.update(await aggregate_range(
+            user_id, start, raw_end,
+            include_weight=include_weight,
+            deadline=deadline,
+            optional=optional
+        ))
+
+    if covered is not None and covered <= end:
+        rollup_start = max(start, covered)
+        db = get_db()
+        response = await db.execute(db.table(TABLE).select("*").eq(
+            "user_id", user_id
+        ).gte("date", rollup_start.isoformat()).lte("date", end.isoformat()))
+        rows = {row["date"]: row for row in response.data or []}
+        for i in range((end - rollup_start).days + 1):
+            day = (rollup_start + timedelta(days=i)).isoformat()
+            days[day] = _row_to_totals(rows[day]) if day in rows else DayTotals(date=day)
+
+    return days
+
+
+async def read_day(user_id: str, day: date) -> DayTotals:
+    days = await read_range(user_id, day, day)
+    return days[day.isoformat()]
+
+
+# MARK: - 差分更新
+
+async def _apply(user_id: str, day: str, delta: Dict[str, float]):
+    """その日の行に増減分を足し込む（行がなければ作る。読み出し→加算→書き戻しはせず、Postgres側で1文で足す）"""
+    db = get_db()
+    params = {"p_user_id": user_id, "p_date": day}
+    for field, amount in delta.items():
+        params[f"p_{field}"] = int(round(amount)) if field in INT_FIELDS else round(amount, 2)
+    await db.execute(db.rpc("daily_totals_add", params))
+
+
+def previous_row_needed(update_data: dict) -> bool:
+    """
+    更新前の記録を読む必要があるか
+    集計が有効なら差分に、日付（logged_at）が変わるなら元の日のキャッシュ無効化に使う
+    """
+    return settings.daily_totals_enabled or "logged_at" in update_data
+
+
+def _deltas(old: Optional[dict], new: Optional[dict], fields: Dict[str, str], count_field: str) -> Dict[str, Dict[str, float]]:
+    """変更前後の記録 → 日付ごとの増減分"""
+    deltas: Dict[str, Dict[str, float]] = {}
+    for row, sign in ((old, -1), (new, 1)):
+        if not row:
+            continue
+        delta = deltas.setdefault(log_date(row["logged_at"]), {})
+        for source, target in fields.items():
+            delta[target] = delta.get(target, 0) + sign * float(row.get(source) or 0)
+        delta[count_field] = delta.get(count_field, 0) + sign
+    # 同じ日の中で打ち消し合った分は書き込まない
+    return {
+        day: delta for day, delta in deltas.items()
+        if any(abs(amount) > 1e-9 for amount in delta.values())
+    }
+
+
+async def _record_change(user_id: str, old: Optional[dict], new: Optional[dict], fields: Dict[str, str], count_field: str):
+    for day, delta in _deltas(old, new, fields, count_field).items():
+        try:
+            await _apply(user_id, day, delta)
+        except Exception as e:
+            # 記録の書き込み自体は成功しているので、集計のずれは rebuild で直す
+            logger.warning(f"daily_totals update failed: user={user_id} date={day}: {e}")
+
+
+async def record_meal_change(user_id: str, old: Optional[dict], new: Optional[dict]):
+    """食事の作成（old=None）・更新・削除（new=None）を反映"""
+    if settings.daily_totals_enabled:
+        await _record_change(user_id, old, new, MEAL_FIELDS, "meal_count")
+
+
+async def record_exercise_change(user_id: str, old: Optional[dict], new: Optional[dict]):
+    """運動の作成（old=None）・更新・削除（new=None）を反映"""
+    if settings.daily_totals_enabled:
+        await _record_change(user_id, old, new, EXERCISE_FIELDS, "exercise_count")
+
+
+async def record_weight_change(user_id: str, old: Optional[dict], new: Optional[dict]):
+    """体重の作成・更新・削除を反映（その日の最後の記録を取り直す）"""
+    if not settings.daily_totals_enabled:
+        return
+    db = get_db()
+    days = {log_date(row["logged_at"]) for row in (old, new) if row}
+    for day in days:
+        try:
+            await db.execute(db.rpc("daily_totals_refresh_weight", {"p_user_id": user_id, "p_date": day}))
+        except Exception as e:
+            logger.warning(f"daily_totals weight update failed: user={user_id} date={day}: {e}")
+
+
+# MARK: - 作り直し
+
+async def rebuild(user_id: str, start: date, end: date) -> int:
+    """start〜end の行を元の記録から作り直す（記録がない日の行は削除）。書き込んだ行数を返す"""
+    db = get_db()
+    days = await aggregate_range(user_id, start, end)
+    filled = []
+    empty = []
+    for totals in days.values():
+        if totals.meal_count or totals.exercise_count or totals.weight is not None:
+            filled.append(totals)
+        else:
+            empty.append(totals.date)
+
+    if filled:
+        await db.execute(db.table(TABLE).upsert(
+            [_totals_to_row(user_id, totals) for totals in filled],
+            on_conflict="user_id,date"
+        ), timeout=settings.db_query_timeout_seconds * 3)
+    if empty:
+        await db.execute(db.table(TABLE).delete().eq("user_id", user_id).in_("date", empty))
+    return len(filled)
+
+
+async def _extend_coverage(user_id: str, start: date):
+    """backfill 済みの範囲を start まで広げる（今より狭くはしない）"""
+    current = await covered_from(user_id)
+    if current is not None and current <= start:
+        return
+    db = get_db()
+    await db.execute(db.table(COVERAGE_TABLE).upsert({
+        "user_id": user_id,
+        "covered_from": start.isoformat(),
+        "updated_at": datetime.now().isoformat()
+    }, on_conflict="user_id"))
+
+
+async def backfill(days: Optional[int] = None, user_id: Optional[str] = None) -> dict:
+    """全ユーザー（または1人）の直近 days 日分を作り直す"""
+    days = days or settings.daily_totals_backfill_days
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+
+    if user_id:
+        user_ids = [user_id]
+    else:
+        db = get_db()
+        profiles = await fetch_all(db.table("profiles").select("id").order("id"))
+        user_ids = [profile["id"] for profile in profiles]
+
+    rows = 0
+    failed = 0
+    for uid in user_ids:
+        try:
+            rows += await rebuild(uid, start, end)
+            await _extend_coverage(uid, start)
+        except Exception as e:
+            failed += 1
+            logger.error(f"daily_totals rebuild failed: user={uid}: {e}")
+
+    logger.info(f"daily_totals backfill: users={len(user_ids)} rows={rows} failed={failed}")
+    return {"users": len(user_ids), "rows": rows, "failed": failed, "start_date": start.isoformat(), "end_date": end.isoformat()}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(backfill(int(sys.argv[1]) if len(sys.argv) > 1 else None)))
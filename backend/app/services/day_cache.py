@@ -0,0 +1,79 @@
+"""
+日別サマリーのキャッシュ
+ホーム画面が何度も呼ぶ「今日の進捗」「日別の食事・運動」を (ユーザー, 種類, 日付) ごとに保持する
+記録やプロフィールを書き込んだら、その日のキーを無効化する
+
+- 最大件数を超えると最も古く使われたものから削除（LRU）
+- 無効化はプロセス内のみなので、複数プロセスでもずれが残らないようTTLは短め
+"""
+
+from app.config import get_settings
+from app.services.cache import TTLCache
+from app.services.daily_stats import log_date
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+settings = get_settings()
+
+TODAY_PROGRESS = "today_progress"
+MEALS_DAILY = "meals_daily"
+EXERCISES_DAILY = "exercises_daily"
+KINDS = (TODAY_PROGRESS, MEALS_DAILY, EXERCISES_DAILY)
+
+
+class DaySummaryCache:
+    """(ユーザー, 種類, 日付) → レスポンス"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self._cache = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._kind_stats: Dict[str, Dict[str, int]] = {kind: {"hits": 0, "misses": 0} for kind in KINDS}
+        # 無効化の回数（読み込み中に無効化があった結果は保存しない）
+        self._invalidations = 0
+        self.invalidated = 0
+
+    async def get_or_load(
+        self,
+        user_id: str,
+        kind: str,
+        day: str,
+        loader: Callable[[], Awaitable[Any]],
+        cacheable: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """キャッシュにあれば返し、なければ loader で読み込んで保存（cacheable が偽を返す結果は保存しない）"""
+        key = (user_id, kind, day)
+        value = self._cache.get(key)
+        if value is not None:
+            self._kind_stats[kind]["hits"] += 1
+            return value
+
+        self._kind_stats[kind]["misses"] += 1
+        invalidations = self._invalidations
+        value = await loader()
+        if self._invalidations == invalidations and (cacheable is None or cacheable(value)):
+            self._cache.set(key, value)
+        return value
+
+    def invalidate(self, user_id: str, *days: str):
+        """その日の全種類のキーを無効化"""
+        self._invalidations += 1
+        for day in days:
+            for kind in KINDS:
+                if (user_id, kind, day) in self._cache:
+                    self.invalidated += 1
+                self._cache.delete((user_id, kind, day))
+
+    def invalidate_logs(self, user_id: str, *rows: Optional[dict]):
+        """記録（変更前・変更後）の日付のキーを無効化"""
+        self.invalidate(user_id, *{log_date(row["logged_at"]) for row in rows if row})
+
+    def stats(self) -> dict:
+        kinds = {}
+        for kind, counts in self._kind_stats.items():
+            total = counts["hits"] + counts["misses"]
+            kinds[kind] = {**counts, "hit_rate": round(counts["hits"] / total, 3) if total else 0.0}
+        return {**self._cache.stats(), "invalidated": self.invalidated, "kinds": kinds}
+
+
+day_cache = DaySummaryCache(
+    max_entries=settings.day_cache_max_entries,
+    ttl_seconds=settings.day_cache_ttl_seconds
+)
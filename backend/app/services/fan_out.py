@@ -0,0 +1,70 @@
+"""
+独立したクエリの並行実行
+互いに依存しないクエリを同時に投げて、全体を1つの締め切りで打ち切る
+（レイテンシは合計ではなく一番遅いクエリ分になる）
+
+- 必須のクエリが失敗・時間切れ → 例外（失敗した時点で残りのクエリを止めて返す）
+- 任意のクエリが失敗・時間切れ → 結果から外して名前を返す（部分的な結果として返せる）
+"""
+
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceededError(Exception):
+    """必須のクエリが締め切りまでに終わらなかった"""
+    pass
+
+
+async def gather_with_deadline(
+    queries: Dict[str, Awaitable[Any]],
+    deadline: Optional[float] = None,
+    optional: Iterable[str] = ()
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    queries（名前 → コルーチン）を並行実行
+    戻り値は (名前 → 結果, 取得できなかった任意のクエリ名)
+    deadline=None なら締め切りなし
+    """
+    optional = set(optional)
+    tasks = {name: asyncio.ensure_future(query) for name, query in queries.items()}
+    if not tasks:
+        return {}, []
+
+    loop = asyncio.get_running_loop()
+    stop_at = None if deadline is None else loop.time() + deadline
+    names = {task: name for name, task in tasks.items()}
+    results: Dict[str, Any] = {}
+    failed = set()
+    pending = set(tasks.values())
+
+    def settle(name: str, failure: BaseException):
+        # 任意のクエリは外して続ける。必須のクエリなら残りを待たずに失敗
+        if name not in optional:
+            raise failure
+        logger.warning(f"Optional query '{name}' unavailable: {failure}")
+        failed.add(name)
+
+    try:
+        while pending:
+            timeout = None if stop_at is None else max(stop_at - loop.time(), 0)
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is not None:
+                    settle(names[task], task.exception())
+                else:
+                    results[names[task]] = task.result()
+
+        for task in pending:
+            settle(names[task], DeadlineExceededError(f"{names[task]} did not finish within {deadline}s"))
+    finally:
+        # 失敗・時間切れ・呼び出し元のキャンセルのいずれでも、残ったクエリは止める
+        for task in pending:
+            task.cancel()
+
+    return results, [name for name in tasks if name in failed]
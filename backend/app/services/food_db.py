@@ -0,0 +1,202 @@
+"""
+ローカル食品成分データベース
+よくある日本の食品はGeminiを呼ばずに栄養素を返す（app/data/food_composition.json）
+
+検索の順序:
+1. 完全一致（正規化済みの名前・別名）
+2. 読み一致（ひらがな/カタカナを揃えて比較）
+3. n-gram（文字バイグラム）のあいまい一致（片方の読みがもう片方に含まれる場合のみ）
+
+数量が1人前の max_portions 倍を超える（または0以下の）品目は、入力ミスの可能性があるのでローカルでは答えない
+"""
+
+from app.config import get_settings
+from app.models.chat import DetailedMealAnalysis, FoodItem
+from app.services.text_cache import normalize_meal_text
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+import json
+import logging
+import os
+import re
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "food_composition.json")
+
+# 栄養素のキー（1人前あたり）
+NUTRIENT_KEYS = ("calories", "protein", "fat", "carbs", "sugar", "fiber", "sodium")
+
+# 品目末尾の数量（normalize_meal_text で数値・助数詞は正規化済み）
+_QUANTITY_PATTERN = re.compile(
+    r"^(?P<name>.+?)(?P<qty>[0-9]+(?:\.[0-9]+)?)(?P<unit>個|杯|本|枚|人前|切れ|皿|パック|袋|貫|g|ml)?$"
+)
+
+
+def to_katakana(text: str) -> str:
+    """ひらがなをカタカナに揃える（読み一致用）"""
+    return "".join(
+        chr(ord(ch) + 0x60) if "ぁ" <= ch <= "ゖ" else ch
+        for ch in text
+    )
+
+
+def _bigrams(text: str) -> Set[str]:
+    if len(text) < 2:
+        return {text}
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class FoodCompositionDB:
+    """食品成分テーブルと検索インデックス"""
+
+    def __init__(self, foods: List[dict], fuzzy_threshold: float = 0.8, max_portions: float = 5.0):
+        self.foods = foods
+        self.fuzzy_threshold = fuzzy_threshold
+        self.max_portions = max_portions
+        self._exact: Dict[str, int] = {}
+        self._reading: Dict[str, int] = {}
+        self._bigram_index: Dict[str, Set[str]] = defaultdict(set)
+        self._bigrams: Dict[str, Set[str]] = {}
+
+        for i, food in enumerate(foods):
+            for word in [food["name"], *food.get("aliases", [])]:
+                key = normalize_meal_text(word)
+                self._exact.setdefault(key, i)
+                self._index_reading(to_katakana(key), i)
+            self._index_reading(to_katakana(normalize_meal_text(food["reading"])), i)
+
+        self.hits = defaultdict(int)
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: str = DATA_PATH) -> "FoodCompositionDB":
+        with open(path, encoding="utf-8") as f:
+            return cls(
+                json.load(f),
+                fuzzy_threshold=settings.food_db_fuzzy_threshold,
+                max_portions=settings.food_db_max_portions
+            )
+
+    def _index_reading(self, key: str, food_index: int):
+        if key in self._reading:
+            return
+        self._reading[key] = food_index
+        grams = _bigrams(key)
+        self._bigrams[key] = grams
+        for gram in grams:
+            self._bigram_index[gram].add(key)
+
+    def find(self, name: str) -> Tuple[Optional[dict], str]:
+        """正規化済みの品目名から食品を検索 → (食品, 一致種別)"""
+        if name in self._exact:
+            return self.foods[self._exact[name]], "exact"
+
+        reading = to_katakana(name)
+        if reading in self._reading:
+            return self.foods[self._reading[reading]], "reading"
+
+        # バイグラムを共有する候補だけをDice係数で比較
+        # 文字の重なりだけでは「チキンサラダ」→「サラダチキン」のように別の料理になるので、
+        # 片方の読みがもう片方に含まれる候補に限る
+        grams = _bigrams(reading)
+        candidates = set()
+        for gram in grams:
+            candidates |= self._bigram_index.get(gram, set())
+
+        best_key, best_score = None, 0.0
+        for key in candidates:
+            if key not in reading and reading not in key:
+                continue
+            key_grams = self._bigrams[key]
+            score = 2 * len(grams & key_grams) / (len(grams) + len(key_grams))
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if best_key is not None and best_score >= self.fuzzy_threshold:
+            return self.foods[self._reading[best_key]], "fuzzy"
+        return None, "miss"
+
+    def _lookup_item(self, item: str) -> Optional[Tuple[FoodItem, dict]]:
+        name, qty, unit = item, None, None
+        match = _QUANTITY_PATTERN.match(item)
+        if match:
+            name, qty, unit = match.group("name"), float(match.group("qty")), match.group("unit")
+
+        food, match_type = self.find(name)
+        if food is None:
+            return None
+
+        portion_counter = food["portion"].lstrip("0123456789.")
+        if qty is None:
+            factor, amount = 1.0, food["portion"]
+        elif unit in ("g", "ml"):
+            # グラム指定は1人前の重量がわかる食品のみ
+            if not food.get("grams"):
+                return None
+            factor, amount = qty / food["grams"], f"{qty:g}{unit}"
+        else:
+            factor, amount = qty, f"{qty:g}{unit or portion_counter}"
+
+        # 「ご飯 100杯」のような量はAIに任せる
+        if not 0 < factor <= self.max_portions:
+            return None
+
+        values = {key: food[key] * factor for key in NUTRIENT_KEYS}
+        food_item = FoodItem(
+            name=food["name"],
+            amount=amount,
+            calories=round(values["calories"]),
+            protein=round(values["protein"], 1),
+            fat=round(values["fat"], 1),
+            carbs=round(values["carbs"], 1),
+            sugar=round(values["sugar"], 1),
+            fiber=round(values["fiber"], 1),
+            sodium=round(values["sodium"])
+        )
+        return food_item, {"match": match_type, **values}
+
+    def analyze(self, description: str) -> Optional[DetailedMealAnalysis]:
+        """
+        食事テキストをローカルで分析
+        全ての品目が確信を持って見つかった場合のみ結果を返す（1つでも外れたらNone）
+        """
+        items = [item for item in normalize_meal_text(description).split("|") if item]
+        if not items:
+            return None
+
+        found = []
+        for item in items:
+            result = self._lookup_item(item)
+            if result is None:
+                self.misses += 1
+                return None
+            found.append(result)
+
+        for _, values in found:
+            self.hits[values["match"]] += 1
+
+        totals = {key: sum(values[key] for _, values in found) for key in NUTRIENT_KEYS}
+        return DetailedMealAnalysis(
+            food_items=[food_item for food_item, _ in found],
+            total_calories=round(totals["calories"]),
+            total_protein=round(totals["protein"], 1),
+            total_fat=round(totals["fat"], 1),
+            total_carbs=round(totals["carbs"], 1),
+            total_sugar=round(totals["sugar"], 1),
+            total_fiber=round(totals["fiber"], 1),
+            total_sodium=round(totals["sodium"]),
+            character_comment="なるほど〜美味しそうだにゃ！🐱"
+        )
+
+    def stats(self) -> dict:
+        """一致種別ごとのヒット数とミス数"""
+        return {
+            "foods": len(self.foods),
+            "hits": dict(self.hits),
+            "misses": self.misses
+        }
+
+
+food_db = FoodCompositionDB.load()
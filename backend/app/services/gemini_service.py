@@ -1,8 +1,25 @@
-import google.generativeai as genai
 from app.config import get_settings
+from app.database import get_db
 from app.models.chat import MealAnalysisResponse, DetailedMealAnalysis, FoodItem
-from typing import Optional
+from app.services.image_cache import image_analysis_cache
+from app.services.text_cache import meal_text_cache, normalize_meal_text
+from app.services.single_flight import ai_single_flight
+from app.services.image_preprocess import PreprocessedImage, preprocess_image_async
+from app.services.image_similarity import meal_image_index
+from app.services.food_db import food_db
+from app.services.cache import TTLCache
+from app.services.hedging import hedged_call
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay
+from app.services.llm_metrics import llm_metrics
+from app.services.chat_context import ChatContext, conversation_store
+from app.services.json_stream import IncrementalJSONParser
+from app.services.llm_provider import LLMModel, llm_provider
+from app.services.meal_comment_cache import meal_comment_cache
+from google.api_core import exceptions as google_exceptions
+from collections import Counter
+from typing import AsyncIterator, List, Optional
 from datetime import datetime
+import asyncio
 import base64
 import json
 import re
@@ -11,12 +28,228 @@ import logging
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
-# Gemini設定
-genai.configure(api_key=settings.gemini_api_key)
+# モデル設定（プロバイダーは設定の llm_provider で切り替え）
+model = llm_provider.model("pro")  # 思考重視（チャット(思考)、食事&運動分析）
+model_flash_lite = llm_provider.model("flash_lite")  # 速度重視（ホームアドバイス、チャット(高速)）
 
-# モデル設定
-model = genai.GenerativeModel('gemini-2.5-pro')  # 思考重視（チャット(思考)、食事&運動分析）
-model_flash_lite = genai.GenerativeModel('gemini-flash-lite-latest')  # 速度重視（ホームアドバイス、チャット(高速)）
+# チャット失敗時のメッセージ
+CHAT_ERROR_MESSAGE = "ごめんにゃ、ちょっと調子が悪いみたい...😿 もう一度話しかけてほしいにゃ！"
+
+# ホームアドバイスのキャッシュ（粗い状態ごとに1文を共有）
+advice_cache = TTLCache(
+    max_entries=settings.advice_cache_max_entries,
+    ttl_seconds=settings.advice_cache_ttl_seconds
+)
+
+# 応答後に実行するバックグラウンドタスク（GCで消えないよう参照を保持）
+_background_tasks = set()
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+# モデル別バルクヘッド（同時実行数の上限）
+_bulkheads = {
+    model.model_name: asyncio.Semaphore(settings.gemini_pro_max_concurrency),
+    model_flash_lite.model_name: asyncio.Semaphore(settings.gemini_flash_lite_max_concurrency),
+}
+
+
+def _get_bulkhead(target_model: LLMModel) -> asyncio.Semaphore:
+    return _bulkheads.get(target_model.model_name, _bulkheads[model.model_name])
+
+
+# モデル別サーキットブレーカー（開いている間は即失敗 → 各メソッドのフォールバック）
+_breakers = {
+    target.model_name: CircuitBreaker(
+        target.model_name,
+        failure_threshold=settings.circuit_failure_threshold,
+        recovery_seconds=settings.circuit_recovery_seconds,
+        half_open_max_calls=settings.circuit_half_open_max_calls
+    )
+    for target in (model, model_flash_lite)
+}
+
+# 全モデル共通のリトライ予算
+retry_budget = RetryBudget(
+    ratio=settings.retry_budget_ratio,
+    min_tokens=settings.retry_budget_min_tokens
+)
+
+
+def _get_breaker(target_model: LLMModel) -> CircuitBreaker:
+    return _breakers.get(target_model.model_name, _breakers[model.model_name])
+
+
+def _is_transient(error: Exception) -> bool:
+    """一時的な障害か（5xx・429・タイムアウト・接続エラー）"""
+    return isinstance(error, (
+        google_exceptions.ServerError,
+        google_exceptions.TooManyRequests,
+        asyncio.TimeoutError,
+        ConnectionError
+    ))
+
+
+def should_retry_later(error: Exception, target_model: LLMModel = model) -> bool:
+    """
+    失敗した呼び出しを呼び出し側（ジョブなど）でもう一度試すか
+    一時的な障害のみ（解析エラーなどは同じ結果になる）。ブレーカーが開いている間は試さず、
+    呼び出し内のリトライと合わせて全体のリトライ予算から引く
+    """
+    if isinstance(error, CircuitOpenError) or not _is_transient(error):
+        return False
+    if _get_breaker(target_model).state == CircuitBreaker.OPEN:
+        return False
+    return retry_budget.try_spend()
+
+
+def circuit_stats() -> dict:
+    return {
+        "breakers": {name: breaker.stats() for name, breaker in _breakers.items()},
+        "retry_budget": retry_budget.stats()
+    }
+
+
+async def generate_content_async(
+    target_model: LLMModel,
+    contents,
+    endpoint: str = "unknown",
+    **kwargs
+):
+    """
+    LLMを非同期APIで呼び出す（イベントループをブロックしない）
+    - モデルごとのセマフォで同時実行数を制限する
+    - ブレーカーが開いていれば CircuitOpenError で即失敗
+    - 一時的な障害はジッター付き指数バックオフでリトライ（リトライ予算の範囲内）
+    - 試行ごとの待ち時間・レイテンシ・トークン数を endpoint 別に計測
+    """
+    breaker = _get_breaker(target_model)
+    retry_budget.deposit()
+    attempt = 0
+
+    while True:
+        call = llm_metrics.start(endpoint, target_model.model_name, contents)
+        if not breaker.allow():
+            call.finish("circuit_open")
+            raise CircuitOpenError(f"Circuit open: {target_model.model_name}")
+
+        try:
+            async with _get_bulkhead(target_model):
+                call.acquired()
+                response = await target_model.generate_content_async(contents, **kwargs)
+        except asyncio.CancelledError:
+            call.finish("cancelled")
+            breaker.record_cancel()
+            raise
+        except Exception as e:
+            call.finish("error")
+            if not _is_transient(e):
+                # 入力エラー等はモデル側の不調ではない
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if (
+                attempt >= settings.gemini_max_retries
+                or breaker.state == CircuitBreaker.OPEN
+                or not retry_budget.try_spend()
+            ):
+                raise
+            attempt += 1
+            delay = backoff_delay(
+                attempt,
+                settings.retry_backoff_base_seconds,
+                settings.retry_backoff_max_seconds
+            )
+            logger.warning(f"Gemini retry {attempt} ({target_model.model_name}) in {delay:.2f}s: {e}")
+            await asyncio.sleep(delay)
+            continue
+
+        call.usage(response)
+        call.finish("success")
+        breaker.record_success()
+        return response
+
+
+def _has_text(response) -> bool:
+    return bool(response.text.strip())
+
+
+def _has_json(response) -> bool:
+    json_match = re.search(r'\{[\s\S]*\}', response.text)
+    return json_match is not None and isinstance(json.loads(json_match.group()), dict)
+
+
+async def hedged_generate_content(
+    method: str,
+    primary_model: LLMModel,
+    contents,
+    budget_seconds: float,
+    hedge_model_name: str = "flash_lite",
+    validate=_has_text
+):
+    """
+    予算時間を超えたら2本目（Pro または Flash Lite）を並走させ、先に有効な応答を採用
+    """
+    hedge_model = model_flash_lite if hedge_model_name == "flash_lite" else model
+    return await hedged_call(
+        method,
+        lambda: generate_content_async(primary_model, contents, endpoint=method),
+        lambda: generate_content_async(hedge_model, contents, endpoint=method),
+        budget_seconds if settings.hedge_enabled else None,
+        validate
+    )
+
+
+async def stream_content_async(
+    target_model: LLMModel,
+    contents,
+    endpoint: str = "unknown",
+    **kwargs
+) -> AsyncIterator[str]:
+    """
+    LLMをストリーミングで呼び出し、チャンクのテキストを順に返す
+    呼び出し側がジェネレーターを閉じるとセマフォも解放される
+    ブレーカーが開いていれば CircuitOpenError で即失敗
+    """
+    breaker = _get_breaker(target_model)
+    call = llm_metrics.start(endpoint, target_model.model_name, contents)
+    if not breaker.allow():
+        call.finish("circuit_open")
+        raise CircuitOpenError(f"Circuit open: {target_model.model_name}")
+
+    # 途中まで返したストリームはやり直せないためリトライしない
+    try:
+        async with _get_bulkhead(target_model):
+            call.acquired()
+            response = await target_model.generate_content_async(contents, stream=True, **kwargs)
+            async for chunk in response:
+                call.first_byte()
+                call.usage(chunk)
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # テキストを含まないチャンク（終了理由のみ等）
+                    continue
+                if text:
+                    yield text
+    except (asyncio.CancelledError, GeneratorExit):
+        call.finish("cancelled")
+        breaker.record_cancel()
+        raise
+    except Exception as e:
+        call.finish("error")
+        if _is_transient(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+
+    call.finish("success")
+    breaker.record_success()
 
 
 def get_current_time_info() -> dict:
@@ -49,13 +282,14 @@ def get_current_time_info() -> dict:
     }
 
 
-class GeminiService:
-    """Gemini AIサービス"""
-    
-    @staticmethod
-    async def analyze_meal_image(image_base64: str) -> DetailedMealAnalysis:
-        """食事画像を分析してカロリー・栄養素を推定"""
-        prompt = """
+# 食事分析の合計値のキー
+TOTAL_KEYS = (
+    "total_calories", "total_protein", "total_fat", "total_carbs",
+    "total_sugar", "total_fiber", "total_sodium"
+)
+
+# 食事分析のプロンプト（通常版とストリーミング版で共通）
+MEAL_IMAGE_PROMPT = """
 あなたは栄養士AIです。この食事の画像を分析してください。
 
 以下のJSON形式で回答してください（JSONのみ、説明なし）：
@@ -80,48 +314,8 @@ class GeminiService:
     "character_comment": "カロちゃん（猫のキャラクター）からの一言コメント（にゃ、を語尾につけて）"
 }
 """
-        
-        try:
-            image_data = base64.b64decode(image_base64)
-            response = model.generate_content([
-                prompt,
-                {"mime_type": "image/jpeg", "data": image_data}
-            ])
-            
-            result_text = response.text
-            json_match = re.search(r'\{[\s\S]*\}', result_text)
-            
-            if json_match:
-                result = json.loads(json_match.group())
-                food_items = [FoodItem(**item) for item in result.get("food_items", [])]
-                
-                return DetailedMealAnalysis(
-                    food_items=food_items,
-                    total_calories=result.get("total_calories", 0),
-                    total_protein=result.get("total_protein", 0),
-                    total_fat=result.get("total_fat", 0),
-                    total_carbs=result.get("total_carbs", 0),
-                    total_sugar=result.get("total_sugar", 0),
-                    total_fiber=result.get("total_fiber", 0),
-                    total_sodium=result.get("total_sodium", 0),
-                    character_comment=result.get("character_comment", "美味しそうだにゃ！🐱")
-                )
-            else:
-                raise ValueError("Failed to parse AI response")
-                
-        except Exception as e:
-            logger.error(f"Image analysis error: {e}")
-            return DetailedMealAnalysis(
-                food_items=[FoodItem(name="分析できませんでした", amount="不明", calories=0, protein=0, fat=0, carbs=0)],
-                total_calories=0, total_protein=0, total_fat=0, total_carbs=0,
-                total_sugar=0, total_fiber=0, total_sodium=0,
-                character_comment="ごめんにゃ、分析できなかったにゃ...😿"
-            )
-    
-    @staticmethod
-    async def analyze_meal_text(description: str) -> DetailedMealAnalysis:
-        """テキストから食事のカロリー・栄養素を推定"""
-        prompt = f"""
+
+MEAL_TEXT_PROMPT = """
 あなたは栄養士AIです。以下の食事内容を分析してカロリーと栄養素を推定してください。
 
 食事内容: {description}
@@ -141,48 +335,307 @@ class GeminiService:
     "character_comment": "カロちゃんからの一言（語尾に「にゃ」）"
 }}
 """
+
+
+class GeminiService:
+    """Gemini AIサービス"""
+    
+    @staticmethod
+    async def analyze_meal_image(image_base64: str, user_id: Optional[str] = None) -> DetailedMealAnalysis:
+        """食事画像（Base64）を分析してカロリー・栄養素を推定"""
+        try:
+            image_data = base64.b64decode(image_base64)
+        except Exception as e:
+            logger.error(f"Image decode error: {e}")
+            return GeminiService._get_fallback_image_analysis()
         
+        return await GeminiService.analyze_meal_image_bytes(image_data, user_id)
+    
+    @staticmethod
+    async def analyze_meal_image_bytes(image_data: bytes, user_id: Optional[str] = None) -> DetailedMealAnalysis:
+        """食事画像（バイナリ）を分析してカロリー・栄養素を推定"""
         try:
-            response = model.generate_content(prompt)
-            result_text = response.text
-            json_match = re.search(r'\{[\s\S]*\}', result_text)
-            
-            if json_match:
-                result = json.loads(json_match.group())
-                food_items = [FoodItem(**item) for item in result.get("food_items", [])]
-                
-                return DetailedMealAnalysis(
-                    food_items=food_items,
-                    total_calories=result.get("total_calories", 0),
-                    total_protein=result.get("total_protein", 0),
-                    total_fat=result.get("total_fat", 0),
-                    total_carbs=result.get("total_carbs", 0),
-                    total_sugar=result.get("total_sugar", 0),
-                    total_fiber=result.get("total_fiber", 0),
-                    total_sodium=result.get("total_sodium", 0),
-                    character_comment=result.get("character_comment", "なるほど〜美味しそうだにゃ！🐱")
+            return await GeminiService.analyze_meal_image_bytes_strict(image_data, user_id)
+        except Exception as e:
+            logger.error(f"Image analysis error: {e}")
+            llm_metrics.record_parse("analyze_meal_image", model.model_name, False)
+            return GeminiService._get_fallback_image_analysis()
+    
+    @staticmethod
+    @ai_single_flight.coalesce("analyze_meal_image")
+    async def analyze_meal_image_bytes_strict(image_data: bytes, user_id: Optional[str] = None) -> DetailedMealAnalysis:
+        """
+        食事画像（バイナリ）を分析（失敗時はフォールバックせず例外）
+        user_id があれば、結果をそのユーザーの似た写真の索引に登録する（提案は find_similar_meals で別に返す）
+        """
+        index_user = user_id if settings.near_duplicate_enabled else None
+        
+        # 同じ画像の分析結果があれば再利用（索引への登録はキャッシュ済みでも行う）
+        cached = await image_analysis_cache.get(image_data, namespace="detailed")
+        if cached is not None:
+            analysis = DetailedMealAnalysis(**cached)
+            if index_user:
+                GeminiService._index_meal_image(index_user, await preprocess_image_async(image_data), analysis)
+            return analysis
+        
+        image = await preprocess_image_async(image_data)
+        analysis = await GeminiService._analyze_preprocessed_image(image_data, image)
+        if index_user:
+            GeminiService._index_meal_image(index_user, image, analysis)
+        return analysis
+    
+    @staticmethod
+    def _index_meal_image(user_id: str, image: PreprocessedImage, analysis: DetailedMealAnalysis):
+        """分析結果をそのユーザーの似た写真の索引に登録（ハッシュが取れない画像は登録しない）"""
+        if image.dhash is not None:
+            meal_image_index.add(user_id, image.dhash, analysis.model_dump())
+    
+    @staticmethod
+    async def _analyze_preprocessed_image(image_data: bytes, image: PreprocessedImage) -> DetailedMealAnalysis:
+        """前処理済みの画像をProで分析して、結果をキャッシュ"""
+        response = await hedged_generate_content(
+            "analyze_meal_image",
+            model,
+            [MEAL_IMAGE_PROMPT, {"mime_type": image.mime_type, "data": image.data}],
+            settings.hedge_analyze_image_budget_seconds,
+            settings.hedge_analyze_image_model,
+            validate=_has_json
+        )
+        
+        result_text = response.text
+        json_match = re.search(r'\{[\s\S]*\}', result_text)
+        if not json_match:
+            raise ValueError("Failed to parse AI response")
+        
+        result = json.loads(json_match.group())
+        analysis = GeminiService._analysis_from_result(result, "美味しそうだにゃ！🐱")
+        
+        llm_metrics.record_parse("analyze_meal_image", model.model_name, True)
+        await image_analysis_cache.set(image_data, "detailed", analysis.model_dump())
+        return analysis
+    
+    @staticmethod
+    async def find_similar_meals(image_data: bytes, user_id: str, limit: int = 3) -> List[dict]:
+        """過去の似た写真の分析結果（Proは呼ばない。あくまで提案で、分析結果の代わりにはしない）"""
+        if not settings.near_duplicate_enabled:
+            return []
+        image = await preprocess_image_async(image_data)
+        if image.dhash is None:
+            return []
+        return meal_image_index.find(user_id, image.dhash, settings.near_duplicate_max_distance, limit=limit)
+    
+    @staticmethod
+    def fallback_meal_analysis(from_image: bool, description: str = "") -> DetailedMealAnalysis:
+        """分析に失敗したときの結果（ジョブなど、呼び出し側でフォールバックする場合に使う）"""
+        if from_image:
+            return GeminiService._get_fallback_image_analysis()
+        return GeminiService._get_fallback_text_analysis(description)
+    
+    @staticmethod
+    def _get_fallback_image_analysis() -> DetailedMealAnalysis:
+        """画像分析失敗時のフォールバック"""
+        return DetailedMealAnalysis(
+            food_items=[FoodItem(name="分析できませんでした", amount="不明", calories=0, protein=0, fat=0, carbs=0)],
+            total_calories=0, total_protein=0, total_fat=0, total_carbs=0,
+            total_sugar=0, total_fiber=0, total_sodium=0,
+            character_comment="ごめんにゃ、分析できなかったにゃ...😿"
+        )
+    
+    @staticmethod
+    async def analyze_meal_text(description: str) -> DetailedMealAnalysis:
+        """テキストから食事のカロリー・栄養素を推定"""
+        try:
+            return await GeminiService.analyze_meal_text_strict(description)
+        except Exception as e:
+            logger.error(f"Text analysis error: {e}")
+            llm_metrics.record_parse("analyze_meal_text", model.model_name, False)
+            return GeminiService._get_fallback_text_analysis(description)
+    
+    @staticmethod
+    @ai_single_flight.coalesce("analyze_meal_text")
+    async def analyze_meal_text_strict(description: str) -> DetailedMealAnalysis:
+        """テキストから食事を分析（失敗時はフォールバックせず例外）"""
+        prompt = MEAL_TEXT_PROMPT.format(description=description)
+        
+        # よくある食品はローカルの成分表で即答
+        if settings.food_db_enabled:
+            local = food_db.analyze(description)
+            if local is not None:
+                logger.info(f"Text analysis source: local_db ({description[:20]})")
+                return local
+        
+        # 表記ゆれを吸収したキーで過去の分析結果を再利用
+        cache_key = ("detailed", normalize_meal_text(description))
+        cached = meal_text_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Text analysis source: cache ({description[:20]})")
+            return DetailedMealAnalysis(**cached)
+        
+        logger.info(f"Text analysis source: model ({description[:20]})")
+        response = await generate_content_async(model, prompt, endpoint="analyze_meal_text")
+        result_text = response.text
+        json_match = re.search(r'\{[\s\S]*\}', result_text)
+        if not json_match:
+            raise ValueError("Failed to parse AI response")
+        
+        result = json.loads(json_match.group())
+        analysis = GeminiService._analysis_from_result(result, "なるほど〜美味しそうだにゃ！🐱")
+        
+        llm_metrics.record_parse("analyze_meal_text", model.model_name, True)
+        meal_text_cache.set(cache_key, analysis.model_dump())
+        return analysis
+    
+    @staticmethod
+    def _get_fallback_text_analysis(description: str) -> DetailedMealAnalysis:
+        """テキスト分析失敗時のフォールバック（概算）"""
+        return DetailedMealAnalysis(
+            food_items=[FoodItem(name=description[:20] if description else "不明", amount="1食分", calories=300, protein=15, fat=10, carbs=40)],
+            total_calories=300, total_protein=15, total_fat=10, total_carbs=40,
+            total_sugar=5, total_fiber=3, total_sodium=500,
+            character_comment="分析が難しかったから概算だにゃ！🐱"
+        )
+    
+    @staticmethod
+    def _analysis_from_result(result: dict, default_comment: str) -> DetailedMealAnalysis:
+        """
+        モデルが返したJSON（dict）をDetailedMealAnalysisに変換
+        数値は検証前に揃える（カロリーは小数で返ることがあるので丸めて整数に、栄養素はfloatに）
+        """
+        def kcal(value) -> int:
+            return int(round(float(value or 0)))
+        
+        def grams(value) -> float:
+            return float(value or 0)
+        
+        return DetailedMealAnalysis(
+            food_items=[
+                FoodItem(
+                    name=item.get("name", "不明"),
+                    amount=item.get("amount", "1食分"),
+                    calories=kcal(item.get("calories")),
+                    protein=grams(item.get("protein")),
+                    fat=grams(item.get("fat")),
+                    carbs=grams(item.get("carbs")),
+                    sugar=grams(item.get("sugar")),
+                    fiber=grams(item.get("fiber")),
+                    sodium=grams(item.get("sodium"))
                 )
+                for item in result.get("food_items", [])
+            ],
+            total_calories=kcal(result.get("total_calories")),
+            total_protein=grams(result.get("total_protein")),
+            total_fat=grams(result.get("total_fat")),
+            total_carbs=grams(result.get("total_carbs")),
+            total_sugar=grams(result.get("total_sugar")),
+            total_fiber=grams(result.get("total_fiber")),
+            total_sodium=grams(result.get("total_sodium")),
+            character_comment=result.get("character_comment", default_comment)
+        )
+    
+    @staticmethod
+    async def analyze_meal_stream(
+        image_data: Optional[bytes] = None,
+        description: Optional[str] = None
+    ) -> AsyncIterator[tuple]:
+        """
+        食事分析（ストリーミング版）
+        モデルの出力をインクリメンタルにパースし、できた部分から順に返す
+        
+        - ("food_item", FoodItem): 食品が1つ完成するごと
+        - ("totals", dict): 合計値
+        - ("character_comment", str)
+        - ("done", DetailedMealAnalysis): 最終結果
+        - ("error", DetailedMealAnalysis): 失敗時（フォールバック結果）
+        """
+        endpoint = "analyze_meal_image_stream" if image_data is not None else "analyze_meal_text_stream"
+        
+        # ローカル成分表・キャッシュにあればそのまま順に返す
+        known = None
+        if image_data is not None:
+            cached = await image_analysis_cache.get(image_data, namespace="detailed")
+            known = DetailedMealAnalysis(**cached) if cached is not None else None
+        else:
+            if settings.food_db_enabled:
+                known = food_db.analyze(description)
+            if known is None:
+                cached = meal_text_cache.get(("detailed", normalize_meal_text(description)))
+                known = DetailedMealAnalysis(**cached) if cached is not None else None
+        if known is not None:
+            for event in GeminiService._analysis_events(known):
+                yield event
+            return
+        
+        if image_data is not None:
+            image = await preprocess_image_async(image_data)
+            contents = [MEAL_IMAGE_PROMPT, {"mime_type": image.mime_type, "data": image.data}]
+        else:
+            contents = MEAL_TEXT_PROMPT.format(description=description)
+        
+        parser = IncrementalJSONParser()
+        result = {}
+        totals_sent = False
+        chunks = stream_content_async(model, contents, endpoint=endpoint)
+        try:
+            async for text in chunks:
+                for kind, key, value in parser.feed(text):
+                    if kind == "item" and key == "food_items":
+                        yield "food_item", FoodItem(**value)
+                    elif kind == "member":
+                        result[key] = value
+                        if key == "character_comment":
+                            if not totals_sent:
+                                totals_sent = True
+                                yield "totals", GeminiService._totals_of(result)
+                            yield "character_comment", value
+            
+            if not parser.finished:
+                raise ValueError("Incomplete JSON in AI response")
+            
+            analysis = GeminiService._analysis_from_result(result, "美味しそうだにゃ！🐱")
+            if not totals_sent:
+                yield "totals", GeminiService._totals_of(result)
+                yield "character_comment", analysis.character_comment
+            
+            llm_metrics.record_parse(endpoint, model.model_name, True)
+            if image_data is not None:
+                await image_analysis_cache.set(image_data, "detailed", analysis.model_dump())
             else:
-                raise ValueError("Failed to parse AI response")
-                
+                meal_text_cache.set(("detailed", normalize_meal_text(description)), analysis.model_dump())
+            yield "done", analysis
+        
         except Exception as e:
-            logger.error(f"Text analysis error: {e}")
-            return DetailedMealAnalysis(
-                food_items=[FoodItem(name=description[:20] if description else "不明", amount="1食分", calories=300, protein=15, fat=10, carbs=40)],
-                total_calories=300, total_protein=15, total_fat=10, total_carbs=40,
-                total_sugar=5, total_fiber=3, total_sodium=500,
-                character_comment="分析が難しかったから概算だにゃ！🐱"
-            )
+            logger.error(f"Meal analysis stream error: {e}")
+            llm_metrics.record_parse(endpoint, model.model_name, False)
+            if image_data is not None:
+                yield "error", GeminiService._get_fallback_image_analysis()
+            else:
+                yield "error", GeminiService._get_fallback_text_analysis(description)
+        
+        finally:
+            await chunks.aclose()
     
     @staticmethod
-    async def chat(
+    def _totals_of(result: dict) -> dict:
+        return {key: result.get(key, 0) for key in TOTAL_KEYS}
+    
+    @staticmethod
+    def _analysis_events(analysis: DetailedMealAnalysis):
+        """完成済みの分析結果をストリーミング版と同じイベント列にする"""
+        for item in analysis.food_items:
+            yield "food_item", item
+        yield "totals", {key: getattr(analysis, key) for key in TOTAL_KEYS}
+        yield "character_comment", analysis.character_comment
+        yield "done", analysis
+    
+    @staticmethod
+    async def _build_chat_request(
         message: str,
         user_context: Optional[dict] = None,
         image_base64: Optional[str] = None,
-        chat_history: Optional[list] = None,
+        chat_context: Optional[ChatContext] = None,
         mode: str = "fast"
-    ) -> str:
-        """カロちゃんとのチャット（時間帯対応）"""
+    ) -> tuple:
+        """チャット用のモデルと入力を組み立てる"""
         
         time_info = get_current_time_info()
         
@@ -215,11 +668,13 @@ class GeminiService:
             if user_context.get('today_meals'):
                 context += f"- 今日食べたもの: {user_context.get('today_meals')}\n"
         
-        # 会話履歴
+        # 会話履歴（古い部分は要約、直近はトークン予算内でそのまま）
         history_text = ""
-        if chat_history and len(chat_history) > 0:
-            history_text = "\n【これまでの会話】\n"
-            for msg in chat_history[-6:]:
+        if chat_context and chat_context.summary:
+            history_text += f"\n【これまでの会話の要約】\n{chat_context.summary}\n"
+        if chat_context and chat_context.turns:
+            history_text += "\n【これまでの会話】\n"
+            for msg in chat_context.turns:
                 role = "ユーザー" if msg.get('is_user') else "カロちゃん"
                 history_text += f"{role}: {msg.get('message', '')}\n"
         
@@ -239,26 +694,119 @@ class GeminiService:
 
 カロちゃんとして自然に返答（2-4文）:"""
         
+        use_pro = image_base64 is not None or mode == "thinking"
+        selected_model = model if use_pro else model_flash_lite
+        
+        if image_base64:
+            image = await preprocess_image_async(base64.b64decode(image_base64))
+            return selected_model, [
+                system_prompt,
+                {"mime_type": image.mime_type, "data": image.data}
+            ]
+        return selected_model, system_prompt
+    
+    @staticmethod
+    @ai_single_flight.coalesce("chat")
+    async def chat(
+        message: str,
+        user_context: Optional[dict] = None,
+        image_base64: Optional[str] = None,
+        chat_history: Optional[list] = None,
+        mode: str = "fast",
+        conversation_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> str:
+        """
+        カロちゃんとのチャット（時間帯対応）
+        conversation_idがあれば履歴はサーバー側のそのユーザーの会話を使う（chat_historyは初回のみでよい）
+        """
+        
         try:
-            use_pro = image_base64 is not None or mode == "thinking"
-            selected_model = model if use_pro else model_flash_lite
-            
-            if image_base64:
-                image_data = base64.b64decode(image_base64)
-                response = selected_model.generate_content([
-                    system_prompt,
-                    {"mime_type": "image/jpeg", "data": image_data}
-                ])
+            chat_context = conversation_store.build_context(user_id, conversation_id, chat_history)
+            selected_model, contents = await GeminiService._build_chat_request(
+                message, user_context, image_base64, chat_context, mode
+            )
+            if selected_model is model:
+                # Pro（思考モード・画像）はテール対策でヘッジ
+                response = await hedged_generate_content(
+                    "chat",
+                    model,
+                    contents,
+                    settings.hedge_chat_budget_seconds,
+                    settings.hedge_chat_model
+                )
             else:
-                response = selected_model.generate_content(system_prompt)
-            
-            return response.text.strip()
+                response = await generate_content_async(selected_model, contents, endpoint="chat")
+            reply = response.text.strip()
+            GeminiService._remember_turn(user_id, conversation_id, message, reply)
+            return reply
             
         except Exception as e:
             logger.error(f"Chat error: {e}")
-            return "ごめんにゃ、ちょっと調子が悪いみたい...😿 もう一度話しかけてほしいにゃ！"
+            return CHAT_ERROR_MESSAGE
     
     @staticmethod
+    async def chat_stream(
+        message: str,
+        user_context: Optional[dict] = None,
+        image_base64: Optional[str] = None,
+        chat_history: Optional[list] = None,
+        mode: str = "fast",
+        conversation_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """カロちゃんとのチャット（ストリーミング版、生成されたテキストを順に返す）"""
+        chat_context = conversation_store.build_context(user_id, conversation_id, chat_history)
+        selected_model, contents = await GeminiService._build_chat_request(
+            message, user_context, image_base64, chat_context, mode
+        )
+        parts = []
+        async for text in stream_content_async(selected_model, contents, endpoint="chat_stream"):
+            parts.append(text)
+            yield text
+        GeminiService._remember_turn(user_id, conversation_id, message, "".join(parts).strip())
+    
+    @staticmethod
+    def _remember_turn(user_id: Optional[str], conversation_id: Optional[str], message: str, reply: str):
+        """会話にターンを追加し、予算から外れた分の要約を裏で進める"""
+        if not user_id or not conversation_id:
+            return
+        conversation_store.append(user_id, conversation_id, message, reply)
+        _spawn(GeminiService._fold_conversation(user_id, conversation_id))
+    
+    @staticmethod
+    async def _fold_conversation(user_id: str, conversation_id: str):
+        """古いターンを会話の要約に畳み込む（Flash Lite）"""
+        pending = conversation_store.start_folding(user_id, conversation_id)
+        if pending is None:
+            return
+        summary, folded = pending
+        
+        lines = "\n".join(
+            f"{'ユーザー' if msg.get('is_user') else 'カロちゃん'}: {msg.get('message', '')}"
+            for msg in folded
+        )
+        prompt = f"""以下は、ユーザーと猫のAIアシスタント「カロちゃん」の会話の要約と、その続きです。
+続きの内容を取り込んで、要約を{settings.chat_summary_max_chars}文字以内で更新してください。
+ユーザーの目標・体調・好み・約束したことなど、今後の会話に必要な事実を優先し、要約文のみを返してください。
+
+【これまでの要約】
+{summary or "（なし）"}
+
+【続きの会話】
+{lines}"""
+        
+        new_summary = None
+        try:
+            response = await generate_content_async(model_flash_lite, prompt, endpoint="chat_summary")
+            new_summary = response.text.strip() or None
+        except Exception as e:
+            logger.error(f"Conversation summary error: {e}")
+        finally:
+            conversation_store.finish_folding(user_id, conversation_id, new_summary, folded)
+    
+    @staticmethod
+    @ai_single_flight.coalesce("generate_advice")
     async def generate_advice(
         today_calories: int,
         goal_calories: int,
@@ -365,10 +913,17 @@ class GeminiService:
 - しっかり食べてたら「いい感じだにゃ💪」
 - たんぱく質重要「筋肉のためにたんぱく質にゃ🥩」"""
         
-        prompt = f"""カロちゃん（猫AI）として、1文アドバイスを生成。
-
-【ユーザー状況】
-- 目標: {goal_text if goal_text else "未設定"} {weight_diff_text}
+        # 同じ状態（目標・進捗・栄養状況）のユーザー間でアドバイスを共有
+        cache_key = GeminiService._advice_cache_key(
+            goal_direction, progress_percent, remaining < 0, nutrition_status, meal_count
+        )
+        
+        if settings.advice_cache_enabled:
+            # 共有するので、キーに含まれる状態だけで作る（個別の数値・料理名はプロンプトに入れない）
+            situation = GeminiService._shared_advice_situation(cache_key)
+            shared_rule = "\n- 具体的な数値や料理名は出さない"
+        else:
+            situation = f"""- 目標: {goal_text if goal_text else "未設定"} {weight_diff_text}
 - カロリー: {today_calories}/{goal_calories}kcal（{progress_percent}%、残り{remaining}kcal）
 - たんぱく質: {today_protein}g（目標{goal_protein}g）
 - 脂質: {today_fat}g / 炭水化物: {today_carbs}g
@@ -377,7 +932,13 @@ class GeminiService:
 - 塩分: {today_sodium}mg（目標{goal_sodium}mg以下）
 - 栄養状況: {nutrition_status}
 - 食べたもの: {today_meals if today_meals else "まだ記録なし"}
-- 記録回数: {meal_count}回
+- 記録回数: {meal_count}回"""
+            shared_rule = ""
+        
+        prompt = f"""カロちゃん（猫AI）として、1文アドバイスを生成。
+
+【ユーザー状況】
+{situation}
 {goal_hints}
 
 【絶対NG】
@@ -388,22 +949,77 @@ class GeminiService:
 - 語尾「にゃ」、絵文字1個
 - 1文で短く（25文字以内）
 - いきなり本題に入る
-- 栄養状況を参考に適切なアドバイス
+- 栄養状況を参考に適切なアドバイス{shared_rule}
 
 1文のみ出力:"""
         
-        try:
-            response = model_flash_lite.generate_content(prompt)
-            result = response.text.strip()
-            if '\n' in result:
-                result = result.split('\n')[0]
-            return result
-        except Exception as e:
-            logger.error(f"Advice generation error: {e}")
+        def fallback() -> str:
             return GeminiService._get_fallback_advice(
                 today_meals, progress_percent, remaining < 0, goal_direction,
                 today_sugar, goal_sugar, today_fiber, goal_fiber, today_sodium, goal_sodium
             )
+        
+        if settings.advice_cache_enabled:
+            cached = advice_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            if settings.advice_latency_first:
+                # レイテンシ優先: 初回はフォールバックで即答し、裏でキャッシュを埋める
+                _spawn(GeminiService._fill_advice_cache(cache_key, prompt))
+                return fallback()
+        
+        try:
+            result = await GeminiService._request_advice(prompt)
+            if settings.advice_cache_enabled:
+                advice_cache.set(cache_key, result)
+            return result
+        except Exception as e:
+            logger.error(f"Advice generation error: {e}")
+            return fallback()
+    
+    @staticmethod
+    def _advice_cache_key(
+        goal_direction: str,
+        progress_percent: int,
+        is_over_budget: bool,
+        nutrition_status: str,
+        meal_count: int
+    ) -> tuple:
+        """アドバイスのキャッシュキー（進捗は20%刻み、記録回数は3回以上をまとめる）"""
+        progress_bucket = min(max(progress_percent, 0) // 20, 6)
+        return (goal_direction, progress_bucket, is_over_budget, nutrition_status, min(meal_count, 3))
+    
+    @staticmethod
+    def _shared_advice_situation(cache_key: tuple) -> str:
+        """キャッシュキーの状態だけで書いたユーザー状況（同じキーのユーザーは同じプロンプトになる）"""
+        goal_direction, progress_bucket, is_over_budget, nutrition_status, meal_count = cache_key
+        goal_text = {"diet": "減量中", "bulk": "増量中", "maintain": "体重維持中"}.get(goal_direction, "未設定")
+        if progress_bucket >= 6:
+            progress_text = "目標の120%以上"
+        else:
+            progress_text = f"目標の{progress_bucket * 20}〜{progress_bucket * 20 + 19}%"
+        budget_text = "目標オーバー" if is_over_budget else "目標内"
+        meal_text = "まだ記録なし" if meal_count == 0 else ("3回以上" if meal_count >= 3 else f"{meal_count}回")
+        return f"""- 目標: {goal_text}
+- カロリー: {progress_text}（{budget_text}）
+- 栄養状況: {nutrition_status}
+- 記録回数: {meal_text}"""
+    
+    @staticmethod
+    async def _request_advice(prompt: str) -> str:
+        response = await generate_content_async(model_flash_lite, prompt, endpoint="generate_advice")
+        result = response.text.strip()
+        if '\n' in result:
+            result = result.split('\n')[0]
+        return result
+    
+    @staticmethod
+    async def _fill_advice_cache(cache_key: tuple, prompt: str):
+        try:
+            advice_cache.set(cache_key, await GeminiService._request_advice(prompt))
+        except Exception as e:
+            logger.error(f"Advice generation error: {e}")
     
     @staticmethod
     def _get_fallback_advice(
@@ -472,17 +1088,97 @@ class GeminiService:
         fiber: float = 0,
         sodium: float = 0
     ) -> str:
-        """食事に対するカロちゃんのコメントを生成"""
-        prompt = f"""カロちゃん（猫AI）として食事コメント1文。
-料理: {meal_name}（{calories}kcal）
-ルール: 語尾「にゃ」、絵文字1-2個、ポジティブに"""
+        """
+        食事に対するカロちゃんのコメントを生成
+        料理名×カロリー帯ごとにキャッシュしたバリエーションを順番に返す
+        """
+        if settings.meal_comment_cache_enabled:
+            cached = meal_comment_cache.next_comment(meal_name, calories)
+            if cached is not None:
+                return cached
         
         try:
-            response = model_flash_lite.generate_content(prompt)
-            return response.text.strip()
+            variants = await GeminiService._generate_meal_comment_variants(
+                meal_name, meal_comment_cache.calorie_band(calories)
+            )
+            return variants[0]
         except Exception as e:
             logger.error(f"Meal comment error: {e}")
             return "美味しそうだにゃ！🐱"
-
+    
+    @staticmethod
+    @ai_single_flight.coalesce("generate_meal_comment")
+    async def _generate_meal_comment_variants(meal_name: str, band: int) -> List[str]:
+        """カロリー帯に合うコメントを複数まとめて生成してキャッシュ（同じ帯の料理で使い回すので数値は書かせない）"""
+        count = settings.meal_comment_variants if settings.meal_comment_cache_enabled else 1
+        low, high = meal_comment_cache.band_range(band)
+        calorie_range = f"{low}〜{high}kcal" if high is not None else f"{low}kcal以上"
+        prompt = f"""カロちゃん（猫AI）として食事コメントを{count}通り、1行に1文ずつ。
+料理: {meal_name}（{calorie_range}）
+ルール: 語尾「にゃ」、絵文字1-2個、ポジティブに、カロリーの数値は書かない、番号や記号は付けない"""
+        
+        response = await generate_content_async(model_flash_lite, prompt, endpoint="generate_meal_comment")
+        variants = [
+            re.sub(r'^\s*(?:[0-9０-９]+[.)．、]|[-・*])\s*', '', line).strip()
+            for line in response.text.splitlines()
+        ]
+        variants = [variant for variant in variants if variant][:count]
+        if not variants:
+            raise ValueError("Empty meal comment")
+        
+        if settings.meal_comment_cache_enabled:
+            meal_comment_cache.store(meal_name, band, variants)
+        return variants
+    
+    @staticmethod
+    async def prewarm_meal_comments(
+        top_n: int = settings.meal_comment_prewarm_top_n,
+        sample_size: int = settings.meal_comment_prewarm_sample_size
+    ) -> dict:
+        """
+        よく記録される料理（最近の meal_logs の name × カロリー帯）のコメントを事前に生成
+        """
+        db = get_db()
+        response = await db.execute(db.table("meal_logs").select("name, calories").order(
+            "logged_at", desc=True
+        ).limit(sample_size))
+        rows = response.data or []
+        
+        # 同じキーにまとまる料理を数え、表示名は最初に見つかったものを使う
+        counts = Counter()
+        samples = {}
+        for row in rows:
+            if not row.get("name"):
+                continue
+            key = meal_comment_cache.key(row["name"], row.get("calories") or 0)
+            counts[key] += 1
+            samples.setdefault(key, (row["name"], row.get("calories") or 0))
+        
+        targets = [
+            samples[key] for key, _ in counts.most_common(top_n)
+            if not meal_comment_cache.contains(*samples[key])
+        ]
+        semaphore = asyncio.Semaphore(settings.meal_comment_prewarm_concurrency)
+        
+        async def warm(meal_name: str, calories: int) -> bool:
+            async with semaphore:
+                try:
+                    await GeminiService._generate_meal_comment_variants(
+                        meal_name, meal_comment_cache.calorie_band(calories)
+                    )
+                    return True
+                except Exception as e:
+                    logger.error(f"Meal comment prewarm error ({meal_name}): {e}")
+                    return False
+        
+        results = await asyncio.gather(*[warm(name, calories) for name, calories in targets])
+        summary = {
+            "sampled_rows": len(rows),
+            "distinct_keys": len(counts),
+            "warmed": sum(results),
+            "failed": len(results) - sum(results)
+        }
+        logger.info(f"Meal comment prewarm: {summary}")
+        return summary
 
 gemini_service = GeminiService()
\ No newline at end of file
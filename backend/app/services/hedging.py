@@ -0,0 +1,95 @@
+"""
+ヘッジリクエスト（レイテンシのテール対策）
+一次呼び出しが予算時間を超えたら2本目の呼び出しを並走させ、
+先に有効な結果を返した方を採用して残りはキャンセルする
+"""
+
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeStats:
+    """メソッドごとのヘッジ率・勝率"""
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.hedged = defaultdict(int)
+        self.hedge_wins = defaultdict(int)
+
+    def stats(self) -> dict:
+        result = {}
+        for method, calls in self.calls.items():
+            hedged = self.hedged[method]
+            result[method] = {
+                "calls": calls,
+                "hedged": hedged,
+                "hedge_wins": self.hedge_wins[method],
+                "hedge_rate": round(hedged / calls, 3) if calls else 0.0,
+                "hedge_win_rate": round(self.hedge_wins[method] / hedged, 3) if hedged else 0.0
+            }
+        return result
+
+
+hedge_stats = HedgeStats()
+
+
+def _is_valid(task: asyncio.Task, validate: Callable[[Any], bool]) -> bool:
+    if task.cancelled() or task.exception() is not None:
+        return False
+    try:
+        return validate(task.result())
+    except Exception:
+        return False
+
+
+async def hedged_call(
+    method: str,
+    primary: Callable[[], Awaitable[Any]],
+    hedge: Callable[[], Awaitable[Any]],
+    budget_seconds: Optional[float],
+    validate: Callable[[Any], bool] = lambda result: True
+) -> Any:
+    """
+    ヘッジ付きで呼び出す
+
+    - budget_seconds 以内に一次呼び出しが終われば、その結果（例外含む）をそのまま返す
+    - 超えたら hedge を開始し、先に validate を満たした結果を返す
+    - どちらも無効なら一次呼び出しの結果（例外含む）を返す
+    """
+    hedge_stats.calls[method] += 1
+    primary_task = asyncio.ensure_future(primary())
+    hedge_task = None
+
+    try:
+        if not budget_seconds or budget_seconds <= 0:
+            return await primary_task
+
+        done, _ = await asyncio.wait({primary_task}, timeout=budget_seconds)
+        if done:
+            return primary_task.result()
+
+        hedge_stats.hedged[method] += 1
+        logger.info(f"Hedge fired: {method} (> {budget_seconds}s)")
+        hedge_task = asyncio.ensure_future(hedge())
+        pending = {primary_task, hedge_task}
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if _is_valid(task, validate):
+                    if task is hedge_task:
+                        hedge_stats.hedge_wins[method] += 1
+                    return task.result()
+
+        # どちらも有効な結果を返さなかった
+        return primary_task.result()
+
+    finally:
+        # 負けた方（または呼び出し元のキャンセル時は両方）をキャンセル
+        for task in (primary_task, hedge_task):
+            if task is not None and not task.done():
+                task.cancel()
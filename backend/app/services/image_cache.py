@@ -0,0 +1,131 @@
+"""
+食事画像分析の結果キャッシュ
+デコード済み画像バイトのSHA-256をキーに分析結果を保存する
+（撮り直し・タイムアウト後のリトライ・チャットと記録画面での同一画像送信に対応）
+"""
+
+from app.config import get_settings
+from app.services.cache import TTLCache
+from typing import Optional
+import aiofiles
+import aiofiles.os
+import hashlib
+import json
+import logging
+import os
+import time
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def image_digest(image_data: bytes) -> str:
+    """画像バイトのハッシュ（キャッシュキー）"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+class ImageAnalysisCache:
+    """
+    画像分析結果の2段キャッシュ
+
+    - 1段目: インメモリLRU（TTL付き）
+    - 2段目: ディスク（cache_dir指定時のみ、再起動後も有効）
+    - namespaceでレスポンス形式の異なる呼び出し元を分ける
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 7 * 24 * 3600,
+        cache_dir: Optional[str] = None
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir
+        self._memory = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    async def get(self, image_data: bytes, namespace: str) -> Optional[dict]:
+        """キャッシュ済みの分析結果（dict）を取得"""
+        key = f"{namespace}-{image_digest(image_data)}"
+
+        value = self._memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.cache_dir:
+            value = await self._read_disk(key)
+            if value is not None:
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, image_data: bytes, namespace: str, value: dict):
+        """分析結果を保存"""
+        key = f"{namespace}-{image_digest(image_data)}"
+        self._memory.set(key, value)
+
+        if self.cache_dir:
+            await self._write_disk(key, value)
+
+    async def _read_disk(self, key: str) -> Optional[dict]:
+        path = self._disk_path(key)
+        try:
+            async with aiofiles.open(path, "r", encoding="utf-8") as f:
+                entry = json.loads(await f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Image cache read error: {e}")
+            return None
+
+        remaining = entry["stored_at"] + self.ttl_seconds - time.time()
+        if remaining <= 0:
+            try:
+                await aiofiles.os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        # メモリ側にも載せる（残りTTLのみ）
+        self._memory.set(key, entry["value"], ttl_seconds=remaining)
+        return entry["value"]
+
+    async def _write_disk(self, key: str, value: dict):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+                await f.write(json.dumps({"stored_at": time.time(), "value": value}, ensure_ascii=False))
+            await aiofiles.os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Image cache write error: {e}")
+
+    def stats(self) -> dict:
+        """ヒット/ミス数"""
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / total, 3) if total else 0.0,
+            "memory": self._memory.stats(),
+            "disk_enabled": bool(self.cache_dir)
+        }
+
+
+image_analysis_cache = ImageAnalysisCache(
+    max_entries=settings.image_cache_max_entries,
+    ttl_seconds=settings.image_cache_ttl_seconds,
+    cache_dir=settings.image_cache_dir
+)
@@ -0,0 +1,141 @@
+"""
+食事画像の前処理
+Geminiに送る前に、EXIFの向き補正・メタデータ除去・縮小・JPEG再エンコードを行う
+（アップロード時間とトークンコストの削減）
+"""
+
+from app.config import get_settings
+from app.services.image_similarity import dhash
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from pydantic import BaseModel
+from typing import Optional
+import asyncio
+import io
+import logging
+import time
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# 画像処理はCPUを使うためイベントループ外の専用スレッドで実行
+_executor = ThreadPoolExecutor(
+    max_workers=settings.image_preprocess_workers,
+    thread_name_prefix="image-preprocess"
+)
+
+
+class PreprocessedImage(BaseModel):
+    """前処理済み画像と処理レポート"""
+    data: bytes
+    mime_type: str = "image/jpeg"
+    original_bytes: int
+    processed_bytes: int
+    width: int = 0
+    height: int = 0
+    decode_ms: float = 0
+    resize_ms: float = 0
+    encode_ms: float = 0
+    processed: bool = True
+    dhash: Optional[int] = None  # 知覚ハッシュ（似た写真の検索用）
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - self.processed_bytes
+
+
+class _PreprocessStats:
+    """前処理の累計"""
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.original_bytes = 0
+        self.processed_bytes = 0
+        self.total_ms = 0.0
+
+    def record(self, result: PreprocessedImage):
+        self.count += 1
+        if not result.processed:
+            self.failures += 1
+        self.original_bytes += result.original_bytes
+        self.processed_bytes += result.processed_bytes
+        self.total_ms += result.decode_ms + result.resize_ms + result.encode_ms
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "original_bytes": self.original_bytes,
+            "processed_bytes": self.processed_bytes,
+            "saved_bytes": self.original_bytes - self.processed_bytes,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0.0
+        }
+
+
+preprocess_stats = _PreprocessStats()
+
+
+def preprocess_image(
+    image_data: bytes,
+    max_edge: int = settings.image_max_edge,
+    quality: int = settings.image_jpeg_quality
+) -> PreprocessedImage:
+    """
+    画像を正規化（同期版）
+    デコードできない場合は元のバイト列をそのまま返す
+    """
+    started = time.perf_counter()
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        # JPEGはデコード時点で縮小（1/2〜1/8）して処理量を減らす
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGB")
+        decoded = time.perf_counter()
+
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        image_hash = dhash(image)
+        resized = time.perf_counter()
+
+        # exifを渡さずに保存 → メタデータ（位置情報など）は除去される
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        data = buffer.getvalue()
+        encoded = time.perf_counter()
+
+    except Exception as e:
+        logger.warning(f"Image preprocess skipped: {e}")
+        return PreprocessedImage(
+            data=image_data,
+            original_bytes=len(image_data),
+            processed_bytes=len(image_data),
+            decode_ms=round((time.perf_counter() - started) * 1000, 1),
+            processed=False
+        )
+
+    return PreprocessedImage(
+        data=data,
+        original_bytes=len(image_data),
+        processed_bytes=len(data),
+        width=image.width,
+        height=image.height,
+        dhash=image_hash,
+        decode_ms=round((decoded - started) * 1000, 1),
+        resize_ms=round((resized - decoded) * 1000, 1),
+        encode_ms=round((encoded - resized) * 1000, 1)
+    )
+
+
+async def preprocess_image_async(image_data: bytes) -> PreprocessedImage:
+    """画像を正規化（ワーカースレッドで実行）"""
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(_executor, preprocess_image, image_data)
+
+    preprocess_stats.record(result)
+    logger.info(
+        f"Image preprocess: {result.original_bytes} -> {result.processed_bytes} bytes "
+        f"(saved {result.saved_bytes}), {result.width}x{result.height}, "
+        f"decode {result.decode_ms}ms / resize {result.resize_ms}ms / encode {result.encode_ms}ms"
+    )
+    return result
@@ -0,0 +1,132 @@
+"""
+似た食事写真の検索
+画像の知覚ハッシュ（64bit dHash）をユーザーごとのBK木に登録し、
+ハミング距離がしきい値以内の過去の分析結果を探す
+（毎日同じ朝食を撮る場合などに、Proを呼ばずに前回の結果を提案する）
+"""
+
+from app.config import get_settings
+from collections import OrderedDict, deque
+from PIL import Image
+from typing import Any, Deque, List, Optional, Tuple
+import time
+
+settings = get_settings()
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """差分ハッシュ（隣り合う画素の明暗）→ hash_size² ビットの整数"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """ハミング距離のBK木（三角不等式で枝刈りして近傍を探す）"""
+
+    def __init__(self):
+        # ノード: [ハッシュ, 値, {距離: 子ノード}]
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, hash_value: int, value: Any):
+        self.size += 1
+        if self._root is None:
+            self._root = [hash_value, value, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, value, {}]
+                return
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """距離 max_distance 以内の (距離, 値) を近い順に返す"""
+        if self._root is None:
+            return []
+        results = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+class PerceptualHashIndex:
+    """
+    ユーザーごとの知覚ハッシュ索引
+    - 1ユーザーあたり max_per_user 件まで（超えたら古いものを捨てて木を作り直す）
+    - ユーザー数は max_users まで（LRU）
+    """
+
+    def __init__(self, max_per_user: int, max_users: int):
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        self._users: "OrderedDict[str, Tuple[Deque[tuple], BKTree]]" = OrderedDict()
+        self.lookups = 0
+        self.matches = 0
+
+    def add(self, user_id: str, hash_value: int, analysis: dict):
+        entries, tree = self._users.get(user_id) or (deque(), BKTree())
+        entry = (hash_value, {"analysis": analysis, "analyzed_at": time.time()})
+        entries.append(entry)
+        if len(entries) > self.max_per_user:
+            entries.popleft()
+            # BK木は削除に向かないので作り直す
+            tree = BKTree()
+            for old_hash, old_value in entries:
+                tree.add(old_hash, old_value)
+        else:
+            tree.add(*entry)
+
+        self._users[user_id] = (entries, tree)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def find(self, user_id: str, hash_value: int, max_distance: int, limit: int = 3) -> List[dict]:
+        """距離 max_distance 以内の過去の分析を近い順に（新しいものを優先）"""
+        self.lookups += 1
+        user = self._users.get(user_id)
+        if user is None:
+            return []
+        self._users.move_to_end(user_id)
+        results = user[1].search(hash_value, max_distance)
+        results.sort(key=lambda result: (result[0], -result[1]["analyzed_at"]))
+        if results:
+            self.matches += 1
+        return [{"distance": distance, **value} for distance, value in results[:limit]]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "entries": sum(len(entries) for entries, _ in self._users.values()),
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "match_rate": round(self.matches / self.lookups, 3) if self.lookups else 0.0
+        }
+
+
+meal_image_index = PerceptualHashIndex(
+    max_per_user=settings.near_duplicate_max_per_user,
+    max_users=settings.near_duplicate_max_users
+)
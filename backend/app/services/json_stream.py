@@ -0,0 +1,97 @@
+"""
+ストリーミング応答のインクリメンタルJSONパーサー
+モデルが出力中のJSONオブジェクトを1文字ずつ走査し、全体を待たずに
+- トップレベル配列の要素（例: food_items の各食品）
+- トップレベルのメンバー（例: total_calories, character_comment）
+を完成した時点で取り出す
+"""
+
+from typing import Any, List, Optional, Tuple
+import json
+
+# ("item", キー, 配列要素) / ("member", キー, 値)
+ParseEvent = Tuple[str, str, Any]
+
+
+class IncrementalJSONParser:
+    """
+    トップレベルがオブジェクトのJSONを逐次パースする
+    先頭の ```json などの前置きは最初の { まで読み飛ばす
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self.finished = False
+
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+
+        self._member_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self._current_key: Optional[str] = None
+
+    def feed(self, text: str) -> List[ParseEvent]:
+        """テキスト片を追加し、新たに完成した要素・メンバーを返す"""
+        events: List[ParseEvent] = []
+        self._buffer += text
+
+        while self._pos < len(self._buffer) and not self.finished:
+            i = self._pos
+            ch = self._buffer[i]
+            self._pos += 1
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append("{")
+                    self._member_start = i + 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                # トップレベル配列の中で要素（オブジェクト/配列）が始まった
+                if self._stack == ["{", "["]:
+                    self._item_start = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                self._stack.pop()
+                if self._stack == ["{", "["] and self._item_start is not None:
+                    events.append(("item", self._key_of_member(), json.loads(self._buffer[self._item_start:i + 1])))
+                    self._item_start = None
+                elif not self._stack:
+                    # トップレベルのオブジェクトが閉じた
+                    events.extend(self._end_member(i))
+                    self.finished = True
+            elif ch == "," and self._stack == ["{"]:
+                events.extend(self._end_member(i))
+
+        return events
+
+    def _key_of_member(self) -> str:
+        """配列要素が属するメンバーのキー（"key": [ の key）"""
+        if self._current_key is None:
+            head = self._buffer[self._member_start:].split(":", 1)[0]
+            self._current_key = json.loads(head.strip())
+        return self._current_key
+
+    def _end_member(self, end: int) -> List[ParseEvent]:
+        segment = self._buffer[self._member_start:end].strip()
+        self._member_start = end + 1
+        self._current_key = None
+        if not segment:
+            return []
+        member = json.loads("{" + segment + "}")
+        return [("member", key, value) for key, value in member.items()]
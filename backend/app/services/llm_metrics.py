@@ -0,0 +1,191 @@
+"""
+LLM呼び出しの計測
+Gemini呼び出しごとに待ち時間・レイテンシ・プロンプト/出力サイズ・パース結果を
+エンドポイント×モデル別のヒストグラム/カウンターに記録し、
+Prometheusのテキスト形式（/metrics）で出力する
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+import time
+
+# 秒
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+# 文字数・トークン数
+SIZE_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+# バイト
+BYTES_BUCKETS = (16_000, 64_000, 128_000, 256_000, 512_000, 1_000_000, 2_000_000, 5_000_000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """ラベル付きカウンター"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1):
+        self._values[labels] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """ラベル付きヒストグラム（累積バケット）"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [バケットごとの件数..., 合計, 件数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                le = _format_labels(self.label_names, labels, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+            le = _format_labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {series[-2]:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+
+_LABELS = ("endpoint", "model")
+
+
+class LLMMetrics:
+    """LLM呼び出しのメトリクス一式"""
+
+    def __init__(self):
+        self.requests = Counter("llm_requests_total", "LLM calls by status", (*_LABELS, "status"))
+        self.queue_wait = Histogram(
+            "llm_queue_wait_seconds", "Time waiting for the model bulkhead", _LABELS, LATENCY_BUCKETS
+        )
+        self.ttfb = Histogram(
+            "llm_time_to_first_byte_seconds", "Time until the first streamed chunk", _LABELS, LATENCY_BUCKETS
+        )
+        self.latency = Histogram(
+            "llm_request_duration_seconds", "Total LLM call latency", _LABELS, LATENCY_BUCKETS
+        )
+        self.prompt_chars = Histogram("llm_prompt_chars", "Prompt text characters", _LABELS, SIZE_BUCKETS)
+        self.prompt_tokens = Histogram("llm_prompt_tokens", "Prompt tokens (usage metadata)", _LABELS, SIZE_BUCKETS)
+        self.image_bytes = Histogram("llm_image_bytes", "Inline image bytes sent", _LABELS, BYTES_BUCKETS)
+        self.output_tokens = Histogram("llm_output_tokens", "Output tokens (usage metadata)", _LABELS, SIZE_BUCKETS)
+        self.parse = Counter("llm_parse_total", "Response parse outcomes", (*_LABELS, "result"))
+
+    def start(self, endpoint: str, model_name: str, contents) -> "LLMCall":
+        return LLMCall(self, endpoint, model_name, contents)
+
+    def record_parse(self, endpoint: str, model_name: str, success: bool):
+        """応答を使えたか（success）、フォールバックに回したか（fallback）"""
+        self.parse.inc((endpoint, model_name, "success" if success else "fallback"))
+
+    def render(self) -> str:
+        lines = []
+        for metric in (
+            self.requests, self.queue_wait, self.ttfb, self.latency,
+            self.prompt_chars, self.prompt_tokens, self.image_bytes, self.output_tokens, self.parse
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def measure_contents(contents) -> Tuple[int, int]:
+    """Geminiへの入力から（テキスト文字数, 画像バイト数）を数える"""
+    if isinstance(contents, str):
+        return len(contents), 0
+    if isinstance(contents, dict):
+        if isinstance(contents.get("data"), (bytes, bytearray)):
+            return 0, len(contents["data"])
+        return measure_contents(contents.get("parts", []))
+    if isinstance(contents, (list, tuple)):
+        chars, image_bytes = 0, 0
+        for part in contents:
+            part_chars, part_bytes = measure_contents(part)
+            chars += part_chars
+            image_bytes += part_bytes
+        return chars, image_bytes
+    return 0, 0
+
+
+class LLMCall:
+    """
+    1回の呼び出しの計測（start → acquired → first_byte → finish）
+    first_byte はストリーミングの最初のチャンクでのみ呼ぶ（一括応答では全体のレイテンシと同じになるため）
+    """
+
+    def __init__(self, metrics: LLMMetrics, endpoint: str, model_name: str, contents):
+        self.metrics = metrics
+        self.labels = (endpoint, model_name)
+        self.started = time.perf_counter()
+        self.acquired_at: Optional[float] = None
+        self.first_byte_at: Optional[float] = None
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+        chars, image_bytes = measure_contents(contents)
+        metrics.prompt_chars.observe(self.labels, chars)
+        if image_bytes:
+            metrics.image_bytes.observe(self.labels, image_bytes)
+
+    def acquired(self):
+        """バルクヘッドを通過した"""
+        self.acquired_at = time.perf_counter()
+        self.metrics.queue_wait.observe(self.labels, self.acquired_at - self.started)
+
+    def first_byte(self):
+        if self.first_byte_at is None:
+            self.first_byte_at = time.perf_counter()
+            self.metrics.ttfb.observe(self.labels, self.first_byte_at - (self.acquired_at or self.started))
+
+    def usage(self, response):
+        """usage_metadata からトークン数を取得（ストリームでは最後のチャンクの値が合計）"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        self.prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        self.output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+
+    def finish(self, status: str):
+        self.metrics.requests.inc((*self.labels, status))
+        if status != "success":
+            return
+        self.metrics.latency.observe(self.labels, time.perf_counter() - self.started)
+        if self.prompt_tokens:
+            self.metrics.prompt_tokens.observe(self.labels, self.prompt_tokens)
+        if self.output_tokens:
+            self.metrics.output_tokens.observe(self.labels, self.output_tokens)
+
+
+llm_metrics = LLMMetrics()
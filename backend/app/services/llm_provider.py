@@ -0,0 +1,232 @@
+"""
+LLMプロバイダー
+AI関連のコードはここで作ったモデル経由でのみLLMを呼び出す
+
+- gemini: Google Gemini（本番）
+- fake: ネットワークを使わない決定的なフェイク（負荷試験・オフライン検証用）
+  レイテンシ分布・エラー率・定型応答を設定で変えられる
+
+モデルは genai.GenerativeModel と同じ形（model_name と generate_content_async）を持つ
+"""
+
+from app.config import get_settings
+from google.api_core import exceptions as google_exceptions
+from typing import Any, AsyncIterator, Dict, List, Optional, Protocol
+import asyncio
+import json
+import logging
+import random
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class LLMModel(Protocol):
+    """プロバイダーが返すモデル"""
+    model_name: str
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs) -> Any:
+        ...
+
+
+class LLMProvider:
+    """プロバイダーの基底クラス"""
+
+    name = "base"
+
+    def model(self, tier: str) -> LLMModel:
+        """tier: "pro"（思考重視）または "flash_lite"（速度重視）"""
+        raise NotImplementedError
+
+
+# MARK: - Gemini
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_names: Dict[str, str]):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self._models = {tier: genai.GenerativeModel(name) for tier, name in model_names.items()}
+
+    def model(self, tier: str) -> LLMModel:
+        return self._models[tier]
+
+
+# MARK: - Fake
+
+# 入力に含まれる文字列 → 応答（上から順に判定、最後は既定の応答）
+DEFAULT_FAKE_RESPONSES: List[dict] = [
+    {"match": "要約を", "text": "ユーザーは食事管理を頑張っていて、カロちゃんと食事や運動について話している。"},
+    {"match": "food_items", "text": json.dumps({
+        "food_items": [
+            {"name": "ご飯", "amount": "1杯", "calories": 234, "protein": 3.8, "fat": 0.5, "carbs": 55.7},
+            {"name": "鶏の唐揚げ", "amount": "4個", "calories": 340, "protein": 20.0, "fat": 22.0, "carbs": 12.0},
+            {"name": "味噌汁", "amount": "1杯", "calories": 40, "protein": 2.5, "fat": 1.2, "carbs": 4.5}
+        ],
+        "total_calories": 614,
+        "total_protein": 26.3,
+        "total_fat": 23.7,
+        "total_carbs": 72.2,
+        "total_sugar": 4.0,
+        "total_fiber": 2.1,
+        "total_sodium": 1600,
+        "character_comment": "唐揚げ定食、美味しそうだにゃ！🐱"
+    }, ensure_ascii=False)},
+    {"match": "食事コメント", "text": "バランスよく食べててえらいにゃ！🐱✨"},
+    {"match": "アドバイス", "text": "いい調子だにゃ✨"},
+    {"match": "", "text": "なるほどにゃ！今日も一緒に頑張ろうにゃ🐱"},
+]
+
+
+class _FakeUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class _FakeResponse:
+    def __init__(self, text: str, usage: Optional[_FakeUsage] = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+def _prompt_text(contents) -> str:
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_prompt_text(part) for part in contents)
+    if isinstance(contents, dict):
+        return _prompt_text(contents.get("parts", []))
+    return ""
+
+
+class FakeModel:
+    """決定的なフェイクモデル（乱数は seed 固定）"""
+
+    def __init__(
+        self,
+        model_name: str,
+        rng: random.Random,
+        latency_ms: float,
+        distribution: str,
+        sigma: float,
+        error_rate: float,
+        responses: List[dict],
+        stream_chunk_chars: int = 20
+    ):
+        self.model_name = model_name
+        self._rng = rng
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.responses = responses
+        self.stream_chunk_chars = stream_chunk_chars
+        self.calls = 0
+
+    def _sample_latency(self) -> float:
+        """1回分のレイテンシ（秒）"""
+        if self.distribution == "fixed":
+            ms = self.latency_ms
+        elif self.distribution == "uniform":
+            ms = self._rng.uniform(self.latency_ms * (1 - self.sigma), self.latency_ms * (1 + self.sigma))
+        else:
+            # lognormal: latency_ms が中央値、sigma が裾の重さ
+            ms = self.latency_ms * self._rng.lognormvariate(0, self.sigma)
+        return max(ms, 0) / 1000
+
+    def _respond(self, prompt: str) -> str:
+        for response in self.responses:
+            if response["match"] in prompt:
+                return response["text"]
+        return ""
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        self.calls += 1
+        latency = self._sample_latency()
+        failed = self._rng.random() < self.error_rate
+        prompt = _prompt_text(contents)
+        text = self._respond(prompt)
+        usage = _FakeUsage(len(prompt), len(text))
+
+        if not stream:
+            await asyncio.sleep(latency)
+            if failed:
+                raise google_exceptions.ServiceUnavailable("fake provider error")
+            return _FakeResponse(text, usage)
+
+        return self._stream(text, usage, latency, failed)
+
+    async def _stream(self, text: str, usage: _FakeUsage, latency: float, failed: bool) -> AsyncIterator[_FakeResponse]:
+        """レイテンシをチャンク数で割って少しずつ返す（最後のチャンクにusage）"""
+        chunks = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)] or [""]
+        for i, chunk in enumerate(chunks):
+            await asyncio.sleep(latency / len(chunks))
+            if failed and i == len(chunks) // 2:
+                raise google_exceptions.ServiceUnavailable("fake provider error")
+            yield _FakeResponse(chunk, usage if i == len(chunks) - 1 else None)
+
+
+class FakeProvider(LLMProvider):
+    """ネットワークを使わないフェイク"""
+
+    name = "fake"
+
+    def __init__(
+        self,
+        model_names: Dict[str, str],
+        latency_ms: Dict[str, float],
+        distribution: str = "lognormal",
+        sigma: float = 0.5,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        responses_path: Optional[str] = None
+    ):
+        responses = list(DEFAULT_FAKE_RESPONSES)
+        if responses_path:
+            # 追加の定型応答（[{"match": "...", "text": "..."}]）を既定より優先
+            with open(responses_path, encoding="utf-8") as f:
+                responses = json.load(f) + responses
+
+        rng = random.Random(seed)
+        self._models = {
+            tier: FakeModel(
+                f"fake/{name}",
+                rng,
+                latency_ms[tier],
+                distribution,
+                sigma,
+                error_rate,
+                responses
+            )
+            for tier, name in model_names.items()
+        }
+
+    def model(self, tier: str) -> LLMModel:
+        return self._models[tier]
+
+
+def create_llm_provider() -> LLMProvider:
+    """設定（llm_provider）に応じたプロバイダーを作成"""
+    model_names = {"pro": settings.llm_pro_model, "flash_lite": settings.llm_flash_lite_model}
+
+    if settings.llm_provider == "fake":
+        logger.warning("LLM provider: fake (no requests are sent to Gemini)")
+        return FakeProvider(
+            model_names,
+            latency_ms={"pro": settings.fake_llm_pro_latency_ms, "flash_lite": settings.fake_llm_flash_lite_latency_ms},
+            distribution=settings.fake_llm_latency_distribution,
+            sigma=settings.fake_llm_latency_sigma,
+            error_rate=settings.fake_llm_error_rate,
+            seed=settings.fake_llm_seed,
+            responses_path=settings.fake_llm_responses_path
+        )
+
+    return GeminiProvider(settings.gemini_api_key, model_names)
+
+
+llm_provider = create_llm_provider()
@@ -0,0 +1,63 @@
+"""
+食事コメントのキャッシュ
+料理名（正規化）×カロリー帯ごとに複数のコメントを持ち、呼ばれるたびに順番に返す
+（人気の料理は毎回Flash Liteを呼ばずに即答し、同じ一言ばかりにならないようにする）
+"""
+
+from app.config import get_settings
+from app.services.cache import TTLCache
+from app.services.text_cache import normalize_meal_text
+from typing import List, Optional, Tuple
+
+settings = get_settings()
+
+
+class MealCommentCache:
+    """(正規化した料理名, カロリー帯) → コメントのバリエーション"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, band_kcal: int, max_band: int):
+        self._cache = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.band_kcal = band_kcal
+        self.max_band = max_band
+
+    def calorie_band(self, calories: int) -> int:
+        """カロリー帯（band_kcal刻み、max_band以上はまとめる）"""
+        return min(max(int(calories or 0), 0) // self.band_kcal, self.max_band)
+
+    def band_range(self, band: int) -> Tuple[int, Optional[int]]:
+        """カロリー帯の範囲（最上位の帯は上限なし）"""
+        low = band * self.band_kcal
+        return low, (low + self.band_kcal if band < self.max_band else None)
+
+    def key(self, meal_name: str, calories: int) -> tuple:
+        return self._band_key(meal_name, self.calorie_band(calories))
+
+    def _band_key(self, meal_name: str, band: int) -> tuple:
+        return normalize_meal_text(meal_name), band
+
+    def next_comment(self, meal_name: str, calories: int) -> Optional[str]:
+        """キャッシュにあれば次のバリエーションを返す"""
+        entry = self._cache.get(self.key(meal_name, calories))
+        if entry is None:
+            return None
+        comment = entry["variants"][entry["next"] % len(entry["variants"])]
+        entry["next"] += 1
+        return comment
+
+    def contains(self, meal_name: str, calories: int) -> bool:
+        return self.key(meal_name, calories) in self._cache
+
+    def store(self, meal_name: str, band: int, variants: List[str]):
+        # 1つ目は生成したリクエスト自身が使うので、次は2つ目から
+        self._cache.set(self._band_key(meal_name, band), {"variants": variants, "next": 1})
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+meal_comment_cache = MealCommentCache(
+    max_entries=settings.meal_comment_cache_max_entries,
+    ttl_seconds=settings.meal_comment_cache_ttl_seconds,
+    band_kcal=settings.meal_comment_calorie_band_kcal,
+    max_band=settings.meal_comment_max_band
+)
@@ -0,0 +1,406 @@
+"""
+食事分析ジョブ
+分析を受け付けたらすぐジョブIDを返し、ワーカーが裏で実行する
+（通信が切れても結果は一定時間残り、ポーリング・ロングポーリング・SSEで受け取れる）
+
+ストアは設定（meal_job_store）で切り替え:
+- memory: プロセス内の辞書（単一ノード向け）
+- sqlite: ローカルのSQLiteファイル（再起動後も結果を参照できる）
+
+再起動で終わらなかったジョブは、起動時（start）に再投入するか失敗にする
+（キューはプロセス内なので、1つのストアを使うプロセスは1つの前提）
+"""
+
+from app.config import get_settings
+from app.models.chat import DetailedMealAnalysis
+from app.services.circuit_breaker import backoff_delay
+from app.services.gemini_service import GeminiService, should_retry_later
+from abc import ABC, abstractmethod
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+class QueueFullError(Exception):
+    """待ちジョブが上限に達している"""
+    pass
+
+
+class MealJob(BaseModel):
+    """食事分析ジョブ"""
+    id: str
+    status: str = JOB_QUEUED
+    description: Optional[str] = None
+    image_data: Optional[bytes] = None  # 完了後は破棄
+    attempts: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+
+# MARK: - ストア
+
+class JobStore(ABC):
+    """ジョブストアの基底クラス"""
+
+    @abstractmethod
+    async def save(self, job: MealJob):
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[MealJob]:
+        ...
+
+    @abstractmethod
+    async def unfinished(self) -> List[MealJob]:
+        """未完了（queued / running）のジョブ"""
+        ...
+
+    @abstractmethod
+    async def purge(self, older_than: float) -> int:
+        """updated_at が older_than より前のジョブを削除（止まったまま残った未完了のジョブも含む）"""
+        ...
+
+
+class InMemoryJobStore(JobStore):
+    """プロセス内の辞書"""
+
+    def __init__(self):
+        self._jobs: Dict[str, MealJob] = {}
+
+    async def save(self, job: MealJob):
+        self._jobs[job.id] = job
+
+    async def get(self, job_id: str) -> Optional[MealJob]:
+        return self._jobs.get(job_id)
+
+    async def unfinished(self) -> List[MealJob]:
+        return [job for job in self._jobs.values() if not job.finished]
+
+    async def purge(self, older_than: float) -> int:
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.updated_at < older_than
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """ローカルのSQLiteテーブル（ファイルI/Oはスレッドで実行）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS meal_analysis_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    description TEXT,
+                    image_data BLOB,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS meal_analysis_jobs_updated_at ON meal_analysis_jobs (updated_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _save(self, job: MealJob):
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO meal_analysis_jobs
+                    (id, status, description, image_data, attempts, result, error, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job.id, job.status, job.description, job.image_data, job.attempts,
+                    json.dumps(job.result, ensure_ascii=False) if job.result is not None else None,
+                    job.error, job.created_at, job.updated_at
+                )
+            )
+
+    @staticmethod
+    def _to_job(row: tuple) -> MealJob:
+        return MealJob(
+            id=row[0], status=row[1], description=row[2], image_data=row[3], attempts=row[4],
+            result=json.loads(row[5]) if row[5] else None,
+            error=row[6], created_at=row[7], updated_at=row[8]
+        )
+
+    def _get(self, job_id: str) -> Optional[MealJob]:
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT id, status, description, image_data, attempts, result, error, created_at, updated_at
+                FROM meal_analysis_jobs WHERE id = ?
+                """,
+                (job_id,)
+            ).fetchone()
+        return self._to_job(row) if row is not None else None
+
+    def _unfinished(self) -> List[MealJob]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, status, description, image_data, attempts, result, error, created_at, updated_at
+                FROM meal_analysis_jobs WHERE status NOT IN (?, ?) ORDER BY created_at
+                """,
+                FINISHED_STATUSES
+            ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def _purge(self, older_than: float) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM meal_analysis_jobs WHERE updated_at < ?",
+                (older_than,)
+            )
+            return cursor.rowcount
+
+    async def save(self, job: MealJob):
+        await asyncio.to_thread(self._save, job)
+
+    async def get(self, job_id: str) -> Optional[MealJob]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def unfinished(self) -> List[MealJob]:
+        return await asyncio.to_thread(self._unfinished)
+
+    async def purge(self, older_than: float) -> int:
+        return await asyncio.to_thread(self._purge, older_than)
+
+
+def create_job_store() -> JobStore:
+    if settings.meal_job_store == "sqlite":
+        return SQLiteJobStore(settings.meal_job_sqlite_path)
+    return InMemoryJobStore()
+
+
+# MARK: - キューとワーカー
+
+class MealJobQueue:
+    """
+    ジョブキューとワーカープール
+    ワーカーは起動時（start）または最初の投入時に起動する（イベントループごと）
+    """
+
+    def __init__(self, store: JobStore, workers: int, max_queue: int, max_attempts: int, result_ttl_seconds: int):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.result_ttl_seconds = result_ttl_seconds
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._events: Dict[str, asyncio.Event] = {}
+        self._last_purge = 0.0
+
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._events = {}
+        self._worker_tasks = [
+            loop.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+
+    async def start(self):
+        """
+        ワーカーを起動し、前のプロセスで終わらなかったジョブを引き継ぐ（アプリ起動時に呼ぶ）
+        - 試行回数が残っていれば再投入
+        - 残っていなければ失敗（フォールバック結果）にする
+        """
+        self._ensure_workers()
+        requeued = 0
+        failed = 0
+        for job in await self.store.unfinished():
+            if job.id in self._events:
+                continue
+            if job.attempts < self.max_attempts and (job.image_data is not None or job.description):
+                job.status = JOB_QUEUED
+                job.updated_at = time.time()
+                await self.store.save(job)
+                self._events[job.id] = asyncio.Event()
+                self._queue.put_nowait(job.id)
+                requeued += 1
+            else:
+                job.error = job.error or "interrupted by restart"
+                self._fail(job)
+                await self._finish(job)
+                failed += 1
+        if requeued or failed:
+            logger.info(f"Meal jobs recovered: requeued={requeued} failed={failed}")
+
+    async def submit(self, description: Optional[str] = None, image_data: Optional[bytes] = None) -> MealJob:
+        """ジョブを登録してキューに入れる（キューが一杯なら QueueFullError）"""
+        self._ensure_workers()
+        if self._queue.qsize() >= self.max_queue:
+            raise QueueFullError("meal analysis queue is full")
+
+        await self._purge_expired()
+
+        now = time.time()
+        job = MealJob(
+            id=str(uuid.uuid4()),
+            description=description,
+            image_data=image_data,
+            created_at=now,
+            updated_at=now
+        )
+        await self.store.save(job)
+        self._events[job.id] = asyncio.Event()
+        self._queue.put_nowait(job.id)
+        self.submitted += 1
+        return job
+
+    async def get(self, job_id: str) -> Optional[MealJob]:
+        return await self.store.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[MealJob]:
+        """
+        完了まで最大 timeout 秒待つ（ロングポーリング・SSE用）
+        別プロセスが更新するストアでも気づけるよう、1秒ごとにストアも確認する
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job.finished or remaining <= 0:
+                return job
+
+            event = self._events.get(job_id)
+            if event is None:
+                await asyncio.sleep(min(remaining, 1.0))
+                continue
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Meal job worker {index} error: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await self.store.get(job_id)
+        if job is None or job.finished:
+            return
+
+        job.status = JOB_RUNNING
+        while True:
+            job.attempts += 1
+            job.updated_at = time.time()
+            await self.store.save(job)
+            try:
+                if job.image_data is not None:
+                    analysis = await GeminiService.analyze_meal_image_bytes_strict(job.image_data)
+                else:
+                    analysis = await GeminiService.analyze_meal_text_strict(job.description)
+                job.status = JOB_SUCCEEDED
+                job.result = analysis.model_dump()
+                job.error = None
+                self.succeeded += 1
+                break
+            except Exception as e:
+                job.error = str(e)
+                if job.attempts >= self.max_attempts or not should_retry_later(e):
+                    logger.error(f"Meal job {job.id} failed after {job.attempts} attempts: {e}")
+                    self._fail(job)
+                    break
+                self.retries += 1
+                delay = backoff_delay(job.attempts, settings.retry_backoff_base_seconds, settings.retry_backoff_max_seconds)
+                logger.warning(f"Meal job {job.id} retry {job.attempts} in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+        await self._finish(job)
+
+    def _fail(self, job: MealJob):
+        job.status = JOB_FAILED
+        job.result = self._fallback(job).model_dump()
+        self.failed += 1
+
+    async def _finish(self, job: MealJob):
+        # 結果が出たら入力画像は保持しない
+        job.image_data = None
+        job.updated_at = time.time()
+        await self.store.save(job)
+
+        event = self._events.pop(job.id, None)
+        if event is not None:
+            event.set()
+
+    @staticmethod
+    def _fallback(job: MealJob) -> DetailedMealAnalysis:
+        return GeminiService.fallback_meal_analysis(job.image_data is not None, job.description or "")
+
+    async def _purge_expired(self):
+        """保持期限を過ぎたジョブを削除（1分に1回まで。更新が止まったままの未完了ジョブも消す）"""
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        purged = await self.store.purge(now - self.result_ttl_seconds)
+        if purged:
+            logger.info(f"Meal jobs purged: {purged}")
+
+    def stats(self) -> dict:
+        return {
+            "store": type(self.store).__name__,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retries": self.retries
+        }
+
+
+meal_job_queue = MealJobQueue(
+    store=create_job_store(),
+    workers=settings.meal_job_workers,
+    max_queue=settings.meal_job_max_queue,
+    max_attempts=settings.meal_job_max_attempts,
+    result_ttl_seconds=settings.meal_job_result_ttl_seconds
+)
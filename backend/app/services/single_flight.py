@@ -0,0 +1,74 @@
+"""
+同一リクエストの多重実行を1回にまとめる（single-flight）
+ダブルタップや画面の再表示で同じAIリクエストが同時に届いた場合、
+先行する呼び出しの結果を後続の呼び出しでも共有する
+"""
+
+from collections import defaultdict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import hashlib
+import json
+
+
+def _fingerprint_default(value: Any) -> str:
+    # 画像などのバイナリはハッシュに置き換える
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(value).hexdigest()
+    return str(value)
+
+
+def request_fingerprint(name: str, args: tuple, kwargs: dict) -> str:
+    """呼び出し内容のフィンガープリント"""
+    payload = json.dumps([name, args, kwargs], sort_keys=True, default=_fingerprint_default, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    実行中の呼び出しをキーごとに共有する
+
+    - 先行呼び出しはタスクとして実行し、後続は同じタスクを待つ
+    - 呼び出し元がキャンセルされても共有タスクは継続（他の待機者に影響しない）
+    - 完了したキーはすぐに破棄（結果のキャッシュはしない）
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = defaultdict(int)
+        self.collapsed = defaultdict(int)
+
+    async def do(self, name: str, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.collapsed[name] += 1
+        else:
+            self.calls[name] += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    def coalesce(self, name: str):
+        """async関数用デコレーター: 引数が同一の同時呼び出しをまとめる"""
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                key = request_fingerprint(name, args, kwargs)
+                return await self.do(name, key, lambda: func(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def stats(self) -> dict:
+        """実行数とまとめられた数"""
+        return {
+            "in_flight": len(self._inflight),
+            "calls": dict(self.calls),
+            "collapsed": dict(self.collapsed),
+            "total_collapsed": sum(self.collapsed.values())
+        }
+
+
+ai_single_flight = SingleFlight()
@@ -0,0 +1,88 @@
+"""
+Server-Sent Events（text/event-stream）ヘルパー
+"""
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# プロキシでのバッファリングを無効化
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+
+def sse_event(event: str, data: dict) -> str:
+    """SSEのイベント1件を整形"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """SSEのストリーミングレスポンスを作成"""
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def chat_sse_events(
+    http_request: Request,
+    chunks: AsyncIterator[str],
+    mode: str,
+    error_message: str
+) -> AsyncIterator[str]:
+    """
+    チャットのテキストチャンクをSSEイベントに変換
+
+    - token: 生成されたテキスト片
+    - done: 完成したテキスト全体
+    - error: 生成失敗（途中まで送ったテキストは破棄してよい）
+    クライアント切断時は上流のストリームを閉じて終了する
+    """
+    parts = []
+    try:
+        async for text in chunks:
+            if await http_request.is_disconnected():
+                logger.info("Chat stream: client disconnected")
+                return
+            parts.append(text)
+            yield sse_event("token", {"text": text})
+
+        yield sse_event("done", {"response": "".join(parts).strip(), "mode": mode})
+
+    except Exception as e:
+        logger.error(f"Chat stream error: {e}")
+        yield sse_event("error", {"message": error_message})
+
+    finally:
+        await chunks.aclose()
+
+
+async def meal_analysis_sse_events(http_request: Request, events: AsyncIterator[tuple]) -> AsyncIterator[str]:
+    """
+    食事分析のストリーミング結果をSSEイベントに変換
+
+    - food_item: 完成した食品1件
+    - totals: 合計値
+    - character_comment: カロちゃんのコメント
+    - done: 最終結果（DetailedMealAnalysis）
+    - error: 失敗（analysis にフォールバック結果。途中までの food_item は破棄してよい）
+    """
+    try:
+        async for event, payload in events:
+            if await http_request.is_disconnected():
+                logger.info("Meal analysis stream: client disconnected")
+                return
+            if event == "food_item":
+                yield sse_event(event, payload.model_dump())
+            elif event == "character_comment":
+                yield sse_event(event, {"character_comment": payload})
+            elif event in ("done", "error"):
+                yield sse_event(event, {"analysis": payload.model_dump()})
+            else:
+                yield sse_event(event, payload)
+
+    finally:
+        await events.aclose()
@@ -0,0 +1,113 @@
+"""
+食事テキスト分析のメモ化
+表記ゆれ（全角/半角・空白・句読点・数量表記）を正規化したキーで分析結果を共有する
+"""
+
+from app.config import get_settings
+from app.services.cache import TTLCache
+import re
+import unicodedata
+
+settings = get_settings()
+
+# 漢数字（数量表記の正規化用。十・百・千は位取り）
+_KANJI_DIGITS = {
+    "一": 1, "二": 2, "三": 3, "四": 4, "五": 5,
+    "六": 6, "七": 7, "八": 8, "九": 9
+}
+_KANJI_UNITS = {"十": 10, "百": 100, "千": 1000}
+
+# 和語の数え方 → 個数
+_NATIVE_COUNTS = {
+    "ひとつ": 1, "ふたつ": 2, "みっつ": 3, "よっつ": 4, "いつつ": 5,
+    "一つ": 1, "二つ": 2, "三つ": 3, "四つ": 4, "五つ": 5
+}
+
+# 助数詞のひらがな表記 → 漢字表記
+_COUNTER_ALIASES = {
+    "こ": "個", "つ": "個", "ケ": "個", "ヶ": "個",
+    "はい": "杯", "ぱい": "杯", "ばい": "杯",
+    "ほん": "本", "ぽん": "本", "ぼん": "本",
+    "まい": "枚",
+    "にんまえ": "人前",
+    "きれ": "切れ",
+    "グラム": "g"
+}
+
+# 品目の区切り（並び順の違いを吸収するために分割）
+_SEPARATOR_PATTERN = re.compile(r"[、,，/／・\n]+")
+
+# 数値 + 助数詞
+_QUANTITY_PATTERN = re.compile(
+    r"([0-9]+(?:\.[0-9]+)?|[一二三四五六七八九十百千]+|半)\s*"
+    r"(" + "|".join(sorted(map(re.escape, _COUNTER_ALIASES), key=len, reverse=True)) + r"|個|杯|本|枚|人前|切れ|g|ml)"
+)
+
+
+def _kanji_to_number(token: str) -> int:
+    """漢数字を数値に（例: 十 → 10、二十 → 20、百二十五 → 125）"""
+    total = 0
+    digit = 0
+    for ch in token:
+        if ch in _KANJI_UNITS:
+            total += (digit or 1) * _KANJI_UNITS[ch]
+            digit = 0
+        else:
+            digit = _KANJI_DIGITS[ch]
+    return total + digit
+
+
+def _canonical_number(token: str) -> str:
+    if token == "半":
+        value = 0.5
+    elif token[0] in _KANJI_DIGITS or token[0] in _KANJI_UNITS:
+        value = _kanji_to_number(token)
+    else:
+        value = float(token)
+    return f"{value:g}"
+
+
+def _strip_punctuation(text: str) -> str:
+    """空白・句読点を除去（小数点は残す）"""
+    chars = []
+    for i, ch in enumerate(text):
+        if ch.isspace():
+            continue
+        if unicodedata.category(ch).startswith("P"):
+            is_decimal_point = (
+                ch == "." and 0 < i < len(text) - 1
+                and text[i - 1].isdigit() and text[i + 1].isdigit()
+            )
+            if not is_decimal_point:
+                continue
+        chars.append(ch)
+    return "".join(chars)
+
+
+def _normalize_item(item: str) -> str:
+    for word, count in _NATIVE_COUNTS.items():
+        item = item.replace(word, f"{count}個")
+
+    item = _QUANTITY_PATTERN.sub(
+        lambda m: _canonical_number(m.group(1)) + _COUNTER_ALIASES.get(m.group(2), m.group(2)),
+        item
+    )
+    return _strip_punctuation(item)
+
+
+def normalize_meal_text(description: str) -> str:
+    """
+    食事テキストをキャッシュキー用に正規化
+
+    例: 「おにぎり ２こ」「おにぎり2個」「おにぎり　二個。」→「おにぎり2個」
+    """
+    text = unicodedata.normalize("NFKC", description).lower()
+    items = [_normalize_item(item) for item in _SEPARATOR_PATTERN.split(text)]
+    return "|".join(sorted(item for item in items if item))
+
+
+# 正規化テキスト → 分析結果（dict）
+meal_text_cache = TTLCache(
+    max_entries=settings.text_cache_max_entries,
+    ttl_seconds=settings.text_cache_ttl_seconds
+)
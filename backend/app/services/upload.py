@@ -0,0 +1,91 @@
+"""
+画像アップロードの受け取り
+multipart/form-data（fileフィールド）または生のimage/*ボディを上限付きで読み込む
+（Base64入りJSONより転送量が約25%少なく、サーバー側で文字列を保持しない）
+"""
+
+from app.config import get_settings
+from fastapi import HTTPException, Request, status
+from starlette.formparsers import MultiPartException, MultiPartParser
+from typing import AsyncIterator
+
+settings = get_settings()
+
+# multipartから読み込む単位（境界・パートヘッダーの分として本文の上限にも足す）
+_CHUNK_SIZE = 64 * 1024
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"画像サイズが上限（{max_bytes // (1024 * 1024)}MB）を超えています"
+    )
+
+
+async def _limited_stream(request: Request, limit: int, max_bytes: int) -> AsyncIterator[bytes]:
+    """本文を読みながら数え、limit バイトを超えたら413（Content-Lengthのないchunked転送でも止まる）"""
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise _too_large(max_bytes)
+        yield chunk
+
+
+async def read_image_upload(request: Request) -> bytearray:
+    """
+    リクエストから画像バイトを取得（FastAPIのDependsで使用）
+
+    - Content-Lengthが上限を超えていれば本文を読む前に413
+    - multipart: 本文を数えながらパースし、上限を超えた時点で413（一時ファイルへのスプールも上限まで）
+    - image/*: ストリームを上限まで読む
+    - 読み込みは1つの bytearray に追記する（チャンクのリストと結合後の2重持ちをしない）
+    """
+    max_bytes = settings.max_upload_bytes
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + _CHUNK_SIZE:
+        raise _too_large(max_bytes)
+
+    content_type = request.headers.get("content-type", "")
+    data = bytearray()
+
+    if content_type.startswith("multipart/form-data"):
+        parser = MultiPartParser(
+            request.headers,
+            _limited_stream(request, max_bytes + _CHUNK_SIZE, max_bytes),
+            max_files=1
+        )
+        try:
+            form = await parser.parse()
+        except MultiPartException as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"multipart の形式が不正です: {e.message}")
+
+        upload = form.get("file")
+        try:
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="file フィールドが必要です")
+
+            while chunk := await upload.read(_CHUNK_SIZE):
+                if len(data) + len(chunk) > max_bytes:
+                    raise _too_large(max_bytes)
+                data.extend(chunk)
+        finally:
+            await form.close()
+
+    elif content_type.startswith("image/"):
+        async for chunk in request.stream():
+            if len(data) + len(chunk) > max_bytes:
+                raise _too_large(max_bytes)
+            data.extend(chunk)
+
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="multipart/form-data または image/* で送信してください"
+        )
+
+    if not data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="画像が空です")
+
+    return data
@@ -4,8 +4,10 @@ from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import Optional
 from datetime import date
+import asyncio
 import os
 from supabase import create_client, Client
+from app.services.fan_out import DeadlineExceededError, gather_with_deadline
 
 # 環境変数を読み込み
 load_dotenv()
@@ -221,51 +223,62 @@ async def get_weight(
 
 # ==================== サマリーAPI ====================
 
+# サマリーの締め切り（並行クエリ全体、秒）
+SUMMARY_DEADLINE_SECONDS = float(os.getenv("SUMMARY_DEADLINE_SECONDS", "5"))
+
 @app.get("/summary/daily")
 async def get_daily_summary(
     target_date: date,
     user_id: str = Depends(get_current_user)
 ):
-    """日別サマリーを取得"""
-    try:
-        # 食事データ取得
-        meals = supabase.table("meals")\
+    """日別サマリーを取得（食事・活動・体重を並行取得、体重が取れなくても残りで返す）"""
+    def fetch(table: str):
+        return supabase.table(table)\
             .select("*")\
             .eq("user_id", user_id)\
             .eq("date", str(target_date))\
             .execute()
-        
-        # 活動データ取得
-        activities = supabase.table("activities")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .eq("date", str(target_date))\
-            .execute()
-        
-        # 体重データ取得
-        weight = supabase.table("weight_logs")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .eq("date", str(target_date))\
-            .execute()
-        
-        # カロリー計算
-        total_calories_in = sum(meal["calories"] or 0 for meal in meals.data)
-        total_calories_burned = sum(act["calories_burned"] or 0 for act in activities.data)
-        total_steps = sum(act["steps"] or 0 for act in activities.data)
-        
-        return {
-            "date": str(target_date),
-            "calories_in": total_calories_in,
-            "calories_burned": total_calories_burned,
-            "net_calories": total_calories_in - total_calories_burned,
-            "total_steps": total_steps,
-            "weight_kg": weight.data[0]["weight_kg"] if weight.data else None,
-            "meals": meals.data,
-            "activities": activities.data
-        }
+    
+    async def fetch_data(table: str):
+        return (await asyncio.to_thread(fetch, table)).data
+    
+    # 食事・活動・体重データ取得（同期クライアントなのでスレッドで同時に実行）
+    # 締め切りで打ち切っても、スレッドで実行中のクエリ自体は止められず終わるまでスレッドプールを使う
+    try:
+        results, unavailable = await gather_with_deadline(
+            {
+                "meals": fetch_data("meals"),
+                "activities": fetch_data("activities"),
+                "weight": fetch_data("weight_logs"),
+            },
+            deadline=SUMMARY_DEADLINE_SECONDS,
+            optional=("weight",)  # 体重は任意（取れなければ weight_kg なし）
+        )
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    
+    meals = results["meals"]
+    activities = results["activities"]
+    weight = results.get("weight") or []
+    
+    # カロリー計算
+    total_calories_in = sum(meal["calories"] or 0 for meal in meals)
+    total_calories_burned = sum(act["calories_burned"] or 0 for act in activities)
+    total_steps = sum(act["steps"] or 0 for act in activities)
+    
+    return {
+        "date": str(target_date),
+        "calories_in": total_calories_in,
+        "calories_burned": total_calories_burned,
+        "net_calories": total_calories_in - total_calories_burned,
+        "total_steps": total_steps,
+        "weight_kg": weight[0]["weight_kg"] if weight else None,
+        "meals": meals,
+        "activities": activities,
+        "unavailable": unavailable
+    }
 
 # ==================== ニュースAPI ====================
 
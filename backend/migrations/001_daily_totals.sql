@@ -0,0 +1,48 @@
+-- 日別集計テーブル（daily_totals）
+-- app/services/daily_totals.py が食事・運動・体重の書き込みごとに更新する
+--
+-- 適用手順:
+--   1. このファイルと 002_daily_totals_functions.sql を Supabase のSQLエディタ（または psql）で実行
+--   2. DAILY_TOTALS_ENABLED=true でデプロイ（以降の書き込みが集計に反映される）
+--   3. 既存の記録から集計を作る: python -m app.services.daily_totals [日数]
+--      （何度実行しても同じ結果になる。集計がずれたときの修復にも使う）
+--      作り直した期間の始まりは daily_totals_coverage に記録し、それより前の日は元の記録から集計する
+--      （無効にしていた期間があれば、有効に戻したあと backfill し直す）
+
+create table if not exists daily_totals (
+    user_id uuid not null references profiles (id) on delete cascade,
+    date date not null,
+    calories_consumed integer not null default 0,
+    protein numeric not null default 0,
+    fat numeric not null default 0,
+    carbs numeric not null default 0,
+    sugar numeric not null default 0,
+    fiber numeric not null default 0,
+    sodium numeric not null default 0,
+    calories_burned integer not null default 0,
+    meal_count integer not null default 0,
+    exercise_count integer not null default 0,
+    last_weight numeric,
+    updated_at timestamptz not null default now(),
+    primary key (user_id, date)
+);
+
+-- 行レベルセキュリティ（anon key はアプリに入っているので、REST API から他人の集計を読み書きさせない）
+-- 書き込みはバックエンド（service_role、RLSを通らない）のみ。ユーザーは自分の行の読み取りだけ
+alter table daily_totals enable row level security;
+
+drop policy if exists "daily_totals_select_own" on daily_totals;
+create policy "daily_totals_select_own" on daily_totals
+    for select
+    to authenticated
+    using (user_id = auth.uid());
+
+-- ユーザーごとの backfill 済みの範囲（covered_from 以降の日は daily_totals に反映済み）
+create table if not exists daily_totals_coverage (
+    user_id uuid primary key references profiles (id) on delete cascade,
+    covered_from date not null,
+    updated_at timestamptz not null default now()
+);
+
+-- バックエンド（service_role）のみ読み書き
+alter table daily_totals_coverage enable row level security;
@@ -0,0 +1,86 @@
+-- 日別集計（daily_totals）の更新用ファンクション
+-- 増減分の足し込みを Postgres 側の1文で行い、複数プロセス・複数インスタンスから同時に書き込んでも増分を失わない
+-- 001_daily_totals.sql の後に実行
+
+-- その日の行に増減分を足し込む（行がなければ作る、負にはしない）
+create or replace function daily_totals_add(
+    p_user_id uuid,
+    p_date date,
+    p_calories_consumed integer default 0,
+    p_protein numeric default 0,
+    p_fat numeric default 0,
+    p_carbs numeric default 0,
+    p_sugar numeric default 0,
+    p_fiber numeric default 0,
+    p_sodium numeric default 0,
+    p_calories_burned integer default 0,
+    p_meal_count integer default 0,
+    p_exercise_count integer default 0
+) returns void
+language sql
+as $$
+    insert into daily_totals as t (
+        user_id, date,
+        calories_consumed, protein, fat, carbs, sugar, fiber, sodium,
+        calories_burned, meal_count, exercise_count, updated_at
+    ) values (
+        p_user_id, p_date,
+        greatest(p_calories_consumed, 0), greatest(p_protein, 0), greatest(p_fat, 0),
+        greatest(p_carbs, 0), greatest(p_sugar, 0), greatest(p_fiber, 0), greatest(p_sodium, 0),
+        greatest(p_calories_burned, 0), greatest(p_meal_count, 0), greatest(p_exercise_count, 0), now()
+    )
+    on conflict (user_id, date) do update set
+        calories_consumed = greatest(t.calories_consumed + p_calories_consumed, 0),
+        protein = greatest(t.protein + p_protein, 0),
+        fat = greatest(t.fat + p_fat, 0),
+        carbs = greatest(t.carbs + p_carbs, 0),
+        sugar = greatest(t.sugar + p_sugar, 0),
+        fiber = greatest(t.fiber + p_fiber, 0),
+        sodium = greatest(t.sodium + p_sodium, 0),
+        calories_burned = greatest(t.calories_burned + p_calories_burned, 0),
+        meal_count = greatest(t.meal_count + p_meal_count, 0),
+        exercise_count = greatest(t.exercise_count + p_exercise_count, 0),
+        updated_at = now();
+$$;
+
+-- その日の最後の体重記録を取り直す
+-- （同じユーザー・日付の呼び出しはアドバイザリロックで直列化し、ロック取得後の最新の記録を読む）
+create or replace function daily_totals_refresh_weight(
+    p_user_id uuid,
+    p_date date
+) returns void
+language plpgsql
+as $$
+begin
+    perform pg_advisory_xact_lock(hashtext('daily_totals:' || p_user_id::text || ':' || p_date::text));
+
+    insert into daily_totals as t (user_id, date, last_weight, updated_at)
+    values (
+        p_user_id,
+        p_date,
+        (
+            select weight_kg from weight_logs
+            where user_id = p_user_id
+              and logged_at >= p_date
+              and logged_at < p_date + 1
+            order by logged_at desc
+            limit 1
+        ),
+        now()
+    )
+    on conflict (user_id, date) do update set
+        last_weight = excluded.last_weight,
+        updated_at = now();
+end;
+$$;
+
+-- 任意の p_user_id を受け取るので、REST API（/rest/v1/rpc/...）からは呼ばせずバックエンド（service_role）のみ
+revoke execute on function daily_totals_add(
+    uuid, date, integer, numeric, numeric, numeric, numeric, numeric, numeric, integer, integer, integer
+) from public, anon, authenticated;
+grant execute on function daily_totals_add(
+    uuid, date, integer, numeric, numeric, numeric, numeric, numeric, numeric, integer, integer, integer
+) to service_role;
+
+revoke execute on function daily_totals_refresh_weight(uuid, date) from public, anon, authenticated;
+grant execute on function daily_totals_refresh_weight(uuid, date) to service_role;